@@ -0,0 +1,184 @@
+#!/usr/bin/python
+
+"""
+Time the backend against recorded Google Voice responses
+
+Usage:
+	bench_backend.py record FIXTURES USERNAME PASSWORD
+	bench_backend.py run FIXTURES [--server URL] [--repeat N] [--baseline FILE] [--save-baseline FILE]
+
+"record" logs in for real and saves scrubbed copies of everything a login
+and a poll cycle download into FIXTURES, with numbers, names and message
+text pseudonymized.  Scrubbing is best effort, so the recording still
+contains personal data: keep it local and don't commit it.  "run" replays
+them, in process or through fake_gv_server.py with --server, and reports
+the median time of each stage.  With --baseline, stages more than
+--tolerance slower than the baseline are reported as regressions and the
+exit status is 1.
+
+The poll cycle is what the Session's state machines do on a refresh: update
+the addressbook, the texts and the voicemails, parse and merge included.
+"""
+
+from __future__ import with_statement
+
+import sys
+sys.path.insert(0,"../src")
+import time
+import optparse
+import logging
+
+import gvoice.backend as backend
+import gvoice.addressbook as addressbook
+import gvoice.conversations as conversations
+import gvoice.request_scheduler as request_scheduler
+import gvoice.transport as transport
+
+
+STAGES = ("login", "get_texts", "get_voicemails", "get_contacts", "poll_cycle")
+
+
+def create_backend(gvTransport):
+	# Nothing to be polite to, so don't let the throttling skew the timings
+	scheduler = request_scheduler.RequestScheduler(rate=1e9, burst=1e9, maxJitter=0)
+	return backend.GVoiceBackend(requestScheduler=scheduler, transport=gvTransport)
+
+
+def drive(linearFunc):
+	"""
+	Runs what AsyncLinearExecution would run, on this thread
+	"""
+	steps = linearFunc()
+	try:
+		func, args, kwds = steps.next()
+		while True:
+			func, args, kwds = steps.send(func(*args, **kwds))
+	except StopIteration:
+		pass
+
+
+def poll_cycle(b):
+	book = addressbook.Addressbook(b, None)
+	texts = conversations.Conversations(b.get_texts, None)
+	voicemails = conversations.Conversations(b.get_voicemails, None)
+	drive(book._update)
+	drive(texts._update)
+	drive(voicemails._update)
+
+
+def record(fixturePath, username, password):
+	store = transport.FixtureStore(fixturePath)
+	scrubber = transport.Scrubber([username, password], pseudonymize=True)
+	b = create_backend(transport.RecordingTransport(store, scrubber))
+	print "Logging in"
+	if not b.login(username, password):
+		print "Login failed"
+		return 1
+	print "Recording a poll cycle"
+	list(b.get_texts())
+	list(b.get_voicemails())
+	list(b.get_contacts())
+	poll_cycle(b)
+	print "Recorded %d responses into %s" % (len(store), fixturePath)
+	return 0
+
+
+def time_stages(createTransport, repeat):
+	"""
+	@returns {stage: [seconds]}
+	"""
+	timings = dict((stage, []) for stage in STAGES)
+	for i in xrange(repeat):
+		b = create_backend(createTransport())
+
+		start = time.time()
+		isLoggedIn = b.login("someone@gmail.com", "password")
+		timings["login"].append(time.time() - start)
+		assert isLoggedIn, "Login isn't in the recording"
+
+		for stage in ("get_texts", "get_voicemails", "get_contacts"):
+			start = time.time()
+			list(getattr(b, stage)())
+			timings[stage].append(time.time() - start)
+
+		start = time.time()
+		poll_cycle(b)
+		timings["poll_cycle"].append(time.time() - start)
+	return timings
+
+
+def median(values):
+	values = sorted(values)
+	return values[len(values) // 2]
+
+
+def load_baseline(path):
+	baseline = {}
+	with open(path) as f:
+		for line in f:
+			if line.strip():
+				stage, seconds = line.split("\t")
+				baseline[stage] = float(seconds)
+	return baseline
+
+
+def save_baseline(path, medians):
+	with open(path, "w") as f:
+		for stage in STAGES:
+			f.write("%s\t%r\n" % (stage, medians[stage]))
+
+
+def run(fixturePath, options):
+	if options.server:
+		createTransport = lambda: transport.RedirectTransport(options.server)
+	else:
+		store = transport.FixtureStore(fixturePath)
+		createTransport = lambda: transport.ReplayTransport(store)
+
+	timings = time_stages(createTransport, options.repeat)
+	medians = dict((stage, median(seconds)) for (stage, seconds) in timings.iteritems())
+
+	baseline = load_baseline(options.baseline) if options.baseline else {}
+	regressions = []
+	for stage in STAGES:
+		line = "%-16s median %8.2fms  min %8.2fms" % (
+			stage, 1000 * medians[stage], 1000 * min(timings[stage]),
+		)
+		if stage in baseline:
+			change = medians[stage] / baseline[stage] - 1 if baseline[stage] else 0.0
+			line += "  baseline %8.2fms (%+.0f%%)" % (1000 * baseline[stage], 100 * change)
+			if options.tolerance < change:
+				line += "  REGRESSION"
+				regressions.append(stage)
+		print line
+
+	if options.saveBaseline:
+		save_baseline(options.saveBaseline, medians)
+		print "Saved the baseline to %s" % (options.saveBaseline, )
+	return 1 if regressions else 0
+
+
+def main():
+	logging.basicConfig(level=logging.WARNING)
+
+	parser = optparse.OptionParser(
+		usage="%prog record FIXTURES USERNAME PASSWORD\n       %prog run FIXTURES [options]"
+	)
+	parser.add_option("--server", dest="server", default="", help="Base URL of fake_gv_server.py to replay through")
+	parser.add_option("--repeat", dest="repeat", type="int", default=20)
+	parser.add_option("--baseline", dest="baseline", default="")
+	parser.add_option("--save-baseline", dest="saveBaseline", default="")
+	parser.add_option("--tolerance", dest="tolerance", type="float", default=0.25, help="Slowdown reported as a regression")
+	options, args = parser.parse_args()
+
+	if len(args) == 4 and args[0] == "record":
+		return record(*args[1:])
+	elif len(args) == 2 and args[0] == "run":
+		return run(args[1], options)
+	else:
+		parser.print_usage()
+		return 2
+
+
+if __name__ == "__main__":
+	sys.exit(main())
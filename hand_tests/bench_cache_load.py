@@ -0,0 +1,81 @@
+#!/usr/bin/python
+
+"""
+Time loading a texts cache and the first access of one number
+
+Usage: bench_cache_load.py [NUMBERS ...]
+
+Each load is done in a fresh process so the RSS is only the load's.
+"""
+
+from __future__ import with_statement
+
+import sys
+sys.path.insert(0,"../src")
+import os
+import time
+import shutil
+import tempfile
+import subprocess
+import logging
+
+import gvoice.conversations as conversations
+
+import bench_merge
+
+
+def generate_cache(path, numberCount, messagesPerNumber):
+	convs = conversations.Conversations(bench_merge.build_history, None)
+	for number in xrange(numberCount):
+		merged = bench_merge.build_history(messagesPerNumber, 10)
+		convs._conversations["+1555%07d" % number] = merged
+	convs.save(path)
+
+
+def get_rss():
+	# ru_maxrss isn't usable as it carries over the parent's across exec
+	with open("/proc/self/status") as f:
+		for line in f:
+			if line.startswith("VmRSS:"):
+				return int(line.split()[1])
+	return -1
+
+
+def measure_load(path):
+	convs = conversations.Conversations(bench_merge.build_history, None)
+	start = time.time()
+	convs.load(path)
+	loadTime = time.time() - start
+
+	start = time.time()
+	key = iter(convs.get_conversations()).next()
+	messageCount = sum(len(conv.messages) for conv in convs.get_conversation(key).conversations)
+	accessTime = time.time() - start
+
+	print "load %7.3fs  first access %7.4fs (%d messages)  rss %6dKB" % (
+		loadTime, accessTime, messageCount, get_rss(),
+	)
+
+
+def main():
+	logging.basicConfig(level=logging.WARNING)
+
+	if sys.argv[1:2] == ["load"]:
+		measure_load(sys.argv[2])
+		return
+
+	numberCounts = [int(arg) for arg in sys.argv[1:]] or [10, 100, 1000]
+	tempDir = tempfile.mkdtemp()
+	try:
+		for numberCount in numberCounts:
+			path = os.path.join(tempDir, "texts-%d.cache" % numberCount)
+			generate_cache(path, numberCount, 100)
+			sys.stdout.write("%5d numbers %7dKB: " % (numberCount, os.path.getsize(path) // 1024))
+			sys.stdout.flush()
+			subprocess.call([sys.executable, __file__, "load", path])
+	finally:
+		shutil.rmtree(tempDir)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+
+"""
+Per-message memory and pickle size of the message records
+
+"before" are dict backed copies of the records as they were before they
+got __slots__.
+"""
+
+from __future__ import with_statement
+
+import sys
+sys.path.insert(0,"../src")
+import gc
+import logging
+
+try:
+	import cPickle
+	pickle = cPickle
+except ImportError:
+	import pickle
+
+import gvoice.backend as backend
+
+
+class DictMessageText(object):
+
+	def __init__(self):
+		self.accuracy = None
+		self.text = None
+
+
+class DictMessage(object):
+
+	def __init__(self):
+		self.whoFrom = None
+		self.body = None
+		self.when = None
+
+
+def get_rss():
+	with open("/proc/self/status") as f:
+		for line in f:
+			if line.startswith("VmRSS:"):
+				return int(line.split()[1]) * 1024
+	return -1
+
+
+def make_messages(count, messageClass, textClass):
+	# Shared strings so only the record overhead is measured
+	whoFrom = "Contact:"
+	when = "3:04 PM"
+	text = "Hello"
+	messages = []
+	for i in xrange(count):
+		messageText = textClass()
+		messageText.accuracy = backend.MessageText.ACCURACY_HIGH
+		messageText.text = text
+		message = messageClass()
+		message.whoFrom = whoFrom
+		message.when = when
+		message.body = [messageText]
+		messages.append(message)
+	return messages
+
+
+def measure(name, count, messageClass, textClass):
+	gc.collect()
+	before = get_rss()
+	messages = make_messages(count, messageClass, textClass)
+	gc.collect()
+	after = get_rss()
+	pickled = pickle.dumps(messages[:1000], pickle.HIGHEST_PROTOCOL)
+	print "%-8s %7d messages  %6.1f bytes/message in memory  %6.1f bytes/message pickled" % (
+		name, count, float(after - before) / count, len(pickled) / 1000.0,
+	)
+	del messages
+
+
+def main():
+	logging.basicConfig(level=logging.WARNING)
+	count = 200000
+	measure("before", count, DictMessage, DictMessageText)
+	measure("after", count, backend.Message, backend.MessageText)
+
+
+if __name__ == "__main__":
+	main()
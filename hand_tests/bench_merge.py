@@ -0,0 +1,78 @@
+#!/usr/bin/python
+
+"""
+Time MergedConversations.append_conversation as a thread's history grows
+
+Each poll GV hands back the recent part of a thread, so every append is the
+last few already known messages plus one new one.  The time per append
+should stay flat no matter how much history has been merged before it.
+"""
+
+import sys
+sys.path.insert(0,"../src")
+import time
+import datetime
+import logging
+
+import gvoice.backend as backend
+import gvoice.conversations as conversations
+
+
+def make_message(index):
+	message = backend.Message()
+	message.whoFrom = "Me:" if index % 2 else "Contact:"
+	message.when = "%d:%02d PM" % (index // 60 % 12 + 1, index % 60)
+	messageText = backend.MessageText()
+	messageText.accuracy = backend.MessageText.ACCURACY_HIGH
+	messageText.text = "Message number %d" % index
+	message.body = [messageText]
+	return message
+
+
+def make_conversation(convId, index, messages):
+	conversation = backend.Conversation()
+	conversation.type = conversation.TYPE_SMS
+	conversation.id = convId
+	conversation.number = "+15555550100"
+	conversation.time = datetime.datetime(2010, 1, 1) + datetime.timedelta(minutes=index)
+	conversation.isRead = True
+	conversation.isSpam = False
+	conversation.isTrash = False
+	conversation.isArchived = False
+	conversation.messages = messages
+	return conversation
+
+
+def build_history(messageCount, windowSize):
+	merged = conversations.MergedConversations()
+	for index in xrange(messageCount):
+		window = [make_message(i) for i in xrange(max(0, index - windowSize + 1), index + 1)]
+		merged.append_conversation(make_conversation("thread", index, window), True)
+	return merged
+
+
+def time_appends(merged, start, appendCount, windowSize):
+	start_time = time.time()
+	for index in xrange(start, start + appendCount):
+		window = [make_message(i) for i in xrange(index - windowSize + 1, index + 1)]
+		merged.append_conversation(make_conversation("thread", index, window), False)
+	return (time.time() - start_time) / appendCount
+
+
+def main():
+	logging.basicConfig(level=logging.WARNING)
+	windowSize = 10
+	appendCount = 100
+
+	for historySize in (100, 1000, 10000, 30000):
+		start_time = time.time()
+		merged = build_history(historySize, windowSize)
+		buildTime = time.time() - start_time
+		perAppend = time_appends(merged, historySize, appendCount, windowSize)
+		print "%6d messages  build %7.3fs  append %8.1fus" % (
+			historySize, buildTime, perAppend * 1e6,
+		)
+
+
+if __name__ == "__main__":
+	main()
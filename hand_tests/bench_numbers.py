@@ -0,0 +1,88 @@
+#!/usr/bin/python
+
+"""
+Profile the number normalizing hot path with and without the number caches
+
+Every pass does what a roster refresh plus the resulting contact attribute
+requests do per number: normalize it (handles, addressbook, conversations),
+validate it and pretty it for the alias.  Once the numbers have been seen,
+the share of time spent in re.sub should go to nothing.
+"""
+
+import sys
+sys.path.insert(0,"../src")
+import time
+import cProfile
+import pstats
+import logging
+
+import util.misc as misc_utils
+
+
+def generate_numbers(count):
+	return [
+		"(%03d) 555-%04d" % (200 + index // 10000, index % 10000)
+		for index in xrange(count)
+	]
+
+
+def number_pass(numbers):
+	for number in numbers:
+		normalized = misc_utils.normalize_number(number)
+		misc_utils.is_valid_number(normalized)
+		misc_utils.make_pretty(normalized)
+
+
+def profile_passes(numbers, passCount):
+	# Warm up, a refresh sees the same numbers as the last one
+	number_pass(numbers)
+
+	profiler = cProfile.Profile()
+	start = time.time()
+	profiler.enable()
+	for i in xrange(passCount):
+		number_pass(numbers)
+	profiler.disable()
+	duration = time.time() - start
+
+	stats = pstats.Stats(profiler)
+	regexTime = sum(
+		totalTime
+		for (filename, line, funcName), (primitiveCalls, calls, totalTime, cumulativeTime, callers) in stats.stats.iteritems()
+		if funcName in ("sub", "<method 'sub' of '_sre.SRE_Pattern' objects>")
+	)
+	return duration, regexTime
+
+
+def main():
+	logging.basicConfig(level=logging.WARNING)
+
+	passCount = 10
+	for count in (100, 1000, 4000):
+		numbers = generate_numbers(count)
+
+		cached = misc_utils.normalize_number, misc_utils.is_valid_number, misc_utils.make_pretty
+		misc_utils.normalize_number = misc_utils._normalize_number
+		misc_utils.is_valid_number = misc_utils._is_valid_number
+		misc_utils.make_pretty = misc_utils._make_pretty
+		try:
+			uncachedTime, uncachedRegexTime = profile_passes(numbers, passCount)
+		finally:
+			misc_utils.normalize_number, misc_utils.is_valid_number, misc_utils.make_pretty = cached
+
+		for cache in cached:
+			cache.clear()
+		cachedTime, cachedRegexTime = profile_passes(numbers, passCount)
+
+		print "%5d numbers x %d passes  uncached: %7.4fs (%4.1f%% in re.sub)  cached: %7.4fs (%4.1f%% in re.sub)" % (
+			count,
+			passCount,
+			uncachedTime,
+			100 * uncachedRegexTime / uncachedTime,
+			cachedTime,
+			100 * cachedRegexTime / cachedTime,
+		)
+
+
+if __name__ == "__main__":
+	main()
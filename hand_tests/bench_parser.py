@@ -0,0 +1,206 @@
+#!/usr/bin/python
+
+"""
+Compare the regex and streaming feed parsers
+
+Usage: bench_parser.py [--fixtures FIXTURES] [RECORDED_HTML ...]
+
+Without arguments, synthetic pages of 10, 100 and 1000 conversations and the
+pages in feeds/ are used.  The pages in feeds/ follow the layout of the
+live feeds, nested divs and line breaks included, with made up contents.
+Recorded pages are the HTML half of an inbox feed (see FeedPayload.html),
+with "voicemail" in the filename for voicemail pages.  --fixtures compares
+the feeds in a recording from "bench_backend.py record".
+
+The exit status is 1 if the parsers disagree on any page.
+"""
+
+from __future__ import with_statement
+
+import os
+import sys
+sys.path.insert(0,"../src")
+import time
+import optparse
+import logging
+
+import gvoice.backend as backend
+import gvoice.transport as transport
+
+
+FEEDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "feeds")
+
+
+_SMS_TEMPLATE = """
+<div id="%(id)s" class="goog-flat-button gc-message gc-message-read">
+<div class="gc-message-tbl">
+<a class="gc-under gc-message-name-link" href="javascript://">Contact &amp; %(index)d</a>
+<span class="gc-nobold">%(index)d</span>
+<span class="gc-message-type">(555) 555-%(index)04d - mobile</span>
+<input type="hidden" class="gc-text gc-quickcall-ac" value="+1555555%(index)04d"/>
+<span class="gc-message-time">10/18/10 3:%(minute)02d PM</span>
+<span class="gc-message-relative">%(index)d minutes ago</span>
+%(rows)s
+</div>
+</div>"""
+
+_SMS_ROW_TEMPLATE = """<div class="gc-message-sms-row">
+<span class="gc-message-sms-from">%s</span>
+<span class="gc-message-sms-text">Message number %d, isn&#39;t it?</span>
+<span class="gc-message-sms-time">3:%02d PM</span>
+</div>"""
+
+_VOICEMAIL_TEMPLATE = """
+<div id="%(id)s" class="goog-flat-button gc-message gc-message-unread">
+<div class="gc-message-tbl">
+<a class="gc-under gc-message-name-link" href="javascript://">Contact &amp; %(index)d</a>
+<span class="gc-nobold">%(index)d</span>
+<span class="gc-message-type">(555) 555-%(index)04d - mobile</span>
+<span class="gc-message-location"><a href="javascript://">Provo, UT</a></span>
+<input type="hidden" class="gc-text gc-quickcall-ac" value="+1555555%(index)04d"/>
+<span class="gc-message-time">10/18/10 3:%(minute)02d PM</span>
+<span class="gc-message-relative">%(index)d minutes ago</span>
+<div class="gc-message-message-display">
+%(words)s
+<a href="javascript://" class="gc-message-mni">555-1234</a>
+</div>
+</div>
+</div>"""
+
+_WORD_TEMPLATE = """<span id="%d-%d" class="gc-word-%s">word%d</span>"""
+
+
+def generate_sms_page(conversationCount, messagesPerConversation = 5):
+	return "".join(
+		_SMS_TEMPLATE % {
+			"id": "sms%d" % index,
+			"index": index,
+			"minute": index % 60,
+			"rows": "\n".join(
+				_SMS_ROW_TEMPLATE % ("Me:" if row % 2 else "Contact:", row, row % 60)
+				for row in xrange(messagesPerConversation)
+			),
+		}
+		for index in xrange(conversationCount)
+	)
+
+
+def generate_voicemail_page(conversationCount, wordsPerVoicemail = 30):
+	accuracies = ("high", "med1", "med2")
+	return "".join(
+		_VOICEMAIL_TEMPLATE % {
+			"id": "vm%d" % index,
+			"index": index,
+			"minute": index % 60,
+			"words": " ".join(
+				_WORD_TEMPLATE % (index, word, accuracies[word % 3], word)
+				for word in xrange(wordsPerVoicemail)
+			),
+		}
+		for index in xrange(conversationCount)
+	)
+
+
+def time_it(func, repeat = 5):
+	best = None
+	for i in xrange(repeat):
+		start = time.time()
+		results = func()
+		duration = time.time() - start
+		if best is None or duration < best:
+			best = duration
+	return best, results
+
+
+def compare(name, html, isVoicemail):
+	regexBackend = backend.GVoiceBackend(parser=backend.GVoiceBackend.PARSER_REGEX)
+	streamingBackend = backend.GVoiceBackend(parser=backend.GVoiceBackend.PARSER_STREAMING)
+	if isVoicemail:
+		feedType = regexBackend._FEED_VOICEMAIL
+		regexParse, streamingParse = regexBackend._parse_voicemail, streamingBackend._parse_voicemail
+	else:
+		feedType = regexBackend._FEED_SMS
+		regexParse, streamingParse = regexBackend._parse_sms, streamingBackend._parse_sms
+
+	# Just pulling the fields out of the page, where the parsers differ
+	regexExtractTime, regexFields = time_it(
+		lambda: list(regexBackend._extract_messages(html, feedType))
+	)
+	streamingExtractTime, streamingFields = time_it(
+		lambda: list(streamingBackend._extract_messages(html, feedType))
+	)
+	# Including building the Conversation objects
+	regexParseTime, regexResults = time_it(
+		lambda: [conv.to_dict() for conv in regexParse(html)]
+	)
+	streamingParseTime, streamingResults = time_it(
+		lambda: [conv.to_dict() for conv in streamingParse(html)]
+	)
+
+	isSame = regexFields == streamingFields and regexResults == streamingResults
+	print "%-24s %5d convs  extract: regex %7.4fs streaming %7.4fs (%.2fx)  full: regex %7.4fs streaming %7.4fs %s" % (
+		name,
+		len(regexResults),
+		regexExtractTime,
+		streamingExtractTime,
+		regexExtractTime / streamingExtractTime if streamingExtractTime else 0,
+		regexParseTime,
+		streamingParseTime,
+		"" if isSame else "MISMATCH",
+	)
+	return isSame
+
+
+def load_page(path, name = None):
+	with open(path) as f:
+		html = f.read()
+	return name if name is not None else path, html, "voicemail" in os.path.basename(path)
+
+
+def load_recorded_feeds(fixturePath):
+	"""
+	@returns [(name, html, isVoicemail)] of the feeds in a recording
+	"""
+	store = transport.FixtureStore(fixturePath)
+	b = backend.GVoiceBackend()
+	feeds = []
+	for name, url, isVoicemail in (
+		("sms", b._XML_SMS_URL, False),
+		("voicemail", b._XML_VOICEMAIL_URL, True),
+	):
+		page = store.get("GET %s" % (url, ), 0)
+		if page is None:
+			print "No %s feed in %s" % (name, fixturePath)
+			continue
+		feeds.append((os.path.join(fixturePath, name), backend.FeedPayload(page).html, isVoicemail))
+	return feeds
+
+
+def main():
+	logging.basicConfig(level=logging.WARNING)
+
+	parser = optparse.OptionParser(usage="%prog [options] [RECORDED_HTML ...]")
+	parser.add_option("--fixtures", dest="fixtures", default="", help="Recording from bench_backend.py to compare the feeds of")
+	options, args = parser.parse_args()
+
+	pages = [load_page(path) for path in args]
+	if options.fixtures:
+		pages.extend(load_recorded_feeds(options.fixtures))
+	if not pages:
+		for size in (10, 100, 1000):
+			pages.append(("sms-%d" % size, generate_sms_page(size), False))
+			pages.append(("voicemail-%d" % size, generate_voicemail_page(size), True))
+		pages.extend(
+			load_page(os.path.join(FEEDS_PATH, filename), "feeds/%s" % (filename, ))
+			for filename in sorted(os.listdir(FEEDS_PATH))
+		)
+
+	isSame = True
+	for name, html, isVoicemail in pages:
+		if not compare(name, html, isVoicemail):
+			isSame = False
+	return 0 if isSame else 1
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,152 @@
+#!/usr/bin/python
+
+"""
+Replay text arrival times against the texts polling strategies
+
+Usage: bench_polling.py [ARRIVALS_FILE]
+
+ARRIVALS_FILE has one arrival time (seconds since the epoch) per line.
+Without it, four weeks of synthetic conversations are used, busy in the
+evenings and quiet at night.  Only the second half of the trace is scored so
+the adaptive strategy is compared after it has had time to learn.
+"""
+
+from __future__ import with_statement
+
+import sys
+sys.path.insert(0,"../src")
+import random
+import logging
+
+import gvoice.state_machine as state_machine
+
+
+# Conversations started per hour, by hour of the day
+_HOURLY_CONVERSATIONS = [
+	0.05, 0.02, 0.02, 0.02, 0.02, 0.05, 0.2, 0.5,
+	0.8, 0.6, 0.5, 0.5, 1.0, 0.6, 0.5, 0.5,
+	0.6, 1.0, 1.5, 2.0, 2.0, 1.5, 0.8, 0.2,
+]
+
+
+def generate_arrivals(days, seed = 42):
+	rng = random.Random(seed)
+	start = 1287000000 - 1287000000 % (24 * 3600)
+	arrivals = []
+	for hour in xrange(days * 24):
+		hourStart = start + hour * 3600
+		conversationCount = 0
+		expected = _HOURLY_CONVERSATIONS[hour % 24]
+		while rng.random() < expected / (1.0 + expected):
+			conversationCount += 1
+		for i in xrange(conversationCount):
+			when = hourStart + rng.uniform(0, 3600)
+			for message in xrange(rng.randint(1, 6)):
+				arrivals.append(when)
+				when += rng.expovariate(1 / 90.0)
+	arrivals.sort()
+	return arrivals
+
+
+def load_arrivals(path):
+	with open(path) as f:
+		return sorted(float(line) for line in f if line.strip())
+
+
+def simulate(strategy, estimator, clock, arrivals, scoreFrom):
+	"""
+	Steps the strategy like UpdateStateMachine does, on a fake clock
+
+	@returns (requests, latencies) after scoreFrom
+	"""
+	clock[0] = arrivals[0]
+	end = arrivals[-1]
+	if estimator is not None:
+		estimator.start_observing()
+	strategy.initialize_state()
+	strategy.increment_state()
+
+	nextArrival = 0
+	requests = 0
+	latencies = []
+	while clock[0] < end:
+		clock[0] += strategy.timeout
+		isScored = scoreFrom <= clock[0]
+		if isScored:
+			requests += 1
+
+		foundCount = 0
+		while nextArrival < len(arrivals) and arrivals[nextArrival] <= clock[0]:
+			if isScored:
+				latencies.append(clock[0] - arrivals[nextArrival])
+			nextArrival += 1
+			foundCount += 1
+
+		if foundCount:
+			if estimator is not None:
+				estimator.record_arrival()
+			strategy.reinitialize_state()
+		strategy.increment_state()
+	return requests, latencies
+
+
+def report(name, requests, latencies, days):
+	latencies.sort()
+	print "%-58s %7.1f requests/day  latency mean %6.1fs  p95 %6.1fs  max %6.1fs" % (
+		name,
+		requests / days,
+		sum(latencies) / len(latencies),
+		latencies[int(len(latencies) * 0.95)],
+		latencies[-1],
+	)
+
+
+def main():
+	logging.basicConfig(level=logging.WARNING)
+
+	args = sys.argv[1:]
+	if args:
+		arrivals = load_arrivals(args[0])
+	else:
+		arrivals = generate_arrivals(28)
+	scoreFrom = (arrivals[0] + arrivals[-1]) / 2
+	scoredDays = (arrivals[-1] - scoreFrom) / (24 * 3600)
+	print "%d arrivals over %.1f days, scoring the last %.1f" % (
+		len(arrivals), (arrivals[-1] - arrivals[0]) / (24 * 3600), scoredDays,
+	)
+
+	textsPeriod = state_machine.to_seconds(minutes=10)
+	clock = [0.0]
+
+	strategy = state_machine.ConstantStateStrategy(textsPeriod)
+	requests, latencies = simulate(strategy, None, clock, arrivals, scoreFrom)
+	report(repr(strategy), requests, latencies, scoredDays)
+
+	# What Session used before
+	strategy = state_machine.GeometricStateStrategy(
+		state_machine.to_seconds(seconds=20),
+		state_machine.to_seconds(seconds=1),
+		textsPeriod,
+	)
+	requests, latencies = simulate(strategy, None, clock, arrivals, scoreFrom)
+	report(repr(strategy), requests, latencies, scoredDays)
+
+	for targetLatency in (30, 60, 120):
+		estimator = state_machine.ArrivalRateEstimator(
+			halfLife = state_machine.to_seconds(hours=7*24),
+			priorRate = 1.0 / state_machine.to_seconds(hours=1),
+			priorExposure = state_machine.to_seconds(hours=1),
+			timeSource = lambda: clock[0],
+		)
+		strategy = state_machine.AdaptiveStateStrategy(
+			estimator,
+			targetLatency,
+			state_machine.to_seconds(seconds=20),
+			textsPeriod,
+		)
+		requests, latencies = simulate(strategy, estimator, clock, arrivals, scoreFrom)
+		report(repr(strategy), requests, latencies, scoredDays)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,197 @@
+#!/usr/bin/python
+
+"""
+Time and memory of each stage of a refresh as the account grows
+
+Usage: bench_scaling.py [--contacts 100,1000,10000] [--messages 1000,10000,100000] [--csv FILE]
+
+The addressbook stages are run for each number of contacts and the
+conversation stages for each number of text messages (ten to a thread on
+average), with payloads from gv_generator.py.  Memory is the growth in RSS
+over the stage with its results kept alive.  --csv writes the same numbers
+for plotting.
+
+The contact list stage needs telepathy-python and is skipped without it.
+"""
+
+from __future__ import with_statement
+
+import sys
+sys.path.insert(0,"../src")
+import gc
+import time
+import optparse
+import logging
+
+import gvoice.backend as backend
+import gvoice.addressbook as addressbook
+import gvoice.conversations as conversations
+import gvoice.request_scheduler as request_scheduler
+
+import bench_backend
+import gv_generator
+
+try:
+	import handle
+	import channel.contact_list as contact_list
+except ImportError:
+	contact_list = None
+
+
+MESSAGES_PER_THREAD = 10
+
+
+def get_rss():
+	with open("/proc/self/status") as f:
+		for line in f:
+			if line.startswith("VmRSS:"):
+				return int(line.split()[1]) * 1024
+	return -1
+
+
+class _FakeConnection(object):
+
+	username = "bench@gmail.com"
+
+	def __init__(self):
+		self._handles = {}
+		self._handleCount = 0
+
+	def get_handle_id(self):
+		self._handleCount += 1
+		return self._handleCount
+
+
+def create_contact_list():
+	"""
+	@returns A subscribe list channel without D-Bus behind it, counting the
+		members it signals
+	"""
+	connection = _FakeConnection()
+	channel = contact_list.AllContactsListChannel.__new__(contact_list.AllContactsListChannel)
+	channel._conn = connection
+	channel._AllContactsListChannel__members = set()
+	channel._AllContactsListChannel__listHandle = handle.create_handle(connection, "list", "subscribe")
+	channel.signalledCount = 0
+
+	def members_changed(message, added, removed, localPending, remotePending, actor, reason):
+		channel.signalledCount += len(added) + len(removed)
+	channel.MembersChanged = members_changed
+	return connection, channel
+
+
+class Stages(object):
+
+	def __init__(self):
+		self.results = []
+
+	def run(self, name, size, func):
+		"""
+		@returns What func returns, after recording how long it took and how
+			much memory its result holds onto
+		"""
+		gc.collect()
+		before = get_rss()
+		start = time.time()
+		result = func()
+		duration = time.time() - start
+		gc.collect()
+		memory = get_rss() - before
+		self.results.append((name, size, duration, memory))
+		print "%-24s %7d  %9.3fs  %8.2fus/item  %+8.1fMB" % (
+			name, size, duration, 1e6 * duration / size, memory / (1024.0 * 1024),
+		)
+		return result
+
+	def write_csv(self, path):
+		with open(path, "w") as f:
+			f.write("stage,size,seconds,bytes\n")
+			for name, size, duration, memory in self.results:
+				f.write("%s,%d,%f,%d\n" % (name, size, duration, memory))
+
+
+def create_backend():
+	scheduler = request_scheduler.RequestScheduler(rate=1e9, burst=1e9, maxJitter=0)
+	return backend.GVoiceBackend(requestScheduler=scheduler)
+
+
+def run_contacts(stages, contactCount):
+	generator = gv_generator.Generator(contactCount)
+	page = generator.generate_contacts_page()
+	b = create_backend()
+
+	contacts = stages.run("parse_contacts", contactCount, lambda: list(b._process_contacts(page)))
+	book = addressbook.Addressbook(b, None)
+	added, removed, changed = stages.run("addressbook_apply", contactCount, lambda: book._apply_contacts(contacts))
+
+	# A typical refresh, where a few contacts were edited
+	edited = list(contacts)
+	for index in xrange(0, len(edited), 100):
+		contactId, details = edited[index]
+		details = dict(details)
+		details["name"] = details["name"] + " Jr"
+		edited[index] = contactId, details
+	stages.run("addressbook_reapply", contactCount, lambda: book._apply_contacts(edited))
+
+	if contact_list is not None:
+		connection, channel = create_contact_list()
+		stages.run(
+			"contact_list_refresh", contactCount,
+			lambda: channel._process_refresh(book, added, set(), set()),
+		)
+
+
+def run_messages(stages, messageCount):
+	threadCount = max(1, messageCount // MESSAGES_PER_THREAD)
+	generator = gv_generator.Generator(threadCount // 2)
+	page = generator.generate_texts_page(threadCount, MESSAGES_PER_THREAD)
+	b = create_backend()
+
+	def parse():
+		payload = b._grab_payload(page)
+		return list(b._merge_conversation_sources(b._parse_sms(payload.html), payload.json))
+	parsed = stages.run("parse_texts", messageCount, parse)
+	# Appends have to be in order, as Conversations._update makes sure of
+	ordered = sorted(parsed)
+
+	def append_all():
+		merged = {}
+		for conversation in ordered:
+			merged.setdefault(conversation.number, conversations.MergedConversations()).append_conversation(
+				conversation, True
+			)
+		return merged
+	stages.run("append_conversation", messageCount, append_all)
+
+	texts = conversations.Conversations(lambda onlyIfChanged = False: parsed, None)
+	stages.run("conversations_update", messageCount, lambda: bench_backend.drive(texts._update))
+
+
+def parse_sizes(text):
+	return [int(size) for size in text.split(",") if size]
+
+
+def main():
+	logging.basicConfig(level=logging.WARNING)
+
+	parser = optparse.OptionParser(usage="%prog [options]")
+	parser.add_option("--contacts", dest="contacts", default="100,1000,10000")
+	parser.add_option("--messages", dest="messages", default="1000,10000,100000")
+	parser.add_option("--csv", dest="csv", default="")
+	options, args = parser.parse_args()
+
+	stages = Stages()
+	if contact_list is None:
+		print "No telepathy-python, skipping contact_list_refresh"
+	for contactCount in parse_sizes(options.contacts):
+		run_contacts(stages, contactCount)
+	for messageCount in parse_sizes(options.messages):
+		run_messages(stages, messageCount)
+
+	if options.csv:
+		stages.write_csv(options.csv)
+		print "Wrote %s" % (options.csv, )
+
+
+if __name__ == "__main__":
+	main()
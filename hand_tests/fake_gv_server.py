@@ -0,0 +1,83 @@
+#!/usr/bin/python
+
+"""
+Serve recorded Google Voice responses over HTTP
+
+Usage: fake_gv_server.py FIXTURES [PORT]
+
+FIXTURES is a directory recorded with "bench_backend.py record".  Point a
+backend at it by running with THEONERING_GV_SERVER=http://localhost:PORT/,
+which makes gvoice.transport.RedirectTransport send every request here.
+Requests that were never recorded get a 404.
+"""
+
+import sys
+sys.path.insert(0,"../src")
+import BaseHTTPServer
+import SocketServer
+import urllib2
+import logging
+
+import gvoice.transport as transport
+
+
+class _FixtureHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+	replay = None
+
+	def do_GET(self):
+		self._respond(None)
+
+	def do_POST(self):
+		length = int(self.headers.getheader("Content-Length", "0"))
+		self._respond(self.rfile.read(length))
+
+	def _respond(self, postdata):
+		try:
+			url = transport.from_server_path(self.path)
+			page = self.replay.fetch(None, url, postdata, {}, False)
+		except (ValueError, urllib2.URLError), e:
+			self.send_error(404, str(e))
+			return
+		self.send_response(200)
+		self.send_header("Content-Type", "text/html; charset=utf-8")
+		self.send_header("Content-Length", str(len(page)))
+		self.end_headers()
+		self.wfile.write(page)
+
+	def log_message(self, format, *args):
+		logging.debug(format % args)
+
+
+class _ThreadedServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+	daemon_threads = True
+
+
+def create_server(fixturePath, port):
+	"""
+	@returns A server, not yet serving, answering from fixturePath
+	"""
+	class FixtureHandler(_FixtureHandler):
+		replay = transport.ReplayTransport(transport.FixtureStore(fixturePath))
+
+	return _ThreadedServer(("localhost", port), FixtureHandler)
+
+
+def main():
+	logging.basicConfig(level=logging.WARNING)
+
+	args = sys.argv[1:]
+	fixturePath = args[0]
+	port = int(args[1]) if 1 < len(args) else 8643
+
+	server = create_server(fixturePath, port)
+	print "Serving %s on http://localhost:%d/" % (fixturePath, port)
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,135 @@
+#!/usr/bin/python
+
+"""
+Serve the long poll protocol gvoice.notifier.LongPollNotifier speaks
+
+Usage: fake_push_server.py [PORT]
+
+Holds each "/?cursor=N" request until the cursor moves past N or 20s go by,
+then answers with the current cursor.  The cursor moves every time a line is
+read from stdin, so press enter to simulate a new text.  Point the
+texts-push-url parameter at http://localhost:PORT/ or leave this running and
+watch the notifier in this process report the changes.
+"""
+
+from __future__ import with_statement
+
+import sys
+sys.path.insert(0,"../src")
+import cgi
+import urlparse
+import threading
+import BaseHTTPServer
+import SocketServer
+import logging
+
+import gobject
+
+import gvoice.notifier as notifier
+import util.coroutines as coroutines
+
+
+_HOLD_SECONDS = 20
+
+
+class _Cursor(object):
+
+	def __init__(self):
+		self._condition = threading.Condition()
+		self._value = 0
+
+	def bump(self):
+		with self._condition:
+			self._value += 1
+			self._condition.notifyAll()
+
+	def wait_past(self, cursor, timeout):
+		with self._condition:
+			if self._value == cursor:
+				self._condition.wait(timeout)
+			return self._value
+
+
+_cursor = _Cursor()
+
+
+class _LongPollHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+	def do_GET(self):
+		query = cgi.parse_qs(urlparse.urlsplit(self.path)[3])
+		try:
+			cursor = int(query.get("cursor", [""])[0])
+		except ValueError:
+			cursor = None
+		if cursor is None:
+			current = _cursor.wait_past(None, 0)
+		else:
+			current = _cursor.wait_past(cursor, _HOLD_SECONDS)
+		body = "%d\n" % current
+		self.send_response(200)
+		self.send_header("Content-Type", "text/plain")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass
+
+
+class _ThreadedServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+	daemon_threads = True
+
+
+def _on_change(notifier):
+	print "Change reported"
+
+
+def _on_availability(notifier, isAvailable):
+	print "Notifier available: %r" % (isAvailable, )
+
+
+def _read_stdin():
+	while True:
+		line = sys.stdin.readline()
+		if not line:
+			break
+		_cursor.bump()
+		print "Bumped the cursor"
+
+
+def main():
+	logging.basicConfig(level=logging.WARNING)
+	gobject.threads_init()
+
+	args = sys.argv[1:]
+	port = int(args[0]) if args else 8642
+
+	server = _ThreadedServer(("localhost", port), _LongPollHandler)
+	serverThread = threading.Thread(target=server.serve_forever)
+	serverThread.setDaemon(True)
+	serverThread.start()
+
+	stdinThread = threading.Thread(target=_read_stdin)
+	stdinThread.setDaemon(True)
+	stdinThread.start()
+
+	client = notifier.LongPollNotifier("http://localhost:%d/" % port)
+	client.changeSignalHandler.register_sink(
+		coroutines.func_sink(coroutines.expand_positional(_on_change))
+	)
+	client.availabilitySignalHandler.register_sink(
+		coroutines.func_sink(coroutines.expand_positional(_on_availability))
+	)
+	client.start()
+
+	print "Serving on port %d, press enter to simulate a new text" % port
+	mainLoop = gobject.MainLoop()
+	try:
+		mainLoop.run()
+	except KeyboardInterrupt:
+		client.stop()
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,360 @@
+#!/usr/bin/python
+
+"""
+Generate Google Voice payloads of any size
+
+Usage: gv_generator.py FIXTURES [CONTACTS [THREADS [MESSAGES_PER_THREAD [VOICEMAILS]]]]
+
+Writes a login, an addressbook and texts/voicemail feeds into FIXTURES in the
+format of gvoice.transport.FixtureStore, ready for "bench_backend.py run" or
+fake_gv_server.py.  The generate_* functions are also used directly by the
+scaling benchmarks.
+
+Contacts have one to four numbers of mixed types with a few blocked, text
+threads are mostly with contacts and of varying length, and voicemails have
+gc-word-* transcripts of mixed accuracy, all seeded so a size always comes
+out the same.
+"""
+
+import sys
+sys.path.insert(0,"../src")
+import random
+import calendar
+import datetime
+import logging
+
+try:
+	import simplejson as json
+except ImportError:
+	import json
+
+from xml.sax import saxutils
+
+import gvoice.backend as backend
+import gvoice.request_scheduler as request_scheduler
+import gvoice.transport as transport
+
+
+_FIRST_NAMES = (
+	"Alice", "Bob", "Carol", "Dave", "Eve", "Frank", "Grace", "Heidi",
+	"Ivan", "Judy", "Mallory", "Niaj", "Olivia", "Peggy", "Rupert", "Sybil",
+	"Trent", "Victor", "Walter", "Zoe",
+)
+
+_LAST_NAMES = (
+	"Anderson", "Brown", "Clark", "Davis", "Evans", "Garcia", "Harris",
+	"Jones", "King", "Lewis", "Martin", "Nelson", "O'Brien", "Smith & Sons",
+	"Taylor", "Walker", "Young",
+)
+
+_PHONE_TYPES = ("Mobile", "Mobile", "Mobile", "Home", "Work")
+
+_WORDS = (
+	"hey", "it's", "me", "call", "back", "when", "you", "get", "this",
+	"running", "late", "see", "you", "at", "the", "store", "dinner",
+	"tonight", "thanks", "ok", "sounds", "good", "what", "time", "<3",
+)
+
+_WORD_ACCURACIES = ("high", "high", "high", "med1", "med2")
+
+_CONVERSATION_TEMPLATE = """
+<div id="%(id)s" class="goog-flat-button gc-message gc-message-%(readState)s">
+<div class="gc-message-tbl">
+<a class="gc-under gc-message-name-link" href="javascript://">%(name)s</a>
+<span class="gc-nobold">%(contactId)s</span>
+<span class="gc-message-type">%(prettyNumber)s - mobile</span>
+%(location)s<input type="hidden" class="gc-text gc-quickcall-ac" value="%(number)s"/>
+<span class="gc-message-time">%(exactTime)s</span>
+<span class="gc-message-relative">%(relTime)s</span>
+%(body)s
+</div>
+</div>"""
+
+_SMS_ROW_TEMPLATE = """<div class="gc-message-sms-row">
+<span class="gc-message-sms-from">%s</span>
+<span class="gc-message-sms-text">%s</span>
+<span class="gc-message-sms-time">%s</span>
+</div>"""
+
+_LOCATION_TEMPLATE = """<span class="gc-message-location"><a href="javascript://">%s</a></span>\n"""
+
+_TRANSCRIPT_TEMPLATE = """<div class="gc-message-message-display">
+%s
+</div>"""
+
+_WORD_TEMPLATE = """<span id="%d-%d" class="gc-word-%s">%s</span>"""
+
+_FEED_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<response><json><![CDATA[%s]]></json><html><![CDATA[%s]]></html></response>"""
+
+_START = datetime.datetime(2010, 10, 18, 15, 4)
+
+
+class Generator(object):
+
+	def __init__(self, contactCount, seed = 42):
+		self._rng = random.Random(seed)
+		self._contacts = {}
+		self._numbers = []
+		self.threadNumbers = []
+		for contactIndex in xrange(contactCount):
+			self._add_contact(str(contactIndex + 1))
+
+	@property
+	def contacts(self):
+		return self._contacts
+
+	def generate_contacts_page(self):
+		"""
+		@returns What GVoiceBackend.get_contacts downloads
+		"""
+		contacts = dict(self._contacts)
+		# The catch all for unknown contacts that the backend skips
+		contacts["0"] = {"contactId": "0", "name": "", "numbers": []}
+		return json.dumps({"contacts": contacts})
+
+	def generate_texts_page(self, threadCount, messagesPerThread):
+		"""
+		@param messagesPerThread Average messages per thread
+		@returns What GVoiceBackend.get_texts downloads
+		"""
+		return self.generate_texts_pages(threadCount, messagesPerThread, 1)[0]
+
+	def generate_texts_pages(self, threadCount, messagesPerThread, versionCount):
+		"""
+		@returns versionCount successive texts pages, each with one more
+			incoming text than the last, going round the threads
+		"""
+		threads = []
+		for threadIndex in xrange(threadCount):
+			messageCount = max(1, int(self._rng.expovariate(1.0 / messagesPerThread)))
+			when = self._random_time(threadIndex)
+			rows = []
+			for messageIndex in xrange(messageCount):
+				rows.append(_SMS_ROW_TEMPLATE % (
+					self._rng.choice(("Me:", "Contact:")),
+					saxutils.escape(self._random_sentence(12)),
+					self._format_short_time(when + datetime.timedelta(minutes=messageIndex)),
+				))
+			threads.append(("sms%08x" % threadIndex, when, self._new_conversation_fields(), rows))
+		self.threadNumbers = [fields["number"] for (convId, when, fields, rows) in threads]
+
+		pages = []
+		for version in xrange(versionCount):
+			if version:
+				convId, when, fields, rows = threads[(version - 1) % threadCount]
+				rows.append(_SMS_ROW_TEMPLATE % (
+					"Contact:",
+					"Incoming text %d" % version,
+					self._format_short_time(when + datetime.timedelta(minutes=len(rows))),
+				))
+				fields["isRead"] = False
+			htmls = []
+			jsonMessages = {}
+			for convId, when, fields, rows in threads:
+				self._render_conversation(convId, when, fields, "\n".join(rows), "", htmls, jsonMessages, 11)
+			pages.append(self._to_feed(htmls, jsonMessages))
+		return pages
+
+	def generate_voicemails_page(self, voicemailCount, wordsPerVoicemail = 30):
+		"""
+		@returns What GVoiceBackend.get_voicemails downloads
+		"""
+		htmls = []
+		jsonMessages = {}
+		for voicemailIndex in xrange(voicemailCount):
+			words = " ".join(
+				_WORD_TEMPLATE % (
+					voicemailIndex, wordIndex,
+					self._rng.choice(_WORD_ACCURACIES),
+					saxutils.escape(self._rng.choice(_WORDS)),
+				)
+				for wordIndex in xrange(max(1, int(self._rng.gauss(wordsPerVoicemail, wordsPerVoicemail / 3.0))))
+			)
+			location = _LOCATION_TEMPLATE % self._rng.choice(("Provo, UT", "Austin, TX", "Boston, MA"))
+			self._render_conversation(
+				"vm%08x" % voicemailIndex, self._random_time(voicemailIndex), self._new_conversation_fields(),
+				_TRANSCRIPT_TEMPLATE % words, location, htmls, jsonMessages, 2,
+			)
+		return self._to_feed(htmls, jsonMessages)
+
+	def _add_contact(self, contactId):
+		name = "%s %s" % (self._rng.choice(_FIRST_NAMES), self._rng.choice(_LAST_NAMES))
+		numbers = []
+		for i in xrange(self._rng.choice((1, 1, 1, 2, 2, 3, 4))):
+			number = self._new_number()
+			self._numbers.append((number, contactId))
+			numbers.append({
+				"phoneNumber": number,
+				"displayNumber": self._to_pretty(number),
+				"phoneType": self._rng.choice(_PHONE_TYPES),
+			})
+		contact = {
+			"contactId": contactId,
+			"name": name,
+			"numbers": numbers,
+			"phoneNumber": numbers[0]["phoneNumber"],
+			"displayNumber": numbers[0]["displayNumber"],
+			"photoUrl": "",
+			"response": 3 if self._rng.random() < 0.01 else 0,
+		}
+		self._contacts[contactId] = contact
+
+	def _new_conversation_fields(self):
+		if self._numbers and self._rng.random() < 0.8:
+			number, contactId = self._rng.choice(self._numbers)
+			name = self._contacts[contactId]["name"]
+		else:
+			number, contactId = self._new_number(), ""
+			name = self._to_pretty(number)
+		return {
+			"number": number,
+			"contactId": contactId,
+			"name": name,
+			"isRead": self._rng.random() < 0.9,
+			"labels": ["inbox"] if self._rng.random() < 0.7 else ["all"],
+		}
+
+	def _render_conversation(self, convId, when, fields, body, location, htmls, jsonMessages, messageType):
+		number = fields["number"]
+		isRead = fields["isRead"]
+		age = _START - when
+		htmls.append(_CONVERSATION_TEMPLATE % {
+			"id": convId,
+			"readState": "read" if isRead else "unread",
+			"name": saxutils.escape(fields["name"]),
+			"contactId": fields["contactId"],
+			"prettyNumber": self._to_pretty(number),
+			"location": location,
+			"number": number,
+			"exactTime": when.strftime("%m/%d/%y %I:%M %p"),
+			"relTime": "%d hours ago" % (age.days * 24 + age.seconds // 3600, ),
+			"body": body,
+		})
+		jsonMessages[convId] = {
+			"id": convId,
+			"phoneNumber": number,
+			"displayNumber": self._to_pretty(number),
+			"startTime": str(calendar.timegm(when.timetuple()) * 1000),
+			"displayStartDateTime": when.strftime("%m/%d/%y %I:%M %p"),
+			"displayStartTime": self._format_short_time(when),
+			"relativeStartTime": "",
+			"note": "",
+			"isRead": isRead,
+			"isSpam": False,
+			"isTrash": False,
+			"star": False,
+			"labels": fields["labels"],
+			"type": messageType,
+			"children": "",
+		}
+
+	def _to_feed(self, htmls, jsonMessages):
+		jsonHalf = json.dumps({
+			"messages": jsonMessages,
+			"totalSize": len(jsonMessages),
+			"unreadCounts": {},
+			"resultsPerPage": len(jsonMessages),
+		})
+		return _FEED_TEMPLATE % (jsonHalf, "".join(htmls))
+
+	def _new_number(self):
+		return "+1%03d%07d" % (self._rng.randint(201, 989), self._rng.randint(2000000, 9999999))
+
+	def _random_sentence(self, averageWords):
+		return " ".join(
+			self._rng.choice(_WORDS)
+			for i in xrange(max(1, int(self._rng.expovariate(1.0 / averageWords))))
+		)
+
+	def _random_time(self, index):
+		return _START - datetime.timedelta(minutes=7 * index + self._rng.randint(0, 6))
+
+	@staticmethod
+	def _to_pretty(number):
+		return "(%s) %s-%s" % (number[2:5], number[5:8], number[8:])
+
+	@staticmethod
+	def _format_short_time(when):
+		return when.strftime("%I:%M %p").lstrip("0")
+
+
+_LOGIN_PAGE = """<html><body>
+<input type="hidden" name="_rnr_se" value="SCRUBBED"/>
+<div><b class="ms3">(555) 555-0100</b></div>
+Mobile: +15555550100<br />
+</body></html>"""
+
+_TOKEN_PAGE = """<html><body><form>
+<input type="hidden" name="GALX" value="SCRUBBED"/>
+</form></body></html>"""
+
+
+class _GeneratedTransport(object):
+	"""
+	Records the generated pages instead of going over the network
+	"""
+
+	def __init__(self, pages, recorder):
+		self._pages = pages
+		self._recorder = recorder
+
+	def fetch(self, fetch, url, postdata, extraheaders, forbidRedirect):
+		return self._recorder.fetch(self._fetch_generated, url, postdata, extraheaders, forbidRedirect)
+
+	def _fetch_generated(self, url, postdata, extraheaders, forbidRedirect):
+		return self._pages[url]
+
+
+def write_fixtures(path, generator, threadCount, messagesPerThread, voicemailCount, textsVersions = 1):
+	"""
+	@param textsVersions How many polls of the texts feed have something new
+	@returns The FixtureStore written to
+	"""
+	store = transport.FixtureStore(path)
+	scheduler = request_scheduler.RequestScheduler(rate=1e9, burst=1e9, maxJitter=0)
+	b = backend.GVoiceBackend(requestScheduler=scheduler)
+	pages = {
+		b._tokenURL: _TOKEN_PAGE,
+		b._loginURL: _LOGIN_PAGE,
+		b._forwardURL: _LOGIN_PAGE,
+		b._JSON_CONTACTS_URL: generator.generate_contacts_page(),
+		b._XML_VOICEMAIL_URL: generator.generate_voicemails_page(voicemailCount),
+	}
+	scrubber = transport.Scrubber()
+	b._browser._transport = _GeneratedTransport(
+		pages, transport.RecordingTransport(store, scrubber),
+	)
+	# Requested through the backend so they are keyed like a real session's
+	b.login("someone@gmail.com", "password")
+	b.get_contacts()
+	for textsPage in generator.generate_texts_pages(threadCount, messagesPerThread, textsVersions):
+		pages[b._XML_SMS_URL] = textsPage
+		b.get_texts()
+	b.get_voicemails()
+
+	# Accept whatever is sent, read or archived
+	for url in (b._sendSmsURL, b._markAsReadURL, b._archiveMessageURL):
+		store.add(scrubber.generalize_request(url, ""), '{"ok": true}')
+	return store
+
+
+def main():
+	logging.basicConfig(level=logging.WARNING)
+
+	args = sys.argv[1:]
+	if not args:
+		print __doc__.strip().split("\n\n")[1]
+		return 2
+	path = args[0]
+	sizes = [int(arg) for arg in args[1:]]
+	defaults = [1000, 1000, 10, 200]
+	contactCount, threadCount, messagesPerThread, voicemailCount = sizes + defaults[len(sizes):]
+
+	store = write_fixtures(path, Generator(contactCount), threadCount, messagesPerThread, voicemailCount)
+	print "Wrote %d responses into %s" % (len(store), path)
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,340 @@
+#!/usr/bin/python
+
+"""
+Load one connection manager with many connections on a private session bus
+
+Usage: load_harness.py [--connections 1,5,10,25] [--channels 5] [--duration 30]
+
+Starts a dbus-daemon of its own and the connection manager on it, replaying
+generated Google Voice traffic (see gv_generator.py and
+gvoice.transport) so no account is needed.  The connections are opened in
+steps; after each step every connection gets --channels text channels and
+traffic is driven for --duration seconds:
+	- GetContactAttributes on the contacts of the channels
+	- Send on the channels
+	- "update_now texts" through the debug prompt, where every texts poll
+	  brings a new incoming message
+
+Reported after each step:
+	- RSS of the connection manager, in total and per connection
+	- D-Bus call latency percentiles by method
+	- Main loop stalls, from pinging the connection manager every 50ms on a
+	  separate thread, as a ping is only answered once the main loop gets to it
+"""
+
+from __future__ import with_statement
+
+import os
+import sys
+sys.path.insert(0,"../src")
+import time
+import shutil
+import optparse
+import tempfile
+import threading
+import subprocess
+import logging
+
+import dbus
+import dbus.bus
+import telepathy
+
+import gv_generator
+
+
+CM_BUS_NAME = "org.freedesktop.Telepathy.ConnectionManager.theonering"
+CM_OBJECT_PATH = "/org/freedesktop/Telepathy/ConnectionManager/theonering"
+DBUS_PEER = "org.freedesktop.DBus.Peer"
+
+STALL_THRESHOLD = 0.1
+PING_PERIOD = 0.05
+
+_BUS_CONFIG = """<!DOCTYPE busconfig PUBLIC "-//freedesktop//DTD D-Bus Bus Configuration 1.0//EN"
+ "http://www.freedesktop.org/standards/dbus/1.0/busconfig.dtd">
+<busconfig>
+	<type>session</type>
+	<listen>unix:tmpdir=%s</listen>
+	<policy context="default">
+		<allow send_destination="*" eavesdrop="true"/>
+		<allow eavesdrop="true"/>
+		<allow own="*"/>
+	</policy>
+</busconfig>
+"""
+
+
+def get_rss(pid):
+	with open("/proc/%d/status" % pid) as f:
+		for line in f:
+			if line.startswith("VmRSS:"):
+				return int(line.split()[1]) * 1024
+	return -1
+
+
+def percentile(sortedValues, fraction):
+	if not sortedValues:
+		return 0.0
+	return sortedValues[min(len(sortedValues) - 1, int(len(sortedValues) * fraction))]
+
+
+class Latencies(object):
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._latencies = {}
+
+	def call(self, name, method, *args, **kwds):
+		start = time.time()
+		try:
+			return method(*args, **kwds)
+		finally:
+			self.add(name, time.time() - start)
+
+	def add(self, name, latency):
+		with self._lock:
+			self._latencies.setdefault(name, []).append(latency)
+
+	def reset(self):
+		with self._lock:
+			self._latencies.clear()
+
+	def get(self, name):
+		with self._lock:
+			return list(self._latencies.get(name, ()))
+
+	def report(self):
+		with self._lock:
+			latencies = dict((name, sorted(values)) for (name, values) in self._latencies.iteritems())
+		for name in sorted(latencies.iterkeys()):
+			values = latencies[name]
+			print "\t%-24s %6d calls  p50 %7.1fms  p95 %7.1fms  p99 %7.1fms  max %7.1fms" % (
+				name,
+				len(values),
+				1000 * percentile(values, 0.5),
+				1000 * percentile(values, 0.95),
+				1000 * percentile(values, 0.99),
+				1000 * values[-1],
+			)
+
+
+class Pinger(object):
+	"""
+	Measures how long the connection manager's main loop takes to get to a
+	message, from its own bus connection and thread
+	"""
+
+	def __init__(self, address, latencies):
+		self._bus = dbus.bus.BusConnection(address)
+		self._peer = dbus.Interface(self._bus.get_object(CM_BUS_NAME, CM_OBJECT_PATH), DBUS_PEER)
+		self._latencies = latencies
+		self._isRunning = False
+		self._thread = None
+
+	def start(self):
+		self._isRunning = True
+		self._thread = threading.Thread(target=self._run)
+		self._thread.setDaemon(True)
+		self._thread.start()
+
+	def stop(self):
+		self._isRunning = False
+		self._thread.join()
+
+	def _run(self):
+		while self._isRunning:
+			self._latencies.call("Ping", self._peer.Ping)
+			time.sleep(PING_PERIOD)
+
+
+class ConnectionDriver(object):
+
+	def __init__(self, bus, cm, index, latencies):
+		self._bus = bus
+		self._latencies = latencies
+		self._account = "load%03d@gmail.com" % index
+		busName, objectPath = latencies.call(
+			"RequestConnection",
+			cm.RequestConnection,
+			"gv", {"account": self._account, "password": "password"},
+		)
+		self._proxy = bus.get_object(busName, objectPath)
+		self._conn = dbus.Interface(self._proxy, telepathy.server.CONNECTION)
+		self._contacts = dbus.Interface(self._proxy, telepathy.CONNECTION_INTERFACE_CONTACTS)
+		self._channels = []
+		self._handles = []
+		self._debugPrompt = None
+
+	def connect(self, timeout = 60):
+		self._latencies.call("Connect", self._conn.Connect)
+		end = time.time() + timeout
+		while self._conn.GetStatus() != telepathy.constants.CONNECTION_STATUS_CONNECTED:
+			if end < time.time():
+				raise RuntimeError("%s didn't connect" % (self._account, ))
+			time.sleep(0.1)
+
+	def open_channels(self, numbers, accountNumber):
+		self._handles = list(self._latencies.call(
+			"RequestHandles",
+			self._conn.RequestHandles,
+			telepathy.HANDLE_TYPE_CONTACT, numbers,
+		))
+		for h in self._handles:
+			self._channels.append(self._open_text_channel(h))
+		debugHandle = self._conn.RequestHandles(telepathy.HANDLE_TYPE_CONTACT, [accountNumber])[0]
+		self._debugPrompt = self._open_text_channel(debugHandle)
+
+	def drive(self, step):
+		self._latencies.call(
+			"GetContactAttributes",
+			self._contacts.GetContactAttributes,
+			self._handles,
+			[telepathy.CONNECTION_INTERFACE_ALIASING, telepathy.server.CONNECTION_INTERFACE_SIMPLE_PRESENCE],
+			False,
+		)
+		if self._channels:
+			channel = self._channels[step % len(self._channels)]
+			self._latencies.call(
+				"Send", channel.Send, telepathy.CHANNEL_TEXT_MESSAGE_TYPE_NORMAL, "Load %d" % step,
+			)
+		if step % 5 == 0:
+			self._latencies.call(
+				"Send (update_now)",
+				self._debugPrompt.Send, telepathy.CHANNEL_TEXT_MESSAGE_TYPE_NORMAL, "update_now texts",
+			)
+
+	def count_received(self):
+		return sum(
+			len(self._latencies.call("ListPendingMessages", channel.ListPendingMessages, False))
+			for channel in self._channels
+		)
+
+	def disconnect(self):
+		try:
+			self._conn.Disconnect()
+		except dbus.DBusException:
+			pass
+
+	def _open_text_channel(self, h):
+		path = self._latencies.call(
+			"RequestChannel",
+			self._conn.RequestChannel,
+			telepathy.CHANNEL_TYPE_TEXT, telepathy.HANDLE_TYPE_CONTACT, h, True,
+		)
+		return dbus.Interface(self._bus.get_object(self._proxy.bus_name, path), telepathy.CHANNEL_TYPE_TEXT)
+
+
+def start_bus(tempDir):
+	configPath = os.path.join(tempDir, "bus.conf")
+	with open(configPath, "w") as f:
+		f.write(_BUS_CONFIG % (tempDir, ))
+	daemon = subprocess.Popen(
+		["dbus-daemon", "--config-file=%s" % configPath, "--nofork", "--print-address=1"],
+		stdout=subprocess.PIPE,
+	)
+	address = daemon.stdout.readline().strip()
+	return daemon, address
+
+
+def start_connection_manager(tempDir, address, fixturePath, bus):
+	env = dict(os.environ)
+	env.update({
+		"DBUS_SESSION_BUS_ADDRESS": address,
+		"HOME": tempDir,
+		"THEONERING_PERSIST": "1",
+		"THEONERING_GV_REPLAY": fixturePath,
+	})
+	srcPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+	with open(os.path.join(tempDir, "theonering.stderr"), "w") as stderr:
+		process = subprocess.Popen(
+			[sys.executable, "theonering.py"],
+			cwd=srcPath, env=env, stderr=stderr,
+		)
+	end = time.time() + 30
+	while not bus.name_has_owner(CM_BUS_NAME):
+		if end < time.time() or process.poll() is not None:
+			raise RuntimeError("The connection manager didn't start, see %s" % (tempDir, ))
+		time.sleep(0.1)
+	return process
+
+
+def main():
+	logging.basicConfig(level=logging.WARNING)
+
+	parser = optparse.OptionParser(usage="%prog [options]")
+	parser.add_option("--connections", dest="connections", default="1,5,10,25")
+	parser.add_option("--channels", dest="channels", type="int", default=5)
+	parser.add_option("--duration", dest="duration", type="float", default=30)
+	parser.add_option("--keep", dest="keep", action="store_true", default=False, help="Keep the temporary directory with the logs")
+	options, args = parser.parse_args()
+	connectionCounts = [int(count) for count in options.connections.split(",")]
+
+	tempDir = tempfile.mkdtemp(prefix="theonering-load-")
+	daemon = None
+	process = None
+	try:
+		fixturePath = os.path.join(tempDir, "fixtures")
+		generator = gv_generator.Generator(500)
+		gv_generator.write_fixtures(fixturePath, generator, 200, 10, 50, textsVersions=1000)
+		numbers = generator.threadNumbers[:options.channels]
+		accountNumber = "(555) 555-0100"
+
+		daemon, address = start_bus(tempDir)
+		bus = dbus.bus.BusConnection(address)
+		process = start_connection_manager(tempDir, address, fixturePath, bus)
+		cm = dbus.Interface(bus.get_object(CM_BUS_NAME, CM_OBJECT_PATH), telepathy.server.CONNECTION_MANAGER)
+		idleRss = get_rss(process.pid)
+		print "Connection manager %d started, RSS %.1fMB" % (process.pid, idleRss / (1024.0 * 1024))
+
+		latencies = Latencies()
+		pinger = Pinger(address, latencies)
+		drivers = []
+		for connectionCount in connectionCounts:
+			latencies.reset()
+			pinger.start()
+			try:
+				while len(drivers) < connectionCount:
+					driver = ConnectionDriver(bus, cm, len(drivers), latencies)
+					driver.connect()
+					driver.open_channels(numbers, accountNumber)
+					drivers.append(driver)
+
+				end = time.time() + options.duration
+				step = 0
+				while time.time() < end:
+					for driver in drivers:
+						driver.drive(step)
+					step += 1
+				received = sum(driver.count_received() for driver in drivers)
+			finally:
+				pinger.stop()
+
+			rss = get_rss(process.pid)
+			print "%d connections, %d text channels each" % (connectionCount, options.channels)
+			print "\tRSS %.1fMB, %.2fMB per connection over idle, %d messages received" % (
+				rss / (1024.0 * 1024),
+				(rss - idleRss) / (1024.0 * 1024 * connectionCount),
+				received,
+			)
+			latencies.report()
+			stalls = [latency for latency in latencies.get("Ping") if STALL_THRESHOLD <= latency]
+			print "\tMain loop stalls over %dms: %d, %.1fs in total" % (
+				1000 * STALL_THRESHOLD, len(stalls), sum(stalls),
+			)
+
+		for driver in drivers:
+			driver.disconnect()
+	finally:
+		if process is not None and process.poll() is None:
+			process.terminate()
+			process.wait()
+		if daemon is not None:
+			daemon.terminate()
+			daemon.wait()
+		if options.keep:
+			print "Logs kept in %s" % (tempDir, )
+		else:
+			shutil.rmtree(tempDir, True)
+
+
+if __name__ == "__main__":
+	main()
@@ -82,6 +82,72 @@ class NewGVConversations(object):
 			chan = self._connRef()._channel_manager.channel_for_props(props, signal=True)
 
 
+class ReportDndChanges(object):
+
+	def __init__(self, connRef):
+		self._connRef = connRef
+		self.__callback = None
+
+	def start(self):
+		self.__callback = coroutines.func_sink(
+			coroutines.expand_positional(
+				self._on_dnd_changed
+			)
+		)
+		self._connRef().session.dndSignalHandler.register_sink(
+			self.__callback
+		)
+
+	def stop(self):
+		if self.__callback is None:
+			_moduleLogger.info("DND monitor stopped without starting")
+			return
+		self._connRef().session.dndSignalHandler.unregister_sink(
+			self.__callback
+		)
+		self.__callback = None
+
+	@misc_utils.log_exception(_moduleLogger)
+	def _on_dnd_changed(self, session, isDnd):
+		conn = self._connRef()
+		if conn.options.ignoreDND:
+			return
+		_moduleLogger.info("DND changed to %r" % (isDnd, ))
+		selfHandleId = conn.GetSelfHandle().get_id()
+		conn.PresencesChanged(conn.GetPresences([selfHandleId]))
+
+
+class ExpireContactAttributes(object):
+
+	def __init__(self, connRef):
+		self._connRef = connRef
+		self.__callback = None
+
+	def start(self):
+		self.__callback = coroutines.func_sink(
+			coroutines.expand_positional(
+				self._on_contacts_refreshed
+			)
+		)
+		self._connRef().session.addressbook.updateSignalHandler.register_sink(
+			self.__callback
+		)
+
+	def stop(self):
+		if self.__callback is None:
+			_moduleLogger.info("Contact attribute monitor stopped without starting")
+			return
+		self._connRef().session.addressbook.updateSignalHandler.unregister_sink(
+			self.__callback
+		)
+		self.__callback = None
+		self._connRef().clear_contact_attributes()
+
+	@misc_utils.log_exception(_moduleLogger)
+	def _on_contacts_refreshed(self, addressbook, added, removed, changed):
+		self._connRef().invalidate_contact_attributes(added | removed | changed)
+
+
 class RefreshVoicemail(object):
 
 	def __init__(self, connRef):
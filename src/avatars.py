@@ -100,7 +100,9 @@ class AvatarsMixin(tp.server.ConnectionInterfaceAvatars):
 
 	def _select_avatar(self, handleId):
 		handle = self.get_handle_by_id(telepathy.HANDLE_TYPE_CONTACT, handleId)
+		return self._select_handle_avatar(handle)
 
+	def _select_handle_avatar(self, handle):
 		if handle == self.GetSelfHandle():
 			imageName = self.__SELF_AVATAR
 		else:
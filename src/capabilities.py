@@ -81,9 +81,7 @@ class CapabilitiesMixin(
 			if handleId != 0 and (telepathy.HANDLE_TYPE_CONTACT, handleId) not in self._handles:
 				raise telepathy.errors.InvalidHandle
 
-			h = self.get_handle_by_id(telepathy.HANDLE_TYPE_CONTACT, handleId)
-			for type, (gen, spec) in self._CAPABILITIES.iteritems():
-				ret.append([handleId, type, gen, spec])
+			ret.extend(self._get_handle_capabilities(handleId))
 		return ret
 
 	@misc_utils.log_exception(_moduleLogger)
@@ -94,11 +92,20 @@ class CapabilitiesMixin(
 		ret = dbus.Dictionary({}, signature='ua(a{sv}as)')
 		for i in handles:
 			handle = self.get_handle_by_id(telepathy.HANDLE_TYPE_CONTACT, i)
-			contactCapabilities = (self.text_chat_class, self.audio_chat_class)
-			ret[handle] = dbus.Array(contactCapabilities, signature='(a{sv}as)')
+			ret[handle] = self._get_handle_contact_capabilities()
 
 		return ret
 
+	def _get_handle_capabilities(self, handleId):
+		return [
+			[handleId, type, gen, spec]
+			for type, (gen, spec) in self._CAPABILITIES.iteritems()
+		]
+
+	def _get_handle_contact_capabilities(self):
+		contactCapabilities = (self.text_chat_class, self.audio_chat_class)
+		return dbus.Array(contactCapabilities, signature='(a{sv}as)')
+
 	@misc_utils.log_exception(_moduleLogger)
 	def UpdateCapabilities(self, caps):
 		_moduleLogger.info("Ignoring updating contact capabilities")
@@ -18,6 +18,9 @@ class CallChannel(
 		tp.ChannelInterfaceHold,
 	):
 
+	# Room for the socket timeout plus a re-login
+	_CALL_TIMEOUT = 90
+
 	def __init__(self, connection, manager, props, contactHandle):
 		self.__manager = manager
 		self.__props = props
@@ -159,7 +162,9 @@ class CallChannel(
 		contact = self._conn.get_handle_by_id(telepathy.constants.HANDLE_TYPE_CONTACT, contactId)
 		assert self.__contactHandle == contact, "%r != %r" % (self.__contactHandle, contact)
 
-		le = gobject_utils.AsyncLinearExecution(self._conn.session.pool, self._call)
+		le = gobject_utils.AsyncLinearExecution(
+			self._conn.session.pool, self._call, timeout=self._CALL_TIMEOUT
+		)
 		le.start(contact)
 
 		streamId = 0
@@ -19,6 +19,8 @@ class AllContactsListChannel(
 	The group of contacts for whom you receive presence
 	"""
 
+	MEMBERS_CHANGED_BATCH_SIZE = 200
+
 	def __init__(self, connection, manager, props, listHandle):
 		tp.ChannelTypeContactList.__init__(self, connection, manager, props)
 		tp.ChannelInterfaceGroup.__init__(self)
@@ -40,7 +42,7 @@ class AllContactsListChannel(
 			)
 
 			addressbook = connection.session.addressbook
-			contacts = addressbook.get_numbers()
+			contacts = self._get_list_numbers(addressbook)
 			self._process_refresh(addressbook, set(contacts), set(), set())
 		else:
 			self._callback = None
@@ -71,6 +73,9 @@ class AllContactsListChannel(
 	def _on_contacts_refreshed(self, addressbook, added, removed, changed):
 		self._process_refresh(addressbook, added, removed, changed)
 
+	def _get_list_numbers(self, addressbook):
+		return addressbook.get_numbers()
+
 	def _is_on_list(self, number):
 		return True
 
@@ -109,34 +114,45 @@ class AllContactsListChannel(
 		]
 		added.extend(alsoAdded)
 		added.sort()
-		handlesAdded = [
-			handle.create_handle(connection, "contact", contactNumber)
-			for contactNumber in added
-		]
-		self.__members.union(added)
+		self.__members.update(added)
 
-		removed = list(removed)
-		removed.extend(alsoRemoved)
-		handlesRemoved = [
-			handle.create_handle(connection, "contact", contactNumber)
+		removed = [
+			contactNumber
 			for contactNumber in removed
+			if contactNumber in self.__members
 		]
-		self.__members.difference(removed)
+		removed.extend(alsoRemoved)
+		removed.sort()
+		self.__members.difference_update(removed)
 
+		# Keep each signal bounded for large rosters
 		message = ""
 		actor = 0
 		reason = telepathy.CHANNEL_GROUP_CHANGE_REASON_NONE
-		self.MembersChanged(
-			message,
-			handlesAdded, handlesRemoved,
-			(), (),
-			actor,
-			reason,
-		)
+		batchSize = self.MEMBERS_CHANGED_BATCH_SIZE
+		for start in xrange(0, max(len(added), len(removed)), batchSize):
+			handlesAdded = [
+				handle.create_handle(connection, "contact", contactNumber)
+				for contactNumber in added[start:start+batchSize]
+			]
+			handlesRemoved = [
+				handle.create_handle(connection, "contact", contactNumber)
+				for contactNumber in removed[start:start+batchSize]
+			]
+			self.MembersChanged(
+				message,
+				handlesAdded, handlesRemoved,
+				(), (),
+				actor,
+				reason,
+			)
 
 
 class DenyContactsListChannel(AllContactsListChannel):
 
+	def _get_list_numbers(self, addressbook):
+		return addressbook.get_blocked_numbers()
+
 	def _is_on_list(self, number):
 		return self._conn.session.addressbook.is_blocked(number)
 
@@ -17,10 +17,14 @@ _moduleLogger = logging.getLogger(__name__)
 
 class DebugLogChannel(tp.ChannelTypeFileTransfer):
 
-	def __init__(self, connection, manager, props, contactHandle):
+	def __init__(self, connection, manager, props, contactHandle, path = None):
+		"""
+		@param path File to send instead of the debug log
+		"""
 		self.__manager = manager
 		self.__props = props
 		self.__otherHandle = contactHandle
+		self.__path = path
 		self.__socket = None
 		self.__socketName = ""
 		self.__delayWrite = gobject_utils.Timeout(self._on_write)
@@ -48,7 +52,7 @@ class DebugLogChannel(tp.ChannelTypeFileTransfer):
 
 		# grab a snapshot of the log so that we are always in a consistent
 		# state between calls
-		with open(constants._user_logpath_, "r") as f:
+		with open(path if path is not None else constants._user_logpath_, "r") as f:
 			logLines = f.xreadlines()
 			self._log = "".join(logLines)
 		self._transferredBytes = 0
@@ -76,12 +80,16 @@ class DebugLogChannel(tp.ChannelTypeFileTransfer):
 		return "application/octet-stream"
 
 	def get_filename(self):
+		if self.__path is not None:
+			return os.path.basename(self.__path)
 		return "%s.log" % constants._telepathy_implementation_name_
 
 	def get_size(self):
 		return len(self._log)
 
 	def get_description(self):
+		if self.__path is not None:
+			return "%s for The One Ring" % os.path.basename(self.__path)
 		return "Debug log for The One Ring"
 
 	def get_available_socket_types(self):
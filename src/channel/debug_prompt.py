@@ -13,6 +13,8 @@ import constants
 import tp
 import util.misc as misc_utils
 import util.go_utils as gobject_utils
+import util.metrics as metrics
+import util.profiler as profiler
 import gvoice
 
 
@@ -21,6 +23,8 @@ _moduleLogger = logging.getLogger(__name__)
 
 class DebugPromptChannel(tp.ChannelTypeText, cmd.Cmd):
 
+	DEFAULT_PROFILE_DURATION = 60
+
 	def __init__(self, connection, manager, props, contactHandle):
 		self.__manager = manager
 		self.__props = props
@@ -32,6 +36,8 @@ class DebugPromptChannel(tp.ChannelTypeText, cmd.Cmd):
 		self.__lastMessageTimestamp = datetime.datetime(1, 1, 1)
 
 		self.__otherHandle = contactHandle
+		self.__profiler = profiler.SamplingProfiler()
+		self.__profileTimeout = gobject_utils.Timeout(self._on_profile_timeout)
 		self._conn.add_logger(self)
 
 	@misc_utils.log_exception(_moduleLogger)
@@ -59,6 +65,8 @@ class DebugPromptChannel(tp.ChannelTypeText, cmd.Cmd):
 
 	def close(self):
 		_moduleLogger.debug("Closing debug")
+		self.__profileTimeout.cancel()
+		self.__profiler.stop()
 		tp.ChannelTypeText.Close(self)
 		self.remove_from_connection()
 		self._conn.remove_logger(self)
@@ -391,3 +399,91 @@ class DebugPromptChannel(tp.ChannelTypeText, cmd.Cmd):
 
 	def help_save_log(self):
 		self._report_new_message("Save the log to a specified location")
+
+	def do_stats(self, args):
+		try:
+			args = args.strip().split(None, 1)
+			registry = metrics.get_registry()
+			if not args:
+				stats = registry.format()
+				self._report_new_message(stats if stats else "No stats collected yet")
+			elif args[0] == "reset":
+				registry.reset()
+				self._report_new_message("Stats reset")
+			elif args[0] == "dump":
+				if 1 < len(args):
+					filename = os.path.expanduser(args[1])
+				else:
+					filename = os.path.join(constants._data_path_, "stats.txt")
+				registry.dump(filename)
+				self._report_new_message("Stats written to %s" % (filename, ))
+			else:
+				self._report_new_message('Unknown stats command "%s"' % (args[0], ))
+		except Exception, e:
+			self._report_new_message(str(e))
+
+	def help_stats(self):
+		self._report_new_message("""Runtime stats on requests, parsing, merging, the worker pool and polling.
+"stats" - print them
+"stats reset" - start counting again
+"stats dump" - write them to the data directory
+"stats dump <filename>" - write them to the specified location
+""")
+
+	def do_profile(self, args):
+		try:
+			args = args.strip().split()
+			if not args:
+				if self.__profiler.isRunning:
+					self._report_new_message("Profiling for %.0fs, %d samples so far" % (
+						self.__profiler.duration, self.__profiler.sampleCount
+					))
+				else:
+					self._report_new_message("Not profiling")
+			elif args[0] == "start":
+				if self.__profiler.isRunning:
+					self._report_new_message("Already profiling")
+					return
+				duration = int(args[1]) if 1 < len(args) else self.DEFAULT_PROFILE_DURATION
+				self.__profileTimeout.start(seconds=duration)
+				self.__profiler.start()
+				self._report_new_message("Profiling for %d seconds" % (duration, ))
+			elif args[0] == "stop":
+				if not self.__profiler.isRunning:
+					self._report_new_message("Not profiling")
+					return
+				self.__profileTimeout.cancel()
+				self._finish_profile()
+			else:
+				self._report_new_message('Unknown profile command "%s"' % (args[0], ))
+		except Exception, e:
+			self._report_new_message(str(e))
+
+	def help_profile(self):
+		self._report_new_message("""Sample what every thread is doing, sending the collapsed stacks for a flame graph when done.
+"profile" - whether it is profiling
+"profile start" - for %d seconds
+"profile start <seconds>"
+"profile stop" - before the time is up
+""" % (self.DEFAULT_PROFILE_DURATION, ))
+
+	@misc_utils.log_exception(_moduleLogger)
+	def _on_profile_timeout(self):
+		self._finish_profile()
+
+	def _finish_profile(self):
+		self.__profiler.stop()
+		filename = os.path.join(
+			constants._data_path_,
+			"profile-%s.txt" % (time.strftime("%Y%m%d-%H%M%S"), ),
+		)
+		self.__profiler.write(filename)
+		self._report_new_message("Profiled %d samples over %.0fs into %s" % (
+			self.__profiler.sampleCount, self.__profiler.duration, filename
+		))
+
+		try:
+			publishProps = self._conn.generate_props(telepathy.CHANNEL_TYPE_FILE_TRANSFER, self.__otherHandle, False)
+			self._conn._channel_manager.create_channel_for_props(publishProps, signal=True, path=filename)
+		except Exception, e:
+			self._report_new_message(str(e))
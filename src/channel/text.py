@@ -18,6 +18,9 @@ class TextChannel(tp.ChannelTypeText):
 
 	OLDEST_MESSAGE_WINDOW = datetime.timedelta(days=1)
 
+	# Room for the socket timeout plus a re-login
+	_SEND_TIMEOUT = 90
+
 	def __init__(self, connection, manager, props, contactHandle):
 		self.__manager = manager
 		self.__props = props
@@ -56,7 +59,9 @@ class TextChannel(tp.ChannelTypeText):
 
 	@misc_utils.log_exception(_moduleLogger)
 	def Send(self, messageType, text):
-		le = gobject_utils.AsyncLinearExecution(self._conn.session.pool, self._send)
+		le = gobject_utils.AsyncLinearExecution(
+			self._conn.session.pool, self._send, timeout=self._SEND_TIMEOUT
+		)
 		le.start(messageType, text)
 
 	@misc_utils.log_exception(_moduleLogger)
@@ -71,6 +76,9 @@ class TextChannel(tp.ChannelTypeText):
 				([self.__otherHandle.phoneNumber], text),
 				{},
 			)
+		except gobject_utils.TaskTimeoutError:
+			_moduleLogger.error("Timed out sending to %r, it may still go through" % (self.__otherHandle, ))
+			return
 		except Exception:
 			_moduleLogger.exception("Oh no, what happened?")
 			return
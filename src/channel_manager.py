@@ -109,11 +109,11 @@ class ChannelManager(tp.ChannelManager):
 			chan = channel.text.TextChannel(self._conn, self, props, h)
 		return chan
 
-	def _get_file_transfer_channel(self, props):
+	def _get_file_transfer_channel(self, props, path = None):
 		_, surpress_handler, h = self._get_type_requested_handle(props)
 
 		_moduleLogger.debug('New file transfer channel')
-		chan = channel.debug_log.DebugLogChannel(self._conn, self, props, h)
+		chan = channel.debug_log.DebugLogChannel(self._conn, self, props, h, path)
 		return chan
 
 	def _get_media_channel(self, props):
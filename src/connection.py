@@ -1,4 +1,5 @@
 import os
+import datetime
 import weakref
 import logging
 
@@ -41,6 +42,18 @@ class TheOneRingOptions(object):
 	assert gvoice.session.Session._DEFAULTS["texts"][1] == "minutes"
 	textsPollPeriodInMinutes = gvoice.session.Session._DEFAULTS["texts"][0]
 
+	# History is kept forever unless the user sets a limit
+	historyMaxMessagesPerNumber = 0
+
+	historyMaxAgeInDays = 0
+
+	historyMaxSizeInKb = 0
+
+	textsPushUrl = ""
+
+	# Off unless asked for, it can poll much less often than the set period
+	textsAdaptivePolling = False
+
 	def __init__(self, parameters = None):
 		if parameters is None:
 			return
@@ -49,6 +62,35 @@ class TheOneRingOptions(object):
 		self.contactsPollPeriodInHours = parameters['contacts-poll-period-in-hours']
 		self.voicemailPollPeriodInMinutes = parameters['voicemail-poll-period-in-minutes']
 		self.textsPollPeriodInMinutes = parameters['texts-poll-period-in-minutes']
+		self.historyMaxMessagesPerNumber = parameters['history-max-messages-per-number']
+		self.historyMaxAgeInDays = parameters['history-max-age-in-days']
+		self.historyMaxSizeInKb = parameters['history-max-size-in-kb']
+		self.textsPushUrl = parameters['texts-push-url']
+		self.textsAdaptivePolling = parameters['texts-adaptive-polling']
+
+	def create_retention_policy(self):
+		"""
+		@note 0 (or less) means no limit
+		"""
+		def to_limit(value, scale):
+			if value <= 0:
+				return None
+			return value * scale
+
+		maxAgeInDays = to_limit(self.historyMaxAgeInDays, 1)
+		return gvoice.conversations.RetentionPolicy(
+			maxMessagesPerNumber = to_limit(self.historyMaxMessagesPerNumber, 1),
+			maxAge = datetime.timedelta(days=maxAgeInDays) if maxAgeInDays is not None else None,
+			maxBytes = to_limit(self.historyMaxSizeInKb, 1024),
+		)
+
+	def create_texts_notifier(self):
+		"""
+		@returns Notifier of new texts or None to only poll
+		"""
+		if not self.textsPushUrl:
+			return None
+		return gvoice.notifier.LongPollNotifier(self.textsPushUrl)
 
 
 class TheOneRingConnection(
@@ -76,6 +118,11 @@ class TheOneRingConnection(
 		'contacts-poll-period-in-hours': 'i',
 		'voicemail-poll-period-in-minutes': 'i',
 		'texts-poll-period-in-minutes': 'i',
+		'history-max-messages-per-number': 'i',
+		'history-max-age-in-days': 'i',
+		'history-max-size-in-kb': 'i',
+		'texts-push-url': 's',
+		'texts-adaptive-polling': 'b',
 	}
 	_parameter_defaults = {
 		'forward': '',
@@ -84,6 +131,11 @@ class TheOneRingConnection(
 		'contacts-poll-period-in-hours': TheOneRingOptions.contactsPollPeriodInHours,
 		'voicemail-poll-period-in-minutes': TheOneRingOptions.voicemailPollPeriodInMinutes,
 		'texts-poll-period-in-minutes': TheOneRingOptions.textsPollPeriodInMinutes,
+		'history-max-messages-per-number': TheOneRingOptions.historyMaxMessagesPerNumber,
+		'history-max-age-in-days': TheOneRingOptions.historyMaxAgeInDays,
+		'history-max-size-in-kb': TheOneRingOptions.historyMaxSizeInKb,
+		'texts-push-url': TheOneRingOptions.textsPushUrl,
+		'texts-adaptive-polling': TheOneRingOptions.textsAdaptivePolling,
 	}
 	_secret_parameters = set((
 		"password",
@@ -138,6 +190,8 @@ class TheOneRingConnection(
 		self.set_self_handle(handle.create_handle(self, 'connection'))
 		self._plumbing = [
 			autogv.NewGVConversations(weakref.ref(self)),
+			autogv.ReportDndChanges(weakref.ref(self)),
+			autogv.ExpireContactAttributes(weakref.ref(self)),
 			autogv.RefreshVoicemail(weakref.ref(self)),
 			autogv.AutoDisconnect(weakref.ref(self)),
 			autogv.DelayEnableContactIntegration(constants._telepathy_implementation_name_),
@@ -170,11 +224,8 @@ class TheOneRingConnection(
 	def get_handle_by_name(self, handleType, handleName):
 		requestedHandleName = handleName.encode('utf-8')
 
-		# We need to return an existing or create a new handle.  Unfortunately
-		# handle init's take care of normalizing the handle name.  So we have
-		# to create a new handle regardless and burn some handle id's and burn
-		# some extra memory of creating objects we throw away if the handle
-		# already exists.
+		# Handles are memoized by their normalized name, so an existing handle
+		# is returned rather than a new one being created
 		if handleType == telepathy.HANDLE_TYPE_CONTACT:
 			h = handle.create_handle(self, 'contact', requestedHandleName)
 		elif handleType == telepathy.HANDLE_TYPE_LIST:
@@ -183,12 +234,6 @@ class TheOneRingConnection(
 		else:
 			raise telepathy.errors.NotAvailable('Handle type unsupported %d' % handleType)
 
-		for candidate in self._handles.itervalues():
-			if candidate.get_name() == h.get_name():
-				h = candidate
-				_moduleLogger.debug("Re-used handle for %s, I hoped this helped" % handleName)
-				break
-
 		return h
 
 	def force_log_display(self):
@@ -227,6 +272,9 @@ class TheOneRingConnection(
 					"voicemail": (self.__options.voicemailPollPeriodInMinutes, "minutes"),
 					"texts": (self.__options.textsPollPeriodInMinutes, "minutes"),
 				},
+				retentionPolicy = self.__options.create_retention_policy(),
+				textsNotifier = self.__options.create_texts_notifier(),
+				adaptiveTextsPolling = self.__options.textsAdaptivePolling,
 			)
 
 		if self._status != telepathy.CONNECTION_STATUS_DISCONNECTED:
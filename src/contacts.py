@@ -4,6 +4,7 @@ import dbus
 import telepathy
 
 import util.misc as misc_utils
+import handle
 
 
 _moduleLogger = logging.getLogger(__name__)
@@ -20,8 +21,24 @@ class ContactsMixin(telepathy.server.ConnectionInterfaceContacts):
 		telepathy.CONNECTION_INTERFACE_CONTACT_CAPABILITIES : 'capabilities'
 	}
 
+	# Recomputed on every request rather than cached
+	_VOLATILE_INTERFACES = set((
+		telepathy.CONNECTION_INTERFACE_SIMPLE_PRESENCE,
+	))
+
 	def __init__(self):
 		telepathy.server.ConnectionInterfaceContacts.__init__(self)
+		self.__attributeCache = {}
+		self.__cachedHandleIds = {}
+		self.__resolvers = {
+			telepathy.CONNECTION: lambda h: h.get_name(),
+			telepathy.CONNECTION_INTERFACE_SIMPLE_PRESENCE: self._resolve_presence,
+			telepathy.CONNECTION_INTERFACE_ALIASING: self._get_handle_alias,
+			telepathy.CONNECTION_INTERFACE_AVATARS: self._select_handle_avatar,
+			telepathy.CONNECTION_INTERFACE_CAPABILITIES: self._resolve_caps,
+			telepathy.CONNECTION_INTERFACE_CONTACT_CAPABILITIES:
+				lambda h: self._get_handle_contact_capabilities(),
+		}
 
 		dbus_interface = telepathy.CONNECTION_INTERFACE_CONTACTS
 		self._implement_property_get(
@@ -40,7 +57,11 @@ class ContactsMixin(telepathy.server.ConnectionInterfaceContacts):
 	@dbus.service.method(telepathy.CONNECTION_INTERFACE_CONTACTS, in_signature='auasb',
 							out_signature='a{ua{sv}}', sender_keyword='sender')
 	def GetContactAttributes(self, handles, interfaces, hold, sender):
-		#InspectHandle already checks we're connected, the handles and handle type.
+		self.check_connected()
+		handle_type = telepathy.HANDLE_TYPE_CONTACT
+		for handleId in handles:
+			self.check_handle(handle_type, handleId)
+
 		supportedInterfaces = set()
 		for interface in interfaces:
 			if interface in self.ATTRIBUTES:
@@ -48,26 +69,6 @@ class ContactsMixin(telepathy.server.ConnectionInterfaceContacts):
 			else:
 				_moduleLogger.debug("Ignoring unsupported interface %s" % interface)
 
-		handle_type = telepathy.HANDLE_TYPE_CONTACT
-		ret = dbus.Dictionary(signature='ua{sv}')
-		for handle in handles:
-			ret[handle] = dbus.Dictionary(signature='sv')
-
-		functions = {
-			telepathy.CONNECTION:
-				lambda x: zip(x, self.InspectHandles(handle_type, x)),
-			telepathy.CONNECTION_INTERFACE_SIMPLE_PRESENCE:
-				lambda x: self.GetPresences(x).items(),
-			telepathy.CONNECTION_INTERFACE_ALIASING:
-				lambda x: self.GetAliases(x).items(),
-			telepathy.CONNECTION_INTERFACE_AVATARS :
-				lambda x: self.GetKnownAvatarTokens(x).items(),
-			telepathy.CONNECTION_INTERFACE_CAPABILITIES:
-				lambda x: self.GetCapabilities(x).items(),
-			telepathy.CONNECTION_INTERFACE_CONTACT_CAPABILITIES :
-				lambda x: self.GetContactCapabilities(x).items()
-		}
-
 		#Hold handles if needed
 		if hold:
 			self.HoldHandles(handle_type, handles, sender)
@@ -76,12 +77,73 @@ class ContactsMixin(telepathy.server.ConnectionInterfaceContacts):
 		# are always returned, and need not be requested explicitly.
 		supportedInterfaces.add(telepathy.CONNECTION)
 
-		for interface in supportedInterfaces:
-			interface_attribute = interface + '/' + self.ATTRIBUTES[interface]
-			results = functions[interface](handles)
-			for handle, value in results:
-				ret[int(handle)][interface_attribute] = value
+		ret = dbus.Dictionary(signature='ua{sv}')
+		for handleId in handles:
+			h = self._handles[handle_type, handleId]
+			ret[handleId] = dbus.Dictionary(
+				self._get_contact_attributes(h, supportedInterfaces),
+				signature='sv',
+			)
 		return ret
 
 	def get_contact_attribute_interfaces(self):
 		return self.ATTRIBUTES.keys()
+
+	def invalidate_contact_attributes(self, numbers):
+		"""
+		Drop the cached attributes of the contacts with these numbers
+		"""
+		for number in numbers:
+			handleId = self.__cachedHandleIds.pop(number, None)
+			if handleId is not None:
+				del self.__attributeCache[handleId]
+
+	def clear_contact_attributes(self):
+		self.__attributeCache.clear()
+		self.__cachedHandleIds.clear()
+
+	def _get_contact_attributes(self, h, interfaces):
+		"""
+		@returns {Attribute: Value} for all of the interfaces, with h resolved
+			once for all of them
+		@note Only contacts are cached as their attributes only change with the
+			addressbook while ours change with the callback number and presence
+		"""
+		isCacheable = isinstance(h, handle.ContactHandle)
+		if isCacheable:
+			try:
+				cachedAttributes = self.__attributeCache[h.id]
+			except KeyError:
+				cachedAttributes = {}
+				# A number gets a new handle id if its old handle was released
+				self.invalidate_contact_attributes((h.phoneNumber, ))
+				self.__attributeCache[h.id] = cachedAttributes
+				self.__cachedHandleIds[h.phoneNumber] = h.id
+		else:
+			cachedAttributes = {}
+
+		attributes = {}
+		for interface in interfaces:
+			attributeName = interface + '/' + self.ATTRIBUTES[interface]
+			if interface in self._VOLATILE_INTERFACES:
+				value = self.__resolvers[interface](h)
+			else:
+				try:
+					value = cachedAttributes[attributeName]
+				except KeyError:
+					value = self.__resolvers[interface](h)
+					cachedAttributes[attributeName] = value
+			attributes[attributeName] = value
+		return attributes
+
+	def _resolve_presence(self, h):
+		presenceType, presence = self.get_handle_presence(h)
+		personalMessage = u""
+		return dbus.Struct((presenceType, presence, personalMessage), signature="uss")
+
+	def _resolve_caps(self, h):
+		return dbus.Array(
+			(dbus.Struct(cap, signature="usuu") for cap in self._get_handle_capabilities(h.id)),
+			signature="(usuu)",
+		)
+
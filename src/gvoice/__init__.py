@@ -2,3 +2,4 @@
 
 import addressbook
 import session
+import notifier
@@ -3,6 +3,7 @@
 from __future__ import with_statement
 
 
+import hashlib
 import logging
 
 try:
@@ -11,15 +12,39 @@ try:
 except ImportError:
 	import pickle
 
-import constants
+import journal
 import util.coroutines as coroutines
 import util.misc as misc_utils
+import util.algorithms as algorithms
 import util.go_utils as gobject_utils
 
 
 _moduleLogger = logging.getLogger(__name__)
 
 
+def _freeze(value):
+	if isinstance(value, dict):
+		return tuple(sorted((key, _freeze(item)) for (key, item) in value.iteritems()))
+	elif isinstance(value, list):
+		return tuple(_freeze(item) for item in value)
+	else:
+		return value
+
+
+def contact_fingerprint(contactDetails):
+	"""
+	@returns A digest of a contact's details, independent of key order
+	@note Not the builtin hash, which is only 32 bits on some devices and so
+		too likely to collide across a large addressbook
+
+	>>> contact_fingerprint({"name": "Bob", "numbers": [{"phoneNumber": "5555550100"}]}) == contact_fingerprint({"numbers": [{"phoneNumber": "5555550100"}], "name": "Bob"})
+	True
+	>>> contact_fingerprint({"name": "Bob", "numbers": []}) == contact_fingerprint({"name": "Sue", "numbers": []})
+	False
+	"""
+	return hashlib.sha1(repr(_freeze(contactDetails))).digest()
+
+
 class Addressbook(object):
 
 	_RESPONSE_GOOD = 0
@@ -27,36 +52,46 @@ class Addressbook(object):
 
 	OLDEST_COMPATIBLE_FORMAT_VERSION = misc_utils.parse_version("0.8.0")
 
+	_RECORD_UPDATE = "update"
+
+	_UPDATE_TIMEOUT = 180
+
 	def __init__(self, backend, asyncPool):
 		self._backend = backend
 		self._numbers = {}
+		# Contacts by fingerprint and the fingerprints of the contacts
+		# providing each number, so a refresh only has to look closer at
+		# contacts whose details changed
+		self._contactDetails = {}
+		self._numberProviders = {}
+		# Secondary indexes over the numbers
+		self._contactFingerprints = {}
+		self._blockedNumbers = set()
+		self._numbersByPhoneType = {}
+		self._nameIndex = algorithms.PrefixIndex()
 		self._asyncPool = asyncPool
+		self._journal = None
+		self._loadedFromCache = False
 
 		self.updateSignalHandler = coroutines.CoTee()
 
 	def load(self, path):
 		_moduleLogger.debug("Loading cache")
 		assert not self._numbers
-		try:
-			with open(path, "rb") as f:
-				fileVersion, fileBuild, contacts = pickle.load(f)
-		except (pickle.PickleError, IOError, EOFError, ValueError, Exception):
-			_moduleLogger.exception("While loading")
-			return
-
-		if contacts and misc_utils.compare_versions(
-			self.OLDEST_COMPATIBLE_FORMAT_VERSION,
-			misc_utils.parse_version(fileVersion),
-		) <= 0:
-			_moduleLogger.info("Loaded cache")
+		self._journal = journal.Journal(path, self.OLDEST_COMPATIBLE_FORMAT_VERSION, "Addressbook")
+		contacts, records = self._journal.load()
+		if contacts:
 			self._numbers = contacts
+		for record in records:
+			try:
+				self._replay(record)
+			except Exception:
+				_moduleLogger.exception("While replaying %r" % (record[0], ))
+		self._build_index()
+
+		if self._numbers:
+			_moduleLogger.info("Loaded cache")
 			self._loadedFromCache = True
-		else:
-			_moduleLogger.debug(
-				"Skipping cache due to version mismatch (%s-%s)" % (
-					fileVersion, fileBuild
-				)
-			)
 
 	def save(self, path):
 		_moduleLogger.info("Saving cache")
@@ -64,19 +99,23 @@ class Addressbook(object):
 			_moduleLogger.info("Odd, no conversations to cache.  Did we never load the cache?")
 			return
 
+		if self._journal is None or self._journal.path != path:
+			self._journal = journal.Journal(path, self.OLDEST_COMPATIBLE_FORMAT_VERSION, "Addressbook")
 		try:
-			dataToDump = (constants.__version__, constants.__build__, self._numbers)
-			with open(path, "wb") as f:
-				pickle.dump(dataToDump, f, pickle.HIGHEST_PROTOCOL)
-		except (pickle.PickleError, IOError):
-			_moduleLogger.exception("While saving for %s" % self._name)
+			self._journal.snapshot(self._numbers)
+		except (pickle.PickleError, IOError, OSError):
+			_moduleLogger.exception("While saving")
+		self._journal.close()
 		_moduleLogger.info("Cache saved")
 
 	def update(self, force=False):
 		if not force and self._numbers:
 			return
 
-		le = gobject_utils.AsyncLinearExecution(self._asyncPool, self._update)
+		le = gobject_utils.AsyncLinearExecution(
+			self._asyncPool, self._update, gobject_utils.AsyncPool.PRIORITY_BACKGROUND,
+			timeout=self._UPDATE_TIMEOUT,
+		)
 		le.start()
 
 	@misc_utils.log_exception(_moduleLogger)
@@ -91,27 +130,105 @@ class Addressbook(object):
 			_moduleLogger.exception("While updating the addressbook")
 			return
 
-		oldContacts = self._numbers
-		oldContactNumbers = set(self.get_numbers())
-
-		self._numbers = self._populate_contacts(contacts)
-		newContactNumbers = set(self.get_numbers())
-
-		addedContacts = newContactNumbers - oldContactNumbers
-		removedContacts = oldContactNumbers - newContactNumbers
-		changedContacts = set(
-			contactNumber
-			for contactNumber in newContactNumbers.intersection(oldContactNumbers)
-			if self._numbers[contactNumber] != oldContacts[contactNumber]
-		)
+		addedContacts, removedContacts, changedContacts = self._apply_contacts(contacts)
 
 		if addedContacts or removedContacts or changedContacts:
 			message = self, addedContacts, removedContacts, changedContacts
 			self.updateSignalHandler.stage.send(message)
+			self._journal_update(addedContacts | changedContacts, removedContacts)
+
+	def _journal_update(self, updatedNumbers, removedNumbers):
+		if self._journal is None:
+			return
+		record = (
+			self._RECORD_UPDATE,
+			dict((number, self._numbers[number]) for number in updatedNumbers),
+			list(removedNumbers),
+		)
+		try:
+			isSnapshotDue = self._journal.append(record)
+			if isSnapshotDue and not self._journal.isSnapshotting:
+				_moduleLogger.info("Snapshotting journal")
+				if self._asyncPool is None:
+					self._journal.snapshot(self._numbers)
+				else:
+					le = gobject_utils.AsyncLinearExecution(
+						self._asyncPool, self._snapshot, gobject_utils.AsyncPool.PRIORITY_BACKGROUND
+					)
+					le.start(self._journal)
+		except (pickle.PickleError, IOError, OSError):
+			_moduleLogger.exception("While journaling")
+
+	@misc_utils.log_exception(_moduleLogger)
+	def _snapshot(self, snapshotJournal):
+		# Encoded here, only the disk IO is left to the pool
+		snapshotPath, write = snapshotJournal.start_snapshot(self._numbers)
+		try:
+			yield write, (), {}
+		except Exception:
+			_moduleLogger.exception("While snapshotting")
+			snapshotJournal.abort_snapshot(snapshotPath)
+			return
+
+		try:
+			snapshotJournal.finish_snapshot(snapshotPath)
+		except (IOError, OSError):
+			_moduleLogger.exception("While switching to snapshot")
+
+	def _replay(self, record):
+		recordType = record[0]
+		if recordType == self._RECORD_UPDATE:
+			updatedNumbers, removedNumbers = record[1:]
+			self._numbers.update(updatedNumbers)
+			for number in removedNumbers:
+				self._numbers.pop(number, None)
+		else:
+			_moduleLogger.warning("Unknown journal record %r" % (recordType, ))
 
 	def get_numbers(self):
 		return self._numbers.iterkeys()
 
+	def get_contact_numbers(self, contactId):
+		"""
+		@returns The numbers of the contact
+
+		>>> import os, tempfile
+		>>> path = os.path.join(tempfile.mkdtemp(), "contacts.cache")
+		>>> bob = {"contactId": "1", "name": "Bob", "numbers": [{"phoneNumber": "5555550100"}]}
+		>>> book = Addressbook(None, None)
+		>>> added, removed, changed = book._apply_contacts([("1", bob)])
+		>>> book.save(path)
+		>>> cachedBook = Addressbook(None, None)
+		>>> cachedBook.load(path)
+		>>> cachedBook.get_contact_numbers("1")
+		['+15555550100']
+		>>> cachedBook._apply_contacts([("1", bob)])
+		(set([]), set([]), set([]))
+		"""
+		try:
+			fingerprint = self._contactFingerprints[contactId]
+		except KeyError:
+			return []
+		return self._extract_numbers(self._contactDetails[fingerprint]).keys()
+
+	def get_blocked_numbers(self):
+		return iter(self._blockedNumbers)
+
+	def get_numbers_by_phone_type(self, phoneType):
+		return iter(self._numbersByPhoneType.get(phoneType, ()))
+
+	def find_numbers_by_name(self, name, isPrefix = False):
+		"""
+		@param name Contact name, case insensitively
+		@returns Iterable of the numbers of contacts with the name (or whose
+			name starts with it if isPrefix)
+		"""
+		key = name.lower()
+		if isPrefix:
+			return self._nameIndex.find(key)
+		else:
+			return iter(self._nameIndex.get(key))
+
 	def get_contact_name(self, strippedNumber):
 		"""
 		@throws KeyError if contact not in list (so client can choose what to display)
@@ -125,37 +242,132 @@ class Addressbook(object):
 			return "unknown"
 
 	def is_blocked(self, strippedNumber):
-		try:
-			return self._numbers[strippedNumber][2]["response"] == self._RESPONSE_BLOCKED
-		except KeyError:
-			return False
+		return strippedNumber in self._blockedNumbers
+
+	def _index_number(self, number, value):
+		contactName, phoneType, contactDetails = value
+		if contactDetails.get("response", None) == self._RESPONSE_BLOCKED:
+			self._blockedNumbers.add(number)
+		self._numbersByPhoneType.setdefault(phoneType, set()).add(number)
+		self._nameIndex.add(contactName.lower(), number)
+
+	def _unindex_number(self, number, value):
+		contactName, phoneType, contactDetails = value
+		self._blockedNumbers.discard(number)
+		numbersOfType = self._numbersByPhoneType.get(phoneType, None)
+		if numbersOfType is not None:
+			numbersOfType.discard(number)
+			if not numbersOfType:
+				del self._numbersByPhoneType[phoneType]
+		self._nameIndex.remove(contactName.lower(), number)
+
+	def _apply_contacts(self, contacts):
+		"""
+		Bring the numbers up to date with the complete list of contacts
 
-	def _populate_contacts(self, contacts):
-		numbers = {}
+		@returns (added, removed, changed) numbers
+		@note Contacts whose fingerprint is unchanged are skipped, so the work
+			beyond fingerprinting is proportional to what changed
+		"""
+		newDetails = {}
+		newFingerprints = {}
+		appearedFingerprints = []
 		for contactId, contactDetails in contacts:
-			contactName = contactDetails["name"]
-			contactNumbers = (
-				(
-					misc_utils.normalize_number(numberDetails["phoneNumber"]),
-					numberDetails.get("phoneType", "Mobile"),
-				)
-				for numberDetails in contactDetails["numbers"]
-			)
-			numbers.update(
-				(number, (contactName, phoneType, contactDetails))
-				for (number, phoneType) in contactNumbers
+			fingerprint = contact_fingerprint(contactDetails)
+			if fingerprint not in self._contactDetails:
+				appearedFingerprints.append(fingerprint)
+			newDetails[fingerprint] = contactDetails
+			newFingerprints[contactId] = fingerprint
+		self._contactFingerprints = newFingerprints
+
+		touchedNumbers = set()
+		for fingerprint, contactDetails in self._contactDetails.iteritems():
+			if fingerprint in newDetails:
+				continue
+			for number in self._extract_numbers(contactDetails):
+				providers = self._numberProviders.get(number, None)
+				if providers is not None:
+					providers.discard(fingerprint)
+				touchedNumbers.add(number)
+		self._contactDetails = newDetails
+		for fingerprint in appearedFingerprints:
+			for number in self._extract_numbers(newDetails[fingerprint]):
+				self._numberProviders.setdefault(number, set()).add(fingerprint)
+				touchedNumbers.add(number)
+
+		added = set()
+		removed = set()
+		changed = set()
+		for number in touchedNumbers:
+			providers = self._numberProviders.get(number, None)
+			if not providers:
+				self._numberProviders.pop(number, None)
+				oldValue = self._numbers.pop(number, None)
+				if oldValue is not None:
+					self._unindex_number(number, oldValue)
+					removed.add(number)
+				continue
+			# Pick consistently when several contacts share a number
+			contactDetails = self._contactDetails[min(providers)]
+			value = self._extract_numbers(contactDetails)[number]
+			oldValue = self._numbers.get(number, None)
+			if oldValue is None:
+				added.add(number)
+			elif oldValue != value:
+				self._unindex_number(number, oldValue)
+				changed.add(number)
+			else:
+				continue
+			self._numbers[number] = value
+			self._index_number(number, value)
+		return added, removed, changed
+
+	def _build_index(self):
+		self._contactDetails = {}
+		self._numberProviders = {}
+		self._contactFingerprints = {}
+		self._blockedNumbers = set()
+		self._numbersByPhoneType = {}
+		self._nameIndex = algorithms.PrefixIndex()
+		fingerprints = {}
+		for number, value in self._numbers.iteritems():
+			self._index_number(number, value)
+			contactDetails = value[2]
+			try:
+				fingerprint = fingerprints[id(contactDetails)]
+			except KeyError:
+				fingerprint = contact_fingerprint(contactDetails)
+				fingerprints[id(contactDetails)] = fingerprint
+			self._contactDetails[fingerprint] = contactDetails
+			self._numberProviders.setdefault(number, set()).add(fingerprint)
+			# The server includes the id in the details, the cache has no other
+			# record of it
+			contactId = contactDetails.get("contactId", None)
+			if contactId is not None:
+				self._contactFingerprints[contactId] = fingerprint
+
+	@staticmethod
+	def _extract_numbers(contactDetails):
+		"""
+		@returns {number: (name, phone type, details)} for one contact
+		"""
+		contactName = contactDetails["name"]
+		return dict(
+			(
+				misc_utils.normalize_number(numberDetails["phoneNumber"]),
+				(contactName, numberDetails.get("phoneType", "Mobile"), contactDetails),
 			)
-		return numbers
+			for numberDetails in contactDetails["numbers"]
+		)
 
 
 def print_addressbook(path):
 	import pprint
 
 	try:
-		with open(path, "rb") as f:
-			fileVersion, fileBuild, contacts = pickle.load(f)
+		fileVersion, fileBuild, contacts, generation = journal.read_snapshot(path)
 	except (pickle.PickleError, IOError, EOFError, ValueError):
 		_moduleLogger.exception("")
 	else:
-		pprint.pprint((fileVersion, fileBuild))
+		pprint.pprint((fileVersion, fileBuild, generation))
 		pprint.pprint(contacts)
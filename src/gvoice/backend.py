@@ -34,8 +34,11 @@ import urllib2
 import time
 import datetime
 import itertools
+import threading
 import logging
 import inspect
+import hashlib
+import cStringIO as StringIO
 
 from xml.sax import saxutils
 from xml.etree import ElementTree
@@ -47,6 +50,11 @@ except ImportError:
 	simplejson = None
 
 import browser_emu
+import feed_parser
+import request_scheduler
+import transport as gv_transport
+
+import util.metrics as metrics
 
 
 _moduleLogger = logging.getLogger(__name__)
@@ -56,12 +64,46 @@ class NetworkError(RuntimeError):
 	pass
 
 
-class MessageText(object):
+class _Record(object):
+	"""
+	Slotted record with explicit (and compact) pickling
+
+	State is pickled as a tuple in __slots__ order.  Caches from before these
+	were slotted pickled the instance __dict__, which __setstate__ still
+	accepts.
+	"""
+
+	__slots__ = ()
+
+	def __getstate__(self):
+		return tuple(getattr(self, name) for name in self.__slots__)
+
+	def __setstate__(self, state):
+		# Fields added since something was cached are left at their defaults
+		self.__init__()
+		if isinstance(state, dict):
+			fields = (
+				(name, value)
+				for (name, value) in state.iteritems()
+				if name in self.__slots__
+			)
+		else:
+			fields = zip(self.__slots__, state)
+		for name, value in fields:
+			setattr(self, name, value)
+
+	def to_dict(self):
+		return dict((name, getattr(self, name)) for name in self.__slots__)
+
+
+class MessageText(_Record):
 
 	ACCURACY_LOW = "med1"
 	ACCURACY_MEDIUM = "med2"
 	ACCURACY_HIGH = "high"
 
+	__slots__ = ("accuracy", "text")
+
 	def __init__(self):
 		self.accuracy = None
 		self.text = None
@@ -69,14 +111,13 @@ class MessageText(object):
 	def __str__(self):
 		return self.text
 
-	def to_dict(self):
-		return to_dict(self)
-
 	def __eq__(self, other):
 		return self.accuracy == other.accuracy and self.text == other.text
 
 
-class Message(object):
+class Message(_Record):
+
+	__slots__ = ("whoFrom", "body", "when")
 
 	def __init__(self):
 		self.whoFrom = None
@@ -91,7 +132,7 @@ class Message(object):
 		)
 
 	def to_dict(self):
-		selfDict = to_dict(self)
+		selfDict = _Record.to_dict(self)
 		selfDict["body"] = [text.to_dict() for text in self.body] if self.body is not None else None
 		return selfDict
 
@@ -99,11 +140,16 @@ class Message(object):
 		return self.whoFrom == other.whoFrom and self.when == other.when and self.body == other.body
 
 
-class Conversation(object):
+class Conversation(_Record):
 
 	TYPE_VOICEMAIL = "Voicemail"
 	TYPE_SMS = "SMS"
 
+	__slots__ = (
+		"type", "id", "contactId", "name", "location", "prettyNumber", "number",
+		"time", "relTime", "messages", "isRead", "isSpam", "isTrash", "isArchived",
+	)
+
 	def __init__(self):
 		self.type = None
 		self.id = None
@@ -135,7 +181,7 @@ class Conversation(object):
 			return cmpValue
 
 	def to_dict(self):
-		selfDict = to_dict(self)
+		selfDict = _Record.to_dict(self)
 		selfDict["messages"] = [message.to_dict() for message in self.messages] if self.messages is not None else None
 		return selfDict
 
@@ -151,17 +197,41 @@ class GVoiceBackend(object):
 	PHONE_TYPE_WORK = 3
 	PHONE_TYPE_GIZMO = 7
 
-	def __init__(self, cookieFile = None):
+	PARSER_REGEX = "regex"
+	PARSER_STREAMING = "streaming"
+
+	_FEED_SMS = "sms"
+	_FEED_VOICEMAIL = "voicemail"
+	_FEED_HISTORY = "history"
+
+	def __init__(self, cookieFile = None, parser = PARSER_REGEX, streamPayloads = False, requestScheduler = None, transport = None):
+		"""
+		@param transport Stand in for the network (see transport.py), by
+			default what the environment asks for
+		"""
 		# Important items in this function are the setup of the browser emulation and cookie file
-		self._browser = browser_emu.MozillaEmulator(1)
+		if transport is None:
+			transport = gv_transport.from_environment()
+		self._browser = browser_emu.MozillaEmulator(1, transport)
 		self._loadedFromCookies = self._browser.load_cookies(cookieFile)
-
+		if requestScheduler is None:
+			requestScheduler = request_scheduler.get_scheduler()
+		self._requestScheduler = requestScheduler
+
+		# Calls come from several AsyncPool workers at once.  _authLock covers
+		# the session (token, account info, re-authenticating) and is held
+		# across login so concurrent calls wait for it rather than racing it
+		self._authLock = threading.RLock()
 		self._token = ""
 		self._accountNum = ""
 		self._lastAuthed = 0.0
 		self._callbackNumber = ""
 		self._callbackNumbers = {}
 
+		assert parser in (self.PARSER_REGEX, self.PARSER_STREAMING), "Unknown parser %r" % parser
+		self._parser = parser
+		self._streamPayloads = streamPayloads
+
 		# Suprisingly, moving all of these from class to self sped up startup time
 
 		self._validateRe = re.compile("^\+?[0-9]{10,}$")
@@ -210,6 +280,16 @@ class GVoiceBackend(object):
 		self._XML_RECEIVED_URL = SECURE_URL_BASE + "inbox/recent/received/"
 		self._XML_MISSED_URL = SECURE_URL_BASE + "inbox/recent/missed/"
 
+		# Background refreshes, which get jittered to keep connections from
+		# polling in lock step
+		self._pollUrls = set((
+			self._isDndURL,
+			self._JSON_CONTACTS_URL,
+			self._XML_VOICEMAIL_URL,
+			self._XML_SMS_URL,
+			self._JSON_SMS_COUNT_URL,
+		))
+
 		self._galxRe = re.compile(r"""<input.*?name="GALX".*?value="(.*?)".*?/>""", re.MULTILINE | re.DOTALL)
 		self._tokenRe = re.compile(r"""<input.*?name="_rnr_se".*?value="(.*?)"\s*/>""")
 		self._accountNumRe = re.compile(r"""<b class="ms\d">(.{14})</b></div>""")
@@ -241,21 +321,22 @@ class GVoiceBackend(object):
 		@returns If authenticated
 		@blocks
 		"""
-		isRecentledAuthed = (time.time() - self._lastAuthed) < 120
-		isPreviouslyAuthed = self._token is not None
-		if isRecentledAuthed and isPreviouslyAuthed and not force:
-			return True
+		with self._authLock:
+			isRecentledAuthed = (time.time() - self._lastAuthed) < 120
+			isPreviouslyAuthed = self._token is not None
+			if isRecentledAuthed and isPreviouslyAuthed and not force:
+				return True
 
-		try:
-			page = self._get_page(self._forwardURL)
-			self._grab_account_info(page)
-		except Exception, e:
-			_moduleLogger.exception(str(e))
-			return False
+			try:
+				page = self._get_page(self._forwardURL)
+				self._grab_account_info(page)
+			except Exception, e:
+				_moduleLogger.exception(str(e))
+				return False
 
-		self._browser.save_cookies()
-		self._lastAuthed = time.time()
-		return True
+			self._browser.save_cookies()
+			self._lastAuthed = time.time()
+			return True
 
 	def _get_token(self):
 		tokenPage = self._get_page(self._tokenURL)
@@ -289,38 +370,43 @@ class GVoiceBackend(object):
 		@returns Whether login was successful or not
 		@blocks
 		"""
-		self.logout()
-		galxToken = self._get_token()
-		loginSuccessOrFailurePage = self._login(username, password, galxToken)
-
-		try:
-			self._grab_account_info(loginSuccessOrFailurePage)
-		except Exception, e:
-			# Retry in case the redirect failed
-			# luckily is_authed does everything we need for a retry
-			loggedIn = self.is_authed(True)
-			if not loggedIn:
-				_moduleLogger.exception(str(e))
-				return False
-			_moduleLogger.info("Redirection failed on initial login attempt, auto-corrected for this")
+		with self._authLock:
+			self.logout()
+			galxToken = self._get_token()
+			loginSuccessOrFailurePage = self._login(username, password, galxToken)
 
-		self._browser.save_cookies()
-		self._lastAuthed = time.time()
-		return True
+			try:
+				self._grab_account_info(loginSuccessOrFailurePage)
+			except Exception, e:
+				# Retry in case the redirect failed
+				# luckily is_authed does everything we need for a retry
+				loggedIn = self.is_authed(True)
+				if not loggedIn:
+					_moduleLogger.exception(str(e))
+					return False
+				_moduleLogger.info("Redirection failed on initial login attempt, auto-corrected for this")
+
+			self._browser.save_cookies()
+			self._lastAuthed = time.time()
+			return True
 
 	def persist(self):
 		self._browser.save_cookies()
 
 	def shutdown(self):
 		self._browser.save_cookies()
-		self._token = None
-		self._lastAuthed = 0.0
+		self._browser.close()
+		self._forget_session()
 
 	def logout(self):
 		self._browser.clear_cookies()
 		self._browser.save_cookies()
-		self._token = None
-		self._lastAuthed = 0.0
+		self._forget_session()
+
+	def _forget_session(self):
+		with self._authLock:
+			self._token = None
+			self._lastAuthed = 0.0
 
 	def is_dnd(self):
 		"""
@@ -414,8 +500,7 @@ class GVoiceBackend(object):
 			self._XML_SEARCH_URL,
 			{"q": query},
 		)
-		json, html = extract_payload(page)
-		return json
+		return self._grab_payload(page).json
 
 	def get_feed(self, feed):
 		"""
@@ -425,9 +510,7 @@ class GVoiceBackend(object):
 		feedUrl = getattr(self, actualFeed)
 
 		page = self._get_page(feedUrl)
-		json, html = extract_payload(page)
-
-		return json
+		return self._grab_payload(page).json
 
 	def download(self, messageId, adir):
 		"""
@@ -501,7 +584,9 @@ class GVoiceBackend(object):
 		@blocks
 		"""
 		page = self._get_page(self._JSON_CONTACTS_URL)
-		return self._process_contacts(page)
+		with metrics.get_registry().timed("gv.parse.contacts"):
+			contacts = list(self._process_contacts(page))
+		return contacts
 
 	def get_csv_contacts(self):
 		data = {
@@ -513,30 +598,51 @@ class GVoiceBackend(object):
 		contacts = self._get_page(self._CSV_CONTACTS_URL+"?"+encodedData)
 		return contacts
 
-	def get_voicemails(self):
+	def get_voicemails(self, feedCheck = None):
 		"""
+		@param feedCheck FeedCheck, to return nothing when the feed is the
+			same as when it was last parsed with it
 		@blocks
 		"""
 		voicemailPage = self._get_page(self._XML_VOICEMAIL_URL)
-		voicemailHtml = self._grab_html(voicemailPage)
-		voicemailJson = self._grab_json(voicemailPage)
+		if feedCheck is not None:
+			voicemailDigest = feed_digest(voicemailPage)
+			if voicemailDigest == feedCheck.digest:
+				_moduleLogger.debug("Voicemail feed unchanged, skipping parse")
+				return ()
+		voicemailPayload = self._grab_payload(voicemailPage)
+		voicemailJson = voicemailPayload.json
 		if voicemailJson is None:
 			return ()
-		parsedVoicemail = self._parse_voicemail(voicemailHtml)
-		voicemails = self._merge_conversation_sources(parsedVoicemail, voicemailJson)
+		with metrics.get_registry().timed("gv.parse.voicemail"):
+			parsedVoicemail = self._parse_voicemail(voicemailPayload.html)
+			voicemails = list(self._merge_conversation_sources(parsedVoicemail, voicemailJson))
+		if feedCheck is not None:
+			# Only once parsed, so a page that failed to parse is tried again
+			feedCheck.digest = voicemailDigest
 		return voicemails
 
-	def get_texts(self):
+	def get_texts(self, feedCheck = None):
 		"""
+		@param feedCheck FeedCheck, to return nothing when the feed is the
+			same as when it was last parsed with it
 		@blocks
 		"""
 		smsPage = self._get_page(self._XML_SMS_URL)
-		smsHtml = self._grab_html(smsPage)
-		smsJson = self._grab_json(smsPage)
+		if feedCheck is not None:
+			smsDigest = feed_digest(smsPage)
+			if smsDigest == feedCheck.digest:
+				_moduleLogger.debug("SMS feed unchanged, skipping parse")
+				return ()
+		smsPayload = self._grab_payload(smsPage)
+		smsJson = smsPayload.json
 		if smsJson is None:
 			return ()
-		parsedSms = self._parse_sms(smsHtml)
-		smss = self._merge_conversation_sources(parsedSms, smsJson)
+		with metrics.get_registry().timed("gv.parse.sms"):
+			parsedSms = self._parse_sms(smsPayload.html)
+			smss = list(self._merge_conversation_sources(parsedSms, smsJson))
+		if feedCheck is not None:
+			feedCheck.digest = smsDigest
 		return smss
 
 	def get_unread_counts(self):
@@ -566,39 +672,32 @@ class GVoiceBackend(object):
 
 		markPage = self._get_page(self._archiveMessageURL, postData)
 
-	def _grab_json(self, flatXml):
-		xmlTree = ElementTree.fromstring(flatXml)
-		jsonElement = xmlTree.getchildren()[0]
-		flatJson = jsonElement.text
-		jsonTree = parse_json(flatJson)
-		return jsonTree
-
-	def _grab_html(self, flatXml):
-		xmlTree = ElementTree.fromstring(flatXml)
-		htmlElement = xmlTree.getchildren()[1]
-		flatHtml = htmlElement.text
-		return flatHtml
+	def _grab_payload(self, flatXml):
+		return FeedPayload(flatXml, self._streamPayloads)
 
 	def _grab_account_info(self, page):
 		tokenGroup = self._tokenRe.search(page)
 		if tokenGroup is None:
 			raise RuntimeError("Could not extract authentication token from GoogleVoice")
-		self._token = tokenGroup.group(1)
-
-		anGroup = self._accountNumRe.search(page)
-		if anGroup is not None:
-			self._accountNum = anGroup.group(1)
-		else:
-			_moduleLogger.debug("Could not extract account number from GoogleVoice")
 
-		self._callbackNumbers = {}
+		# Swap the new values in whole, other workers may be reading them
+		callbackNumbers = {}
 		for match in self._callbackRe.finditer(page):
 			callbackNumber = match.group(2)
 			callbackName = match.group(1)
-			self._callbackNumbers[callbackNumber] = callbackName
-		if len(self._callbackNumbers) == 0:
+			callbackNumbers[callbackNumber] = callbackName
+		if len(callbackNumbers) == 0:
 			_moduleLogger.debug("Could not extract callback numbers from GoogleVoice (the troublesome page follows):\n%s" % page)
 
+		with self._authLock:
+			self._token = tokenGroup.group(1)
+			anGroup = self._accountNumRe.search(page)
+			if anGroup is not None:
+				self._accountNum = anGroup.group(1)
+			else:
+				_moduleLogger.debug("Could not extract account number from GoogleVoice")
+			self._callbackNumbers = callbackNumbers
+
 	def _send_validation(self, number):
 		if not self.is_valid_syntax(number):
 			raise ValueError('Number is not valid: "%s"' % number)
@@ -608,7 +707,7 @@ class GVoiceBackend(object):
 
 	def _parse_recent(self, recentPages):
 		for action, flatXml in recentPages:
-			allRecentHtml = self._grab_html(flatXml)
+			allRecentHtml = self._grab_payload(flatXml).html
 			allRecentData = self._parse_history(allRecentHtml)
 			for recentCallData in allRecentData:
 				recentCallData["action"] = action
@@ -622,78 +721,42 @@ class GVoiceBackend(object):
 				yield contactId, contactDetails
 
 	def _parse_history(self, historyHtml):
-		splitVoicemail = self._seperateVoicemailsRegex.split(historyHtml)
-		for messageId, messageHtml in itergroup(splitVoicemail[1:], 2):
-			exactTimeGroup = self._exactVoicemailTimeRegex.search(messageHtml)
-			exactTime = exactTimeGroup.group(1).strip() if exactTimeGroup else ""
-			exactTime = google_strptime(exactTime)
-			relativeTimeGroup = self._relativeVoicemailTimeRegex.search(messageHtml)
-			relativeTime = relativeTimeGroup.group(1).strip() if relativeTimeGroup else ""
-			locationGroup = self._voicemailLocationRegex.search(messageHtml)
-			location = locationGroup.group(1).strip() if locationGroup else ""
-
-			nameGroup = self._voicemailNameRegex.search(messageHtml)
-			name = nameGroup.group(1).strip() if nameGroup else ""
-			numberGroup = self._voicemailNumberRegex.search(messageHtml)
-			number = numberGroup.group(1).strip() if numberGroup else ""
-			prettyNumberGroup = self._prettyVoicemailNumberRegex.search(messageHtml)
-			prettyNumber = prettyNumberGroup.group(1).strip() if prettyNumberGroup else ""
-			contactIdGroup = self._messagesContactIDRegex.search(messageHtml)
-			contactId = contactIdGroup.group(1).strip() if contactIdGroup else ""
-
+		for fields in self._extract_messages(historyHtml, self._FEED_HISTORY):
 			yield {
-				"id": messageId.strip(),
-				"contactId": contactId,
-				"name": unescape(name),
-				"time": exactTime,
-				"relTime": relativeTime,
-				"prettyNumber": prettyNumber,
-				"number": number,
-				"location": unescape(location),
+				"id": fields["id"],
+				"contactId": fields["contactId"],
+				"name": unescape(fields["name"]),
+				"time": google_strptime(fields["exactTime"]),
+				"relTime": fields["relTime"],
+				"prettyNumber": fields["prettyNumber"],
+				"number": fields["number"],
+				"location": unescape(fields["location"]),
 			}
 
 	@staticmethod
-	def _interpret_voicemail_regex(group):
-		quality, content, number = group.group(2), group.group(3), group.group(4)
+	def _interpret_voicemail_part(quality, content):
 		text = MessageText()
-		if quality is not None and content is not None:
-			text.accuracy = quality
-			text.text = content
-			return text
-		elif number is not None:
-			text.accuracy = MessageText.ACCURACY_HIGH
-			text.text = number
-			return text
+		text.accuracy = quality
+		text.text = content
+		return text
 
 	def _parse_voicemail(self, voicemailHtml):
-		splitVoicemail = self._seperateVoicemailsRegex.split(voicemailHtml)
-		for messageId, messageHtml in itergroup(splitVoicemail[1:], 2):
+		for fields in self._extract_messages(voicemailHtml, self._FEED_VOICEMAIL):
 			conv = Conversation()
 			conv.type = Conversation.TYPE_VOICEMAIL
-			conv.id = messageId.strip()
-
-			exactTimeGroup = self._exactVoicemailTimeRegex.search(messageHtml)
-			exactTimeText = exactTimeGroup.group(1).strip() if exactTimeGroup else ""
-			conv.time = google_strptime(exactTimeText)
-			relativeTimeGroup = self._relativeVoicemailTimeRegex.search(messageHtml)
-			conv.relTime = relativeTimeGroup.group(1).strip() if relativeTimeGroup else ""
-			locationGroup = self._voicemailLocationRegex.search(messageHtml)
-			conv.location = unescape(locationGroup.group(1).strip() if locationGroup else "")
-
-			nameGroup = self._voicemailNameRegex.search(messageHtml)
-			conv.name = unescape(nameGroup.group(1).strip() if nameGroup else "")
-			numberGroup = self._voicemailNumberRegex.search(messageHtml)
-			conv.number = numberGroup.group(1).strip() if numberGroup else ""
-			prettyNumberGroup = self._prettyVoicemailNumberRegex.search(messageHtml)
-			conv.prettyNumber = prettyNumberGroup.group(1).strip() if prettyNumberGroup else ""
-			contactIdGroup = self._messagesContactIDRegex.search(messageHtml)
-			conv.contactId = contactIdGroup.group(1).strip() if contactIdGroup else ""
+			conv.id = fields["id"]
+			conv.time = google_strptime(fields["exactTime"])
+			conv.relTime = fields["relTime"]
+			conv.location = unescape(fields["location"])
+			conv.name = unescape(fields["name"])
+			conv.number = fields["number"]
+			conv.prettyNumber = fields["prettyNumber"]
+			conv.contactId = fields["contactId"]
 
-			messageGroups = self._voicemailMessageRegex.finditer(messageHtml)
 			messageParts = [
-				self._interpret_voicemail_regex(group)
-				for group in messageGroups
-			] if messageGroups else ((MessageText.ACCURACY_LOW, "No Transcription"), )
+				self._interpret_voicemail_part(quality, content)
+				for (quality, content) in fields["voicemailParts"]
+			]
 			message = Message()
 			message.body = messageParts
 			message.whoFrom = conv.name
@@ -720,40 +783,85 @@ class GVoiceBackend(object):
 		return message
 
 	def _parse_sms(self, smsHtml):
-		splitSms = self._seperateVoicemailsRegex.split(smsHtml)
-		for messageId, messageHtml in itergroup(splitSms[1:], 2):
+		for fields in self._extract_messages(smsHtml, self._FEED_SMS):
 			conv = Conversation()
 			conv.type = Conversation.TYPE_SMS
-			conv.id = messageId.strip()
+			conv.id = fields["id"]
+			conv.time = google_strptime(fields["exactTime"])
+			conv.relTime = fields["relTime"]
+			conv.location = ""
+			conv.name = unescape(fields["name"])
+			conv.number = fields["number"]
+			conv.prettyNumber = fields["prettyNumber"]
+			conv.contactId = fields["contactId"]
+
+			messageParts = itertools.izip(fields["smsFrom"], fields["smsText"], fields["smsTime"])
+			messages = [self._interpret_sms_message_parts(*parts) for parts in messageParts]
+			conv.messages = messages
+
+			yield conv
+
+	def _extract_messages(self, html, feedType):
+		"""
+		@returns Iterable of dicts of raw (still escaped) fields, see
+			feed_parser.new_message_fields
+		"""
+		if self._parser == self.PARSER_STREAMING:
+			return feed_parser.iter_messages(html)
+		else:
+			return self._extract_messages_with_regex(html, feedType)
+
+	def _extract_messages_with_regex(self, html, feedType):
+		splitHtml = self._seperateVoicemailsRegex.split(html)
+		for messageId, messageHtml in itergroup(splitHtml[1:], 2):
+			fields = feed_parser.new_message_fields(messageId)
 
 			exactTimeGroup = self._exactVoicemailTimeRegex.search(messageHtml)
-			exactTimeText = exactTimeGroup.group(1).strip() if exactTimeGroup else ""
-			conv.time = google_strptime(exactTimeText)
+			fields["exactTime"] = exactTimeGroup.group(1).strip() if exactTimeGroup else ""
 			relativeTimeGroup = self._relativeVoicemailTimeRegex.search(messageHtml)
-			conv.relTime = relativeTimeGroup.group(1).strip() if relativeTimeGroup else ""
-			conv.location = ""
-
+			fields["relTime"] = relativeTimeGroup.group(1).strip() if relativeTimeGroup else ""
 			nameGroup = self._voicemailNameRegex.search(messageHtml)
-			conv.name = unescape(nameGroup.group(1).strip() if nameGroup else "")
+			fields["name"] = nameGroup.group(1).strip() if nameGroup else ""
 			numberGroup = self._voicemailNumberRegex.search(messageHtml)
-			conv.number = numberGroup.group(1).strip() if numberGroup else ""
+			fields["number"] = numberGroup.group(1).strip() if numberGroup else ""
 			prettyNumberGroup = self._prettyVoicemailNumberRegex.search(messageHtml)
-			conv.prettyNumber = prettyNumberGroup.group(1).strip() if prettyNumberGroup else ""
+			fields["prettyNumber"] = prettyNumberGroup.group(1).strip() if prettyNumberGroup else ""
 			contactIdGroup = self._messagesContactIDRegex.search(messageHtml)
-			conv.contactId = contactIdGroup.group(1).strip() if contactIdGroup else ""
-
-			fromGroups = self._smsFromRegex.finditer(messageHtml)
-			fromParts = (group.group(1).strip() for group in fromGroups)
-			textGroups = self._smsTextRegex.finditer(messageHtml)
-			textParts = (group.group(1).strip() for group in textGroups)
-			timeGroups = self._smsTimeRegex.finditer(messageHtml)
-			timeParts = (group.group(1).strip() for group in timeGroups)
+			fields["contactId"] = contactIdGroup.group(1).strip() if contactIdGroup else ""
+
+			if feedType in (self._FEED_VOICEMAIL, self._FEED_HISTORY):
+				locationGroup = self._voicemailLocationRegex.search(messageHtml)
+				fields["location"] = locationGroup.group(1).strip() if locationGroup else ""
+
+			if feedType == self._FEED_VOICEMAIL:
+				messageGroups = self._voicemailMessageRegex.finditer(messageHtml)
+				voicemailParts = (
+					self._interpret_voicemail_regex(group)
+					for group in messageGroups
+				)
+				fields["voicemailParts"] = [
+					part
+					for part in voicemailParts
+					if part is not None
+				]
+
+			if feedType == self._FEED_SMS:
+				fromGroups = self._smsFromRegex.finditer(messageHtml)
+				fields["smsFrom"] = [group.group(1).strip() for group in fromGroups]
+				textGroups = self._smsTextRegex.finditer(messageHtml)
+				fields["smsText"] = [group.group(1).strip() for group in textGroups]
+				timeGroups = self._smsTimeRegex.finditer(messageHtml)
+				fields["smsTime"] = [group.group(1).strip() for group in timeGroups]
+
+			yield fields
 
-			messageParts = itertools.izip(fromParts, textParts, timeParts)
-			messages = [self._interpret_sms_message_parts(*parts) for parts in messageParts]
-			conv.messages = messages
-
-			yield conv
+	@staticmethod
+	def _interpret_voicemail_regex(group):
+		quality, content, number = group.group(2), group.group(3), group.group(4)
+		if quality is not None and content is not None:
+			return quality, content
+		elif number is not None:
+			return MessageText.ACCURACY_HIGH, number
 
 	@staticmethod
 	def _merge_conversation_sources(parsedMessages, json):
@@ -772,18 +880,36 @@ class GVoiceBackend(object):
 
 		encodedData = urllib.urlencode(data) if data is not None else None
 
+		registry = metrics.get_registry()
+		endpoint = request_scheduler.to_endpoint(url)
 		try:
-			page = self._browser.download(url, encodedData, None, headers)
+			with self._requestScheduler.request(url, url in self._pollUrls):
+				start = time.time()
+				try:
+					page = self._browser.download(url, encodedData, None, headers)
+				finally:
+					registry.histogram("gv.latency.%s" % endpoint).observe(time.time() - start)
+		except urllib2.HTTPError, e:
+			registry.counter("gv.status.%s.%d" % (endpoint, e.code)).inc()
+			_moduleLogger.error("Translating error: %s" % str(e))
+			raise NetworkError("%s is not accesible" % url)
 		except urllib2.URLError, e:
+			registry.counter("gv.status.%s.error" % (endpoint, )).inc()
 			_moduleLogger.error("Translating error: %s" % str(e))
 			raise NetworkError("%s is not accesible" % url)
 
+		# download only hands back the page, redirects followed, so all that
+		# is known is that it succeeded
+		registry.counter("gv.status.%s.ok" % (endpoint, )).inc()
+		registry.counter("gv.bytes.%s" % (endpoint, )).inc(len(page))
 		return page
 
 	def _get_page_with_token(self, url, data = None, refererUrl = None):
 		if data is None:
 			data = {}
-		data['_rnr_se'] = self._token
+		with self._authLock:
+			# Waits out a login in progress rather than sending a stale token
+			data['_rnr_se'] = self._token
 
 		page = self._get_page(url, data, refererUrl)
 
@@ -900,17 +1026,109 @@ else:
 	parse_json = _actual_parse_json
 
 
+class FeedPayload(object):
+	"""
+	The <response><json/><html/></response> envelope the XML feeds come in
+
+	The envelope is only parsed the first time either half is asked for and
+	the json half is only decoded if it is asked for.  When streaming,
+	iterparse is used and each element is thrown away as soon as its text is
+	grabbed, so the page isn't held alongside a full tree of itself.
+
+	>>> page = '<response><json><![CDATA[{"messages": {}}]]></json><html><![CDATA[<div id="abc"></div>]]></html></response>'
+	>>> payload = FeedPayload(page)
+	>>> payload.html
+	'<div id="abc"></div>'
+	>>> payload.json
+	{'messages': {}}
+	>>> streamed = FeedPayload(page, stream=True)
+	>>> streamed.html == payload.html, streamed.json == payload.json
+	(True, True)
+	"""
+
+	_UNPARSED = object()
+
+	def __init__(self, flatXml, stream = False):
+		self._flatXml = flatXml
+		self._stream = stream
+		self._flatJson = self._UNPARSED
+		self._flatHtml = self._UNPARSED
+		self._json = self._UNPARSED
+
+	@property
+	def json(self):
+		if self._json is self._UNPARSED:
+			self._parse_envelope()
+			self._json = parse_json(self._flatJson)
+			self._flatJson = None
+		return self._json
+
+	@property
+	def html(self):
+		self._parse_envelope()
+		return self._flatHtml
+
+	def _parse_envelope(self):
+		if self._flatXml is None:
+			return
+		if self._stream:
+			sections = self._iter_sections_streaming(self._flatXml)
+		else:
+			sections = (element.text for element in ElementTree.fromstring(self._flatXml))
+		sections = list(sections)
+		self._flatJson, self._flatHtml = sections[0], sections[1]
+		self._flatXml = None
+
+	@staticmethod
+	def _iter_sections_streaming(flatXml):
+		depth = 0
+		for event, element in ElementTree.iterparse(StringIO.StringIO(flatXml), ("start", "end")):
+			if event == "start":
+				depth += 1
+				continue
+			depth -= 1
+			if depth == 1:
+				yield element.text
+				element.clear()
+
+
 def extract_payload(flatXml):
-	xmlTree = ElementTree.fromstring(flatXml)
+	payload = FeedPayload(flatXml)
+	return payload.json, payload.html
+
+
+_VOLATILE_FEED_FIELDS = re.compile(
+	r'''<span class="gc-message-relative">.*?</span>|"relativeStartTime"\s*:\s*"[^"]*"''',
+	re.MULTILINE | re.DOTALL,
+)
+
 
-	jsonElement = xmlTree.getchildren()[0]
-	flatJson = jsonElement.text
-	jsonTree = parse_json(flatJson)
+def feed_digest(page):
+	"""
+	Fingerprint a feed page, ignoring fields that change without the
+	underlying messages changing (like "5 minutes ago")
+
+	>>> feed_digest('<span class="gc-message-relative">5 minutes ago</span>') == feed_digest('<span class="gc-message-relative">6 minutes ago</span>')
+	True
+	>>> feed_digest('{"relativeStartTime":"5 minutes ago","isRead":true}') == feed_digest('{"relativeStartTime": "1 hour ago","isRead":true}')
+	True
+	>>> feed_digest('{"isRead":true}') == feed_digest('{"isRead":false}')
+	False
+	"""
+	stablePage = _VOLATILE_FEED_FIELDS.sub("", page)
+	return hashlib.sha1(stablePage).hexdigest()
 
-	htmlElement = xmlTree.getchildren()[1]
-	flatHtml = htmlElement.text
 
-	return jsonTree, flatHtml
+class FeedCheck(object):
+	"""
+	Digest of the feed page last parsed, for skipping it while it's unchanged
+
+	Kept by whoever keeps what was parsed, so throwing that away (like
+	clearing conversations) can throw this away with it.
+	"""
+
+	def __init__(self):
+		self.digest = None
 
 
 def guess_phone_type(number):
@@ -25,12 +25,22 @@ Optional steps:
 	- The "encode_multipart_formdata" function can be used alone to create POST data from a list of field values and files
 """
 
+from __future__ import with_statement
+
+import time
 import urllib2
+import httplib
 import cookielib
+import threading
 import logging
 
 import socket
 
+try:
+	import cStringIO as StringIO
+except ImportError:
+	import StringIO
+
 
 _moduleLogger = logging.getLogger(__name__)
 socket.setdefaulttimeout(45)
@@ -38,18 +48,25 @@ socket.setdefaulttimeout(45)
 
 class MozillaEmulator(object):
 
-	def __init__(self, trycount = 1):
+	def __init__(self, trycount = 1, transport = None):
 		"""Create a new MozillaEmulator object.
 
 		@param trycount: The download() method will retry the operation if it
 		fails. You can specify -1 for infinite retrying.  A value of 0 means no
-		retrying. A value of 1 means one retry. etc."""
+		retrying. A value of 1 means one retry. etc.
+		@param transport: Optional stand in for the network (see
+		transport.py) that download() goes through"""
 		self.debug = False
 		self.trycount = trycount
+		self._transport = transport
 		self._cookies = cookielib.LWPCookieJar()
 		self._loadedFromCookies = False
 		self._usingCookies = False
 
+		self._connectionPool = ConnectionPool()
+		self._openersLock = threading.Lock()
+		self._openers = {}
+
 	def load_cookies(self, path):
 		assert not self._loadedFromCookies, "Load cookies only once"
 		if not path:
@@ -72,12 +89,19 @@ class MozillaEmulator(object):
 
 	def save_cookies(self):
 		if self._usingCookies:
-			self._cookies.save()
+			# The jar locks its own changes but not saving, which iterates the
+			# cookies other downloads may be changing
+			with self._cookies._cookies_lock:
+				self._cookies.save()
 
 	def clear_cookies(self):
 		if self._usingCookies:
 			self._cookies.clear()
 
+	def close(self):
+		"""Drop all kept-alive connections"""
+		self._connectionPool.close_all()
+
 	def download(self, url,
 			postdata = None, extraheaders = None, forbidRedirect = False,
 			trycount = None, only_head = False,
@@ -105,19 +129,24 @@ class MozillaEmulator(object):
 			trycount = self.trycount
 		cnt = 0
 
+		def fetch(url, postdata, extraheaders, forbidRedirect):
+			req, u = self._build_opener(url, postdata, extraheaders, forbidRedirect)
+			openerdirector = u.open(req)
+			if self.debug:
+				_moduleLogger.info("%r - %r" % (req.get_method(), url))
+				_moduleLogger.info("%r - %r" % (openerdirector.code, openerdirector.msg))
+				_moduleLogger.info("%r" % (openerdirector.headers))
+			self._cookies.extract_cookies(openerdirector, req)
+			if only_head:
+				return openerdirector
+
+			return self._read(openerdirector, trycount)
+
 		while True:
 			try:
-				req, u = self._build_opener(url, postdata, extraheaders, forbidRedirect)
-				openerdirector = u.open(req)
-				if self.debug:
-					_moduleLogger.info("%r - %r" % (req.get_method(), url))
-					_moduleLogger.info("%r - %r" % (openerdirector.code, openerdirector.msg))
-					_moduleLogger.info("%r" % (openerdirector.headers))
-				self._cookies.extract_cookies(openerdirector, req)
-				if only_head:
-					return openerdirector
-
-				return self._read(openerdirector, trycount)
+				if self._transport is None or only_head:
+					return fetch(url, postdata, extraheaders, forbidRedirect)
+				return self._transport.fetch(fetch, url, postdata, extraheaders, forbidRedirect)
 			except urllib2.URLError, e:
 				_moduleLogger.debug("%s: %s" % (e, url))
 				cnt += 1
@@ -140,6 +169,27 @@ class MozillaEmulator(object):
 			txheaders[key] = value
 		req = urllib2.Request(url, postdata, txheaders)
 		self._cookies.add_cookie_header(req)
+		u = self._get_opener(forbidRedirect)
+		if not postdata is None:
+			req.add_data(postdata)
+		return (req, u)
+
+	def _get_opener(self, forbidRedirect):
+		"""
+		Openers are built once and reused so the handlers can keep their
+		connections alive across downloads
+		"""
+		forbidRedirect = bool(forbidRedirect)
+		with self._openersLock:
+			try:
+				return self._openers[forbidRedirect]
+			except KeyError:
+				u = self._create_opener(forbidRedirect)
+				self._openers[forbidRedirect] = u
+				return u
+
+	def _create_opener(self, forbidRedirect):
+
 		if forbidRedirect:
 			redirector = HTTPNoRedirector()
 			#_moduleLogger.info("Redirection disabled")
@@ -147,8 +197,8 @@ class MozillaEmulator(object):
 			redirector = urllib2.HTTPRedirectHandler()
 			#_moduleLogger.info("Redirection enabled")
 
-		http_handler = urllib2.HTTPHandler(debuglevel=self.debug)
-		https_handler = urllib2.HTTPSHandler(debuglevel=self.debug)
+		http_handler = KeepAliveHTTPHandler(self._connectionPool, debuglevel=self.debug)
+		https_handler = KeepAliveHTTPSHandler(self._connectionPool, debuglevel=self.debug)
 
 		u = urllib2.build_opener(
 			http_handler,
@@ -160,9 +210,7 @@ class MozillaEmulator(object):
 			'User-Agent',
 			'Mozilla/5.0 (Windows; U; Windows NT 5.1; de; rv:1.9.1.4) Gecko/20091016 Firefox/3.5.4 (.NET CLR 3.5.30729)'
 		)]
-		if not postdata is None:
-			req.add_data(postdata)
-		return (req, u)
+		return u
 
 	def _read(self, openerdirector, trycount):
 		chunks = []
@@ -199,3 +247,218 @@ class HTTPNoRedirector(urllib2.HTTPRedirectHandler):
 			e.newurl = newurl
 		_moduleLogger.info("New url: %s" % e.newurl)
 		raise e
+
+
+class ConnectionPool(object):
+	"""
+	Idle HTTP(S) connections, keyed by connection class and host
+
+	>>> class FakeConnection(object):
+	... 	def __init__(self, name):
+	... 		self.name = name
+	... 	def close(self):
+	... 		print "Closing", self.name
+	>>> pool = ConnectionPool(maxPerHost = 1, maxIdleTime = 60)
+	>>> conn, isReused = pool.acquire("a", lambda: FakeConnection("first"))
+	>>> conn.name, isReused
+	('first', False)
+	>>> pool.release("a", conn, now = 0)
+	>>> conn, isReused = pool.acquire("a", lambda: FakeConnection("second"), now = 10)
+	>>> conn.name, isReused
+	('first', True)
+	>>> pool.release("a", conn, now = 10)
+	>>> pool.release("a", FakeConnection("extra"), now = 10)
+	Closing extra
+	>>> conn, isReused = pool.acquire("a", lambda: FakeConnection("third"), now = 100)
+	Closing first
+	>>> conn.name, isReused
+	('third', False)
+	"""
+
+	DEFAULT_MAX_PER_HOST = 2
+	DEFAULT_MAX_IDLE_TIME = 60
+
+	def __init__(self, maxPerHost = DEFAULT_MAX_PER_HOST, maxIdleTime = DEFAULT_MAX_IDLE_TIME):
+		self._maxPerHost = maxPerHost
+		self._maxIdleTime = maxIdleTime
+		self._idle = {}
+		self._lock = threading.Lock()
+
+	def acquire(self, key, factory, now = None):
+		"""
+		@returns (connection, whether the connection was reused)
+		"""
+		if now is None:
+			now = time.time()
+		with self._lock:
+			expired = self._evict_expired(now)
+			idleConnections = self._idle.get(key, [])
+			conn = idleConnections.pop()[1] if idleConnections else None
+		for expiredConn in expired:
+			expiredConn.close()
+
+		if conn is not None:
+			return conn, True
+		return factory(), False
+
+	def release(self, key, conn, now = None):
+		if now is None:
+			now = time.time()
+		with self._lock:
+			idleConnections = self._idle.setdefault(key, [])
+			if len(idleConnections) < self._maxPerHost:
+				idleConnections.append((now, conn))
+				conn = None
+		if conn is not None:
+			conn.close()
+
+	def close_all(self):
+		with self._lock:
+			idle = self._idle
+			self._idle = {}
+		for idleConnections in idle.itervalues():
+			for lastUsed, conn in idleConnections:
+				conn.close()
+
+	def _evict_expired(self, now):
+		expired = []
+		for key, idleConnections in self._idle.items():
+			fresh = [
+				(lastUsed, conn)
+				for (lastUsed, conn) in idleConnections
+				if now - lastUsed < self._maxIdleTime
+			]
+			expired.extend(
+				conn
+				for (lastUsed, conn) in idleConnections
+				if self._maxIdleTime <= now - lastUsed
+			)
+			if fresh:
+				self._idle[key] = fresh
+			else:
+				del self._idle[key]
+		return expired
+
+
+class _RequestError(Exception):
+
+	def __init__(self, error, isSent):
+		Exception.__init__(self, error)
+		self.error = error
+		self.isSent = isSent
+
+
+class _KeepAliveMixin(object):
+	"""
+	Replacement for AbstractHTTPHandler.do_open that checks connections out
+	of a ConnectionPool instead of opening (and closing) one per request.
+
+	The body is read completely before the connection is handed back to the
+	pool, so callers get a response backed by memory rather than the socket.
+	"""
+
+	_NETWORK_ERRORS = (socket.error, httplib.HTTPException)
+	_IDEMPOTENT_METHODS = frozenset(("GET", "HEAD"))
+
+	def __init__(self, pool):
+		self._pool = pool
+
+	def do_open(self, http_class, req, **connArgs):
+		if getattr(req, "_tunnel_host", None):
+			# Proxy tunnels are rare enough to not be worth pooling
+			return urllib2.AbstractHTTPHandler.do_open(self, http_class, req, **connArgs)
+
+		host = req.get_host()
+		if not host:
+			raise urllib2.URLError('no host given')
+		key = http_class, host
+
+		headers = dict(req.unredirected_hdrs)
+		headers.update(dict(
+			(k, v)
+			for (k, v) in req.headers.iteritems()
+			if k not in headers
+		))
+		headers["Connection"] = "keep-alive"
+		headers = dict(
+			(name.title(), val)
+			for (name, val) in headers.iteritems()
+		)
+
+		def create_connection():
+			return http_class(host, timeout=req.timeout, **connArgs)
+
+		conn, isReused = self._pool.acquire(key, create_connection)
+		try:
+			r, body = self._request(conn, req, headers)
+		except _RequestError, e:
+			conn.close()
+			if not self._is_retryable(req.get_method(), isReused, e.isSent):
+				raise urllib2.URLError(e.error)
+			# The server most likely dropped the idle connection on us
+			_moduleLogger.debug("Stale connection to %s, reconnecting" % (host, ))
+			conn = create_connection()
+			try:
+				r, body = self._request(conn, req, headers)
+			except _RequestError, e:
+				conn.close()
+				raise urllib2.URLError(e.error)
+
+		if r.will_close:
+			conn.close()
+		else:
+			self._pool.release(key, conn)
+
+		resp = urllib2.addinfourl(StringIO.StringIO(body), r.msg, req.get_full_url())
+		resp.code = r.status
+		resp.msg = r.reason
+		return resp
+
+	@classmethod
+	def _is_retryable(cls, method, isReused, isSent):
+		"""
+		Whether a failed request can be sent again on a new connection
+
+		Only failures on a reused connection are worth retrying.  Once a
+		request is sent the server may have acted on it even though the
+		response got lost, so only requests that are safe to repeat are.
+
+		>>> _KeepAliveMixin._is_retryable("GET", True, True)
+		True
+		>>> _KeepAliveMixin._is_retryable("POST", True, True)
+		False
+		>>> _KeepAliveMixin._is_retryable("POST", True, False)
+		True
+		>>> _KeepAliveMixin._is_retryable("GET", False, False)
+		False
+		"""
+		if not isReused:
+			return False
+		return not isSent or method in cls._IDEMPOTENT_METHODS
+
+	def _request(self, conn, req, headers):
+		conn.set_debuglevel(self._debuglevel)
+		try:
+			conn.request(req.get_method(), req.get_selector(), req.data, headers)
+		except self._NETWORK_ERRORS, e:
+			raise _RequestError(e, False)
+		try:
+			r = conn.getresponse()
+			body = r.read()
+		except self._NETWORK_ERRORS, e:
+			raise _RequestError(e, True)
+		return r, body
+
+
+class KeepAliveHTTPHandler(_KeepAliveMixin, urllib2.HTTPHandler):
+
+	def __init__(self, pool, debuglevel = 0):
+		_KeepAliveMixin.__init__(self, pool)
+		urllib2.HTTPHandler.__init__(self, debuglevel)
+
+
+class KeepAliveHTTPSHandler(_KeepAliveMixin, urllib2.HTTPSHandler):
+
+	def __init__(self, pool, debuglevel = 0):
+		_KeepAliveMixin.__init__(self, pool)
+		urllib2.HTTPSHandler.__init__(self, debuglevel)
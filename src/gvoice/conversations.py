@@ -2,6 +2,7 @@
 
 from __future__ import with_statement
 
+import time
 import datetime
 import logging
 
@@ -11,10 +12,12 @@ try:
 except ImportError:
 	import pickle
 
-import constants
+import backend
+import journal
 import util.coroutines as coroutines
 import util.misc as misc_utils
 import util.go_utils as gobject_utils
+import util.metrics as metrics
 
 
 _moduleLogger = logging.getLogger(__name__)
@@ -29,12 +32,30 @@ class Conversations(object):
 
 	OLDEST_COMPATIBLE_FORMAT_VERSION = misc_utils.parse_version("0.8.0")
 
-	def __init__(self, getter, asyncPool):
+	_RECORD_APPEND = "append"
+	_RECORD_CLEAR = "clear"
+	_RECORD_CLEAR_ALL = "clear_all"
+
+	_UPDATE_TIMEOUT = 120
+
+	def __init__(self, getter, asyncPool, retentionPolicy = None):
 		self._get_raw_conversations = getter
 		self._asyncPool = asyncPool
-		self._conversations = {}
+		if retentionPolicy is None:
+			retentionPolicy = RetentionPolicy()
+		self._retentionPolicy = retentionPolicy
+		self._conversations = journal.LazyMapping()
+		self._journal = None
+		self._feedCheck = backend.FeedCheck()
 		self._loadedFromCache = False
 		self._hasDoneUpdate = False
+		self._lastAppended = {}
+		self._notifier = None
+		self._notifierCallback = coroutines.func_sink(
+			coroutines.expand_positional(
+				self._on_notified
+			)
+		)
 
 		self.updateSignalHandler = coroutines.CoTee()
 
@@ -45,26 +66,22 @@ class Conversations(object):
 	def load(self, path):
 		_moduleLogger.debug("%s Loading cache" % (self._name, ))
 		assert not self._conversations
-		try:
-			with open(path, "rb") as f:
-				fileVersion, fileBuild, convs = pickle.load(f)
-		except (pickle.PickleError, IOError, EOFError, ValueError, Exception):
-			_moduleLogger.exception("While loading for %s" % self._name)
-			return
+		self._journal = journal.Journal(path, self.OLDEST_COMPATIBLE_FORMAT_VERSION, self._name)
+		# Numbers are only decoded once something asks for them
+		convs, records = self._journal.load(lazy=True)
+		if convs:
+			self._conversations.close()
+			self._conversations = convs
+		for record in records:
+			try:
+				self._replay(record)
+			except Exception:
+				_moduleLogger.exception("%s While replaying %r" % (self._name, record[:2]))
 
-		if convs and misc_utils.compare_versions(
-			self.OLDEST_COMPATIBLE_FORMAT_VERSION,
-			misc_utils.parse_version(fileVersion),
-		) <= 0:
+		if self._conversations:
 			_moduleLogger.info("%s Loaded cache" % (self._name, ))
-			self._conversations = convs
 			self._loadedFromCache = True
-		else:
-			_moduleLogger.debug(
-				"%s Skipping cache due to version mismatch (%s-%s)" % (
-					self._name, fileVersion, fileBuild
-				)
-			)
+			self.compact()
 
 	def save(self, path):
 		_moduleLogger.info("%s Saving cache" % (self._name, ))
@@ -72,19 +89,40 @@ class Conversations(object):
 			_moduleLogger.info("%s Odd, no conversations to cache.  Did we never load the cache?" % (self._name, ))
 			return
 
+		self.compact(includeEncoded=True)
+		if self._journal is None or self._journal.path != path:
+			self._journal = journal.Journal(path, self.OLDEST_COMPATIBLE_FORMAT_VERSION, self._name)
 		try:
-			dataToDump = (constants.__version__, constants.__build__, self._conversations)
-			with open(path, "wb") as f:
-				pickle.dump(dataToDump, f, pickle.HIGHEST_PROTOCOL)
-		except (pickle.PickleError, IOError):
+			self._journal.snapshot(self._conversations)
+		except (pickle.PickleError, IOError, OSError):
 			_moduleLogger.exception("While saving for %s" % self._name)
+		self._journal.close()
 		_moduleLogger.info("%s Cache saved" % (self._name, ))
 
+	def set_notifier(self, notifier):
+		"""
+		Update whenever notifier reports a change, on top of any polling
+
+		@param notifier See notifier.py, None to stop
+		"""
+		if self._notifier is not None:
+			self._notifier.changeSignalHandler.unregister_sink(self._notifierCallback)
+		self._notifier = notifier
+		if self._notifier is not None:
+			self._notifier.changeSignalHandler.register_sink(self._notifierCallback)
+
+	@misc_utils.log_exception(_moduleLogger)
+	def _on_notified(self, notifier):
+		self.update(force=True)
+
 	def update(self, force=False):
 		if not force and self._conversations:
 			return
 
-		le = gobject_utils.AsyncLinearExecution(self._asyncPool, self._update)
+		le = gobject_utils.AsyncLinearExecution(
+			self._asyncPool, self._update, gobject_utils.AsyncPool.PRIORITY_POLL,
+			timeout=self._UPDATE_TIMEOUT,
+		)
 		le.start()
 
 	@misc_utils.log_exception(_moduleLogger)
@@ -93,15 +131,17 @@ class Conversations(object):
 			conversationResult = yield (
 				self._get_raw_conversations,
 				(),
-				{},
+				{"feedCheck": self._feedCheck},
 			)
 		except Exception:
 			_moduleLogger.exception("%s While updating conversations" % (self._name, ))
 			return
 
+		mergeStart = time.time()
 		oldConversationIds = set(self._conversations.iterkeys())
 
 		updateConversationIds = set()
+		appendedConversations = {}
 		conversations = list(conversationResult)
 		conversations.sort()
 		for conversation in conversations:
@@ -131,6 +171,15 @@ class Conversations(object):
 
 			if isConversationUpdated:
 				updateConversationIds.add(key)
+				if mergedConversations.conversations and mergedConversations.conversations[-1] is conversation:
+					appendedConversations.setdefault(key, []).append(conversation)
+
+		now = datetime.datetime.now()
+		for key in updateConversationIds:
+			self._conversations[key].compact(self._retentionPolicy, now)
+		metrics.get_registry().histogram(
+			"conversations.merge.%s" % (self._get_raw_conversations.__name__, )
+		).observe(time.time() - mergeStart)
 
 		for key in updateConversationIds:
 			mergedConv = self._conversations[key]
@@ -141,14 +190,30 @@ class Conversations(object):
 				)
 				_moduleLogger.debug(message)
 
+		self._lastAppended = appendedConversations
 		if updateConversationIds:
 			message = (self, updateConversationIds, )
 			self.updateSignalHandler.stage.send(message)
 		self._hasDoneUpdate = True
 
+		# After the signal so what got marked as read when reported is
+		# journaled as read
+		self._journal_appended(appendedConversations)
+
+	@property
+	def hasDoneUpdate(self):
+		return self._hasDoneUpdate
+
 	def get_conversations(self):
 		return self._conversations.iterkeys()
 
+	def get_last_appended(self):
+		"""
+		@returns {number: [conversation]} merged in by the latest update, each
+			conversation holding only the messages that were new
+		"""
+		return self._lastAppended
+
 	def get_conversation(self, key):
 		return self._conversations[key]
 
@@ -157,21 +222,182 @@ class Conversations(object):
 			del self._conversations[key]
 		except KeyError:
 			_moduleLogger.info("%s Conversation never existed for %r" % (self._name, key, ))
+		else:
+			self._journal_record((self._RECORD_CLEAR, key))
+			self._forget_feed()
 
 	def clear_all(self):
 		self._conversations.clear()
+		self._journal_record((self._RECORD_CLEAR_ALL, ))
+		self._forget_feed()
+
+	def _forget_feed(self):
+		# So the next update brings back what is still on the server.  A
+		# new one rather than resetting it, as an update in progress may
+		# still set the old one
+		self._feedCheck = backend.FeedCheck()
+
+	def compact(self, includeEncoded = False):
+		"""
+		Apply the retention policy to all numbers that have been decoded
+
+		@param includeEncoded Decode the numbers still encoded in the cache
+			if they are needed to get under maxBytes, otherwise they only
+			count against it.  Only for saving as it undoes lazy loading.
+		@note Numbers still encoded in the cache were compacted when it was
+			saved
+		"""
+		now = datetime.datetime.now()
+		loadedConversations = self._conversations.loaded_values()
+		compactedCount = sum(
+			mergedConv.compact(self._retentionPolicy, now)
+			for mergedConv in loadedConversations
+		)
+
+		maxBytes = self._retentionPolicy.maxBytes
+		if maxBytes is not None:
+			encodedSizes = self._conversations.encoded_sizes()
+			encodedBytes = sum(encodedSizes.itervalues())
+			totalBytes = sum(
+				estimate_size(conv)
+				for mergedConv in loadedConversations
+				for conv in mergedConv.conversations
+			)
+			if not includeEncoded:
+				totalBytes += encodedBytes
+			elif encodedSizes and maxBytes < totalBytes + encodedBytes:
+				# Only decoded history can be compacted
+				for key in encodedSizes.iterkeys():
+					mergedConv = self._conversations.get(key)
+					if mergedConv is None:
+						continue
+					compactedCount += mergedConv.compact(self._retentionPolicy, now)
+					totalBytes += sum(estimate_size(conv) for conv in mergedConv.conversations)
+				loadedConversations = self._conversations.loaded_values()
+			if maxBytes < totalBytes:
+				candidates = [
+					(conv.time, mergedConv, conv)
+					for mergedConv in loadedConversations
+					for conv in mergedConv.get_compactable()
+				]
+				candidates.sort(key=lambda candidate: candidate[0])
+				toCompact = {}
+				for convTime, mergedConv, conv in candidates:
+					if totalBytes <= maxBytes:
+						break
+					totalBytes -= estimate_size(conv)
+					toCompact.setdefault(id(mergedConv), (mergedConv, []))[1].append(conv)
+				for mergedConv, convs in toCompact.itervalues():
+					mergedConv.compact_conversations(convs)
+					compactedCount += len(convs)
+
+		if compactedCount:
+			_moduleLogger.info("%s Compacted %d conversations" % (self._name, compactedCount))
+		return compactedCount
+
+	def _journal_appended(self, appendedConversations):
+		for key, convs in appendedConversations.iteritems():
+			try:
+				mergedConv = self._conversations[key]
+			except KeyError:
+				continue
+			unread = [
+				(conv.id, conv.time)
+				for conv in mergedConv.conversations
+				if not conv.isRead
+			]
+			self._journal_record((self._RECORD_APPEND, key, convs, unread))
+
+	def _journal_record(self, record):
+		if self._journal is None:
+			return
+		try:
+			isSnapshotDue = self._journal.append(record)
+			if isSnapshotDue and not self._journal.isSnapshotting:
+				_moduleLogger.info("%s Snapshotting journal" % (self._name, ))
+				self.compact()
+				if self._asyncPool is None:
+					self._journal.snapshot(self._conversations)
+				else:
+					le = gobject_utils.AsyncLinearExecution(
+						self._asyncPool, self._snapshot, gobject_utils.AsyncPool.PRIORITY_BACKGROUND
+					)
+					le.start(self._journal)
+		except (pickle.PickleError, IOError, OSError):
+			_moduleLogger.exception("While journaling for %s" % self._name)
+
+	@misc_utils.log_exception(_moduleLogger)
+	def _snapshot(self, snapshotJournal):
+		# Encoded here, only the disk IO is left to the pool
+		snapshotPath, write = snapshotJournal.start_snapshot(self._conversations)
+		try:
+			yield write, (), {}
+		except Exception:
+			_moduleLogger.exception("%s While snapshotting" % (self._name, ))
+			snapshotJournal.abort_snapshot(snapshotPath)
+			return
+
+		try:
+			snapshotJournal.finish_snapshot(snapshotPath)
+		except (IOError, OSError):
+			_moduleLogger.exception("%s While switching to snapshot" % (self._name, ))
+
+	def _replay(self, record):
+		recordType = record[0]
+		if recordType == self._RECORD_APPEND:
+			key, convs, unread = record[1:]
+			try:
+				mergedConv = self._conversations[key]
+			except KeyError:
+				mergedConv = MergedConversations()
+				self._conversations[key] = mergedConv
+			for conv in convs:
+				mergedConv.restore_conversation(conv)
+			unread = set(unread)
+			for conv in mergedConv.conversations:
+				conv.isRead = (conv.id, conv.time) not in unread
+		elif recordType == self._RECORD_CLEAR:
+			self._conversations.pop(record[1], None)
+		elif recordType == self._RECORD_CLEAR_ALL:
+			self._conversations.clear()
+		else:
+			_moduleLogger.warning("%s Unknown journal record %r" % (self._name, recordType))
 
 
 class MergedConversations(object):
 
+	_COMMON_FIELDS = ("isSpam", "isTrash", "isArchived")
+
 	def __init__(self):
 		self._conversations = []
+		self._summary = ConversationSummary()
+		self._build_index()
+
+	def __getstate__(self):
+		# The indices are derived data, keep them out of the cache so the
+		# cache format doesn't change
+		state = self.__dict__.copy()
+		del state["_conversationsById"]
+		del state["_messagesById"]
+		return state
+
+	def __setstate__(self, state):
+		# Caches from before compaction existed won't have a summary
+		self._summary = ConversationSummary()
+		self.__dict__.update(state)
+		self._build_index()
 
 	def append_conversation(self, newConversation, markAllAsRead):
 		self._validate(newConversation)
-		for similarConversation in self._find_related_conversation(newConversation.id):
-			self._update_previous_related_conversation(similarConversation, newConversation)
-			self._remove_repeats(similarConversation, newConversation)
+		similarConversations = self._find_related_conversation(newConversation.id)
+		if similarConversations:
+			# Every conversation in a thread gets the same common fields, so
+			# only walk the thread when the newest one is out of date
+			if not self._is_common_fields_same(similarConversations[-1], newConversation):
+				for similarConversation in similarConversations:
+					self._update_previous_related_conversation(similarConversation, newConversation)
+		if similarConversations or self._summary.has_conversation(newConversation.id):
+			self._remove_repeats(newConversation)
 
 		# HACK: Because GV marks all messages as read when you reply it has
 		# the following race:
@@ -193,16 +419,79 @@ class MergedConversations(object):
 		if newConversation.messages:
 			# must not have had all items removed due to duplicates
 			self._conversations.append(newConversation)
+			self._index_conversation(newConversation)
+
+	def restore_conversation(self, conversation):
+		"""
+		Append a conversation that was already merged, like when replaying a journal
+		"""
+		for similarConversation in self._find_related_conversation(conversation.id):
+			self._update_previous_related_conversation(similarConversation, conversation)
+		self._conversations.append(conversation)
+		self._index_conversation(conversation)
 
 	def to_dict(self):
 		selfDict = {}
 		selfDict["conversations"] = [conv.to_dict() for conv in self._conversations]
+		selfDict["summary"] = self._summary.to_dict()
 		return selfDict
 
 	@property
 	def conversations(self):
 		return self._conversations
 
+	@property
+	def summary(self):
+		return self._summary
+
+	def get_compactable(self):
+		"""
+		@returns Conversations, oldest first, that can be compacted
+		@note The newest conversation is never compacted as new conversations
+		are validated and merged against it
+		"""
+		return [
+			conversation
+			for conversation in self._conversations[:-1]
+			if conversation.isRead or conversation.isArchived
+		]
+
+	def compact(self, policy, now):
+		"""
+		Compact conversations beyond the per number limits of the policy
+		@returns The number of conversations compacted
+		"""
+		compactable = self.get_compactable()
+		toCompact = []
+
+		if policy.maxAge is not None:
+			oldestTime = now - policy.maxAge
+			while compactable and compactable[0].time < oldestTime:
+				toCompact.append(compactable.pop(0))
+
+		if policy.maxMessagesPerNumber is not None:
+			messageCount = sum(len(conv.messages) for conv in self._conversations)
+			messageCount -= sum(len(conv.messages) for conv in toCompact)
+			while compactable and policy.maxMessagesPerNumber < messageCount:
+				conversation = compactable.pop(0)
+				messageCount -= len(conversation.messages)
+				toCompact.append(conversation)
+
+		if toCompact:
+			self.compact_conversations(toCompact)
+		return len(toCompact)
+
+	def compact_conversations(self, conversations):
+		compactedIds = set(id(conversation) for conversation in conversations)
+		self._conversations = [
+			conversation
+			for conversation in self._conversations
+			if id(conversation) not in compactedIds
+		]
+		for conversation in conversations:
+			self._summary.add_conversation(conversation)
+		self._build_index()
+
 	def _validate(self, newConversation):
 		if not self._conversations:
 			return
@@ -216,25 +505,42 @@ class MergedConversations(object):
 		if newConversation.time <= self._conversations[-1].time:
 			raise ConversationError("Conversations got out of order")
 
+	def _build_index(self):
+		self._conversationsById = {}
+		self._messagesById = {}
+		for conversation in self._conversations:
+			self._index_conversation(conversation)
+
+	def _index_conversation(self, conversation):
+		self._conversationsById.setdefault(conversation.id, []).append(conversation)
+		fingerprints = self._messagesById.setdefault(conversation.id, set())
+		fingerprints.update(
+			message_fingerprint(message)
+			for message in conversation.messages
+		)
+
 	def _find_related_conversation(self, convId):
-		similarConversations = (
-			conversation
-			for conversation in self._conversations
-			if conversation.id == convId
+		return self._conversationsById.get(convId, ())
+
+	def _is_common_fields_same(self, relatedConversation, newConversation):
+		return all(
+			getattr(relatedConversation, commonField) == getattr(newConversation, commonField)
+			for commonField in self._COMMON_FIELDS
 		)
-		return similarConversations
 
 	def _update_previous_related_conversation(self, relatedConversation, newConversation):
-		for commonField in ("isSpam", "isTrash", "isArchived"):
+		for commonField in self._COMMON_FIELDS:
 			newValue = getattr(newConversation, commonField)
 			setattr(relatedConversation, commonField, newValue)
 
-	def _remove_repeats(self, relatedConversation, newConversation):
+	def _remove_repeats(self, newConversation):
+		knownMessages = self._messagesById.get(newConversation.id, ())
 		newConversationMessages = newConversation.messages
 		newConversation.messages = [
 			newMessage
 			for newMessage in newConversationMessages
-			if newMessage not in relatedConversation.messages
+			if message_fingerprint(newMessage) not in knownMessages
+			and not self._summary.has_message(newConversation.id, newMessage)
 		]
 		_moduleLogger.debug("Found %d new messages in conversation %s (%d/%d)" % (
 			len(newConversationMessages) - len(newConversation.messages),
@@ -245,6 +551,186 @@ class MergedConversations(object):
 		assert 0 < len(newConversation.messages), "Everything shouldn't have been removed"
 
 
+class RetentionPolicy(object):
+	"""
+	Limits on how much history to keep, None meaning no limit
+
+	Conversations beyond a limit are compacted into their number's
+	ConversationSummary.  Unread conversations are never compacted.
+	"""
+
+	def __init__(self, maxMessagesPerNumber = None, maxAge = None, maxBytes = None):
+		"""
+		@param maxAge datetime.timedelta
+		@param maxBytes Compared against estimate_size of all conversations
+		"""
+		self.maxMessagesPerNumber = maxMessagesPerNumber
+		self.maxAge = maxAge
+		self.maxBytes = maxBytes
+
+
+class ConversationSummary(object):
+	"""
+	What is left of the conversations for a number that were compacted
+
+	Hashes of the compacted messages are kept so GV sending a thread's old
+	messages again doesn't cause them to be reported as new.  GV only sends
+	the newest threads, so only the hashes of the most recently compacted
+	threads, and of their newest messages, are kept.
+
+	>>> import datetime
+	>>> import backend
+	>>> def make_conversation(convId, hour, texts):
+	... 	conversation = backend.Conversation()
+	... 	conversation.id = convId
+	... 	conversation.time = datetime.datetime(2010, 10, 18, hour)
+	... 	conversation.messages = []
+	... 	for text in texts:
+	... 		message = backend.Message()
+	... 		message.whoFrom, message.when = "Me:", "3:04 PM"
+	... 		messageText = backend.MessageText()
+	... 		messageText.text = text
+	... 		message.body = [messageText]
+	... 		conversation.messages.append(message)
+	... 	return conversation
+	>>> summary = ConversationSummary(maxConversations = 2, maxHashesPerConversation = 2)
+	>>> first = make_conversation("a", 1, ["one", "two", "three"])
+	>>> summary.add_conversation(first)
+	>>> summary.has_message("a", first.messages[0]), summary.has_message("a", first.messages[2])
+	(False, True)
+	>>> summary.add_conversation(make_conversation("b", 2, ["four"]))
+	>>> summary.add_conversation(make_conversation("c", 3, ["five"]))
+	>>> summary.has_conversation("a"), summary.has_conversation("b"), summary.has_conversation("c")
+	(False, True, True)
+	>>> summary.conversationCount, summary.messageCount
+	(3, 5)
+	"""
+
+	MAX_CONVERSATIONS = 10
+	MAX_HASHES_PER_CONVERSATION = 500
+
+	def __init__(self, maxConversations = MAX_CONVERSATIONS, maxHashesPerConversation = MAX_HASHES_PER_CONVERSATION):
+		self.conversationCount = 0
+		self.messageCount = 0
+		self.oldestTime = None
+		self.newestTime = None
+		self._maxConversations = maxConversations
+		self._maxHashesPerConversation = maxHashesPerConversation
+		self._messageHashes = {}
+		self._hashOrder = {}
+		self._conversationTimes = {}
+
+	def __setstate__(self, state):
+		self.__init__()
+		self.__dict__.update(state)
+		# Caches from before the hashes were bounded
+		for convId, messageHashes in self._messageHashes.iteritems():
+			self._hashOrder.setdefault(convId, list(messageHashes))
+			self._conversationTimes.setdefault(convId, self.newestTime)
+			self._trim_hashes(convId)
+		self._trim_conversations()
+
+	def add_conversation(self, conversation):
+		self.conversationCount += 1
+		self.messageCount += len(conversation.messages)
+		if self.oldestTime is None or conversation.time < self.oldestTime:
+			self.oldestTime = conversation.time
+		if self.newestTime is None or self.newestTime < conversation.time:
+			self.newestTime = conversation.time
+
+		messageHashes = self._messageHashes.setdefault(conversation.id, set())
+		hashOrder = self._hashOrder.setdefault(conversation.id, [])
+		for message in conversation.messages:
+			messageHash = hash(message_fingerprint(message))
+			if messageHash not in messageHashes:
+				messageHashes.add(messageHash)
+				hashOrder.append(messageHash)
+		self._trim_hashes(conversation.id)
+
+		conversationTime = self._conversationTimes.get(conversation.id, None)
+		if conversationTime is None or conversationTime < conversation.time:
+			self._conversationTimes[conversation.id] = conversation.time
+		self._trim_conversations()
+
+	def has_conversation(self, convId):
+		return convId in self._messageHashes
+
+	def has_message(self, convId, message):
+		try:
+			messageHashes = self._messageHashes[convId]
+		except KeyError:
+			return False
+		return hash(message_fingerprint(message)) in messageHashes
+
+	def _trim_hashes(self, convId):
+		hashOrder = self._hashOrder[convId]
+		if len(hashOrder) <= self._maxHashesPerConversation:
+			return
+		dropCount = len(hashOrder) - self._maxHashesPerConversation
+		self._messageHashes[convId].difference_update(hashOrder[:dropCount])
+		del hashOrder[:dropCount]
+
+	def _trim_conversations(self):
+		while self._maxConversations < len(self._messageHashes):
+			oldestConvId = min(
+				self._conversationTimes.iterkeys(),
+				key=self._conversationTimes.__getitem__,
+			)
+			del self._messageHashes[oldestConvId]
+			del self._hashOrder[oldestConvId]
+			del self._conversationTimes[oldestConvId]
+
+	def to_dict(self):
+		return {
+			"conversationCount": self.conversationCount,
+			"messageCount": self.messageCount,
+			"oldestTime": self.oldestTime,
+			"newestTime": self.newestTime,
+		}
+
+
+_MESSAGE_OVERHEAD_IN_BYTES = 100
+
+
+def estimate_size(conversation):
+	"""
+	Rough size in bytes of a conversation's messages, good enough for
+	comparing against RetentionPolicy.maxBytes
+	"""
+	size = 0
+	for message in conversation.messages:
+		size += _MESSAGE_OVERHEAD_IN_BYTES
+		size += len(message.whoFrom or "") + len(message.when or "")
+		if message.body is not None:
+			size += sum(len(part.text or "") for part in message.body)
+	return size
+
+
+def message_fingerprint(message):
+	"""
+	Hashable stand-in for a message that compares like Message.__eq__
+
+	>>> import backend
+	>>> def make_message(whoFrom, text):
+	... 	message = backend.Message()
+	... 	message.whoFrom = whoFrom
+	... 	message.when = "3:04 PM"
+	... 	messageText = backend.MessageText()
+	... 	messageText.text = text
+	... 	message.body = [messageText]
+	... 	return message
+	>>> message_fingerprint(make_message("Me:", "Hi")) == message_fingerprint(make_message("Me:", "Hi"))
+	True
+	>>> message_fingerprint(make_message("Me:", "Hi")) == message_fingerprint(make_message("Bob:", "Hi"))
+	False
+	"""
+	if message.body is None:
+		body = None
+	else:
+		body = tuple((part.accuracy, part.text) for part in message.body)
+	return message.whoFrom, message.when, body
+
+
 def filter_out_read(conversations):
 	return (
 		conversation
@@ -293,12 +779,11 @@ def print_conversations(path):
 	import pprint
 
 	try:
-		with open(path, "rb") as f:
-			fileVersion, fileBuild, convs = pickle.load(f)
+		fileVersion, fileBuild, convs, generation = journal.read_snapshot(path)
 	except (pickle.PickleError, IOError, EOFError, ValueError):
 		_moduleLogger.exception("")
 	else:
 		for key, value in convs.iteritems():
 			convs[key] = value.to_dict()
-		pprint.pprint((fileVersion, fileBuild))
+		pprint.pprint((fileVersion, fileBuild, generation))
 		pprint.pprint(convs)
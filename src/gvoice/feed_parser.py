@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""
+Single pass parser for the HTML half of the Google Voice message feeds
+
+Instead of splitting the page into messages and running a regex per field
+over each message, the page is tokenized once with a scanner that only stops
+on the tags we care about, and the fields are picked out of the token stream
+as they go by.
+
+@note A parser built on HTMLParser was tried first, it was about twice as
+slow as the per-field regexes since every tag gets tokenized in python.
+"""
+
+import re
+import logging
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+
+def new_message_fields(messageId):
+	return {
+		"id": messageId.strip(),
+		"exactTime": "",
+		"relTime": "",
+		"location": "",
+		"name": "",
+		"number": "",
+		"prettyNumber": "",
+		"contactId": "",
+		"voicemailParts": [],
+		"smsFrom": [],
+		"smsText": [],
+		"smsTime": [],
+	}
+
+
+# Each alternative mirrors one of the per-field regexes in GVoiceBackend,
+# including which ones may span lines.  The leading "<" is factored out so the
+# scanner can skip straight from tag to tag, which is also why a message
+# starting at the start of a line is checked for outside of the regex (see
+# _is_line_start).
+_TOKEN_REGEX = re.compile(
+	r"""<(?:"""
+	r"""(?P<message>div id="(?P<messageId>\w+)"\s* class="[^"]*?gc-message[^"]*?">)"""
+	r"""|(?P<span>span class="gc-message-(?P<spanType>time|relative|type)">(?P<spanText>.*?)</span>)"""
+	r"""|(?P<sms>span class="gc-message-sms-(?P<smsType>from|text|time)">(?P<smsText>[\s\S]*?)</span>)"""
+	r"""|(?P<word>span id="\d+-\d+" class="gc-word-(?P<accuracy>.*?)">(?P<wordText>.*?)</span>)"""
+	r"""|(?P<mni>a .*? class="gc-message-mni">(?P<mniText>.*?)</a>)"""
+	r"""|(?P<name>a class=[^>]*?gc-message-name-link[^>]*?>(?P<nameText>[\s\S]*?)</a>(?:\s*?<span .*?>(?P<contactId>.*?)</span>)?)"""
+	r"""|(?P<location>span class="gc-message-location">.*?<a.*?>(?P<locationText>.*?)</a></span>)"""
+	r"""|(?P<number>input type="hidden" class="gc-text gc-quickcall-ac" value="(?P<numberText>.*?)"/>)"""
+	r""")""",
+	re.MULTILINE,
+)
+
+_SPAN_FIELDS = {
+	"time": "exactTime",
+	"relative": "relTime",
+	"type": "prettyNumber",
+}
+
+_SMS_FIELDS = {
+	"from": "smsFrom",
+	"text": "smsText",
+	"time": "smsTime",
+}
+
+
+def _is_line_start(html, index):
+	"""
+	Whether only whitespace comes before index on its line, like the
+	^\s*<div the regex splitting messages apart anchors on
+
+	>>> _is_line_start('<a>\\n  <div id="abc">', 6)
+	True
+	>>> _is_line_start('<a> <div id="abc">', 4)
+	False
+	>>> _is_line_start('<div id="abc">', 0)
+	True
+	"""
+	lineStart = html.rfind("\n", 0, index) + 1
+	return not html[lineStart:index].strip()
+
+
+def _set_once(fields, fieldName, value):
+	# Matches the per-field regexes which only ever took the first match
+	if not fields[fieldName]:
+		fields[fieldName] = value.strip()
+
+
+def iter_messages(html):
+	"""
+	Yields a dict of raw fields (see new_message_fields) per message, as soon
+	as the start of the next message (or the end of the page) is reached
+
+	Entities in text are left escaped, matching what the per-field regexes
+	produced, so callers unescape the same fields either way.
+
+	>>> messages = list(iter_messages('''
+	... <div id="abc" class="gc-message gc-message-unread">
+	... <a class="gc-under gc-message-name-link" href="#">Bob &amp; Sue</a>
+	... <span class="gc-nobold">42</span>
+	... <span class="gc-message-time">10/18/10 3:04 PM</span>
+	... <span class="gc-message-sms-from">Me:</span>
+	... <span class="gc-message-sms-text">Hello</span>
+	... <span class="gc-message-sms-time">3:04 PM</span> <div id="nested" class="gc-message-sms-row">
+	... <div id="def" class="gc-message gc-message-read">
+	... <span id="1-0" class="gc-word-med1">Call</span>
+	... <a href="#" class="gc-message-mni">555-1234</a>
+	... '''))
+	>>> len(messages)
+	2
+	>>> fields = messages[0]
+	>>> fields["id"], fields["name"], fields["contactId"], fields["exactTime"]
+	('abc', 'Bob &amp; Sue', '42', '10/18/10 3:04 PM')
+	>>> zip(fields["smsFrom"], fields["smsText"], fields["smsTime"])
+	[('Me:', 'Hello', '3:04 PM')]
+	>>> messages[1]["voicemailParts"]
+	[('med1', 'Call'), ('high', '555-1234')]
+	"""
+	fields = None
+	for match in _TOKEN_REGEX.finditer(html):
+		tokenType = match.lastgroup
+		if tokenType == "message":
+			if not _is_line_start(html, match.start()):
+				# A div nested inside of the current message
+				continue
+			if fields is not None:
+				yield fields
+			fields = new_message_fields(match.group("messageId"))
+		elif fields is None:
+			continue
+		elif tokenType == "span":
+			_set_once(fields, _SPAN_FIELDS[match.group("spanType")], match.group("spanText"))
+		elif tokenType == "sms":
+			fields[_SMS_FIELDS[match.group("smsType")]].append(match.group("smsText").strip())
+		elif tokenType == "word":
+			fields["voicemailParts"].append((match.group("accuracy"), match.group("wordText")))
+		elif tokenType == "mni":
+			fields["voicemailParts"].append(("high", match.group("mniText")))
+		elif tokenType == "name":
+			_set_once(fields, "name", match.group("nameText"))
+			_set_once(fields, "contactId", match.group("contactId") or "")
+		elif tokenType == "location":
+			_set_once(fields, "location", match.group("locationText"))
+		elif tokenType == "number":
+			_set_once(fields, "number", match.group("numberText"))
+		else:
+			raise RuntimeError("Unknown token %r" % tokenType)
+
+	if fields is not None:
+		yield fields
@@ -0,0 +1,577 @@
+#!/usr/bin/env python
+
+"""
+Caches stored as a snapshot plus an append-only journal of changes since
+
+The snapshot pickles each key's value separately, followed by an index of
+where each value is, so a snapshot can be memory mapped and values decoded
+only when they are first accessed (see LazyMapping).  Each change is appended to "<path>.journal" as a
+length and checksum prefixed pickle, so saving costs the size of the change
+and a crash only loses a record that was still being written.  Taking a
+snapshot bumps the generation and starts a fresh journal, so a journal left
+over from before a snapshot is ignored rather than replayed twice.  The
+snapshot notes how far into the previous generation's journal it goes, so
+if a crash leaves that journal in place its later records are still
+replayed.
+"""
+
+from __future__ import with_statement
+
+import os
+import mmap
+import struct
+import zlib
+import logging
+
+try:
+	import cPickle
+	pickle = cPickle
+except ImportError:
+	import pickle
+
+import constants
+import util.misc as misc_utils
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+
+_RECORD_HEADER = struct.Struct(">II")
+
+
+def _encode_record(record):
+	payload = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+	return _RECORD_HEADER.pack(len(payload), zlib.crc32(payload) & 0xffffffff) + payload
+
+
+def _read_records(f):
+	"""
+	@returns Iterable of (record, offset just past it), stopping at the end or
+		at the first torn/corrupt record
+	"""
+	offset = 0
+	while True:
+		header = f.read(_RECORD_HEADER.size)
+		if len(header) < _RECORD_HEADER.size:
+			if header:
+				_moduleLogger.info("Journal ends with a partial record header, dropping it")
+			return
+		length, checksum = _RECORD_HEADER.unpack(header)
+		payload = f.read(length)
+		if len(payload) < length or zlib.crc32(payload) & 0xffffffff != checksum:
+			_moduleLogger.info("Journal ends with a torn record, dropping it")
+			return
+		try:
+			record = pickle.loads(payload)
+		except Exception:
+			_moduleLogger.exception("Journal has an unreadable record, dropping it and what follows")
+			return
+		offset += _RECORD_HEADER.size + length
+		yield record, offset
+
+
+_SNAPSHOT_MAGIC = "TORSNAP1"
+_FOOTER_OFFSET = struct.Struct(">Q")
+
+
+class LazyMapping(object):
+	"""
+	Dict-like view of a memory mapped snapshot, unpickling values on first access
+
+	>>> import tempfile
+	>>> path = tempfile.mktemp()
+	>>> _write_atomically(path, lambda f: _write_snapshot(f, {"a": [1], "b": [2]}, 1))
+	>>> fileVersion, fileBuild, data, generation = read_snapshot(path, lazy=True)
+	>>> generation, len(data), sorted(data.iterkeys()), data.loaded_values()
+	(1, 2, ['a', 'b'], [])
+	>>> data["a"], data.loaded_values(), data.encoded_sizes().keys()
+	([1], [[1]], ['b'])
+	>>> data["c"] = [3]
+	>>> sorted(data.iteritems())
+	[('a', [1]), ('b', [2]), ('c', [3])]
+	>>> data.isMapped
+	False
+	>>> os.remove(path)
+	"""
+
+	def __init__(self, snapshotMap = None, index = None):
+		self._map = snapshotMap
+		self._encoded = index if index is not None else {}
+		self._decoded = {}
+		self._release_if_decoded()
+
+	@property
+	def isMapped(self):
+		return self._map is not None
+
+	def __len__(self):
+		return len(self._encoded) + len(self._decoded)
+
+	def __contains__(self, key):
+		return key in self._decoded or key in self._encoded
+
+	def __iter__(self):
+		return self.iterkeys()
+
+	def __getitem__(self, key):
+		try:
+			return self._decoded[key]
+		except KeyError:
+			pass
+		offset, length = self._encoded.pop(key)
+		try:
+			value = pickle.loads(self._map[offset:offset+length])
+		except Exception:
+			_moduleLogger.exception("Dropping undecodable cache entry %r" % (key, ))
+			raise KeyError(key)
+		finally:
+			self._release_if_decoded()
+		self._decoded[key] = value
+		return value
+
+	def __setitem__(self, key, value):
+		if self._encoded.pop(key, None) is not None:
+			self._release_if_decoded()
+		self._decoded[key] = value
+
+	def __delitem__(self, key):
+		if key in self._decoded:
+			del self._decoded[key]
+		else:
+			del self._encoded[key]
+			self._release_if_decoded()
+
+	def get(self, key, default = None):
+		try:
+			return self[key]
+		except KeyError:
+			return default
+
+	def pop(self, key, *default):
+		try:
+			value = self[key]
+		except KeyError:
+			if default:
+				return default[0]
+			raise
+		del self._decoded[key]
+		return value
+
+	def clear(self):
+		self._encoded.clear()
+		self._decoded.clear()
+		self._release_if_decoded()
+
+	def close(self):
+		"""
+		Let go of the snapshot, dropping anything never decoded
+		"""
+		self._encoded.clear()
+		self._release_if_decoded()
+
+	def iterkeys(self):
+		for key in self._decoded.keys():
+			yield key
+		for key in self._encoded.keys():
+			yield key
+
+	def itervalues(self):
+		"""
+		@note Decodes everything
+		"""
+		for key in self.keys():
+			yield self[key]
+
+	def iteritems(self):
+		"""
+		@note Decodes everything
+		"""
+		for key in self.keys():
+			yield key, self[key]
+
+	def keys(self):
+		return list(self.iterkeys())
+
+	def loaded_values(self):
+		return self._decoded.values()
+
+	def encoded_sizes(self):
+		"""
+		@returns {key: bytes} of the values never decoded, as pickled in the
+			snapshot
+		"""
+		return dict(
+			(key, length)
+			for (key, (offset, length)) in self._encoded.iteritems()
+		)
+
+	def iter_encoded(self):
+		"""
+		@returns Iterable of (key, pickled value), copying values that were
+			never decoded straight from the snapshot
+		"""
+		for key, value in self._decoded.iteritems():
+			yield key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+		for key, (offset, length) in self._encoded.iteritems():
+			yield key, self._map[offset:offset+length]
+
+	def _release_if_decoded(self):
+		if self._map is not None and not self._encoded:
+			self._map.close()
+			self._map = None
+
+
+def _encode_items(data):
+	if isinstance(data, LazyMapping):
+		return data.iter_encoded()
+	else:
+		return (
+			(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+			for key, value in data.iteritems()
+		)
+
+
+def _write_snapshot(f, data, generation, journalEnd = None):
+	_write_encoded_snapshot(f, _encode_items(data), generation, journalEnd)
+
+
+def _write_encoded_snapshot(f, encodedItems, generation, journalEnd = None):
+	"""
+	@param journalEnd (generation, offset) of the journal the snapshot
+		includes everything up to
+	"""
+	f.write(_SNAPSHOT_MAGIC)
+	index = {}
+	for key, encodedValue in encodedItems:
+		index[key] = (f.tell(), len(encodedValue))
+		f.write(encodedValue)
+	footerOffset = f.tell()
+	footer = (constants.__version__, constants.__build__, generation, index, journalEnd)
+	pickle.dump(footer, f, pickle.HIGHEST_PROTOCOL)
+	f.write(_FOOTER_OFFSET.pack(footerOffset))
+
+
+def read_snapshot(path, lazy = False):
+	"""
+	@returns (version, build, data, generation) with data being a LazyMapping
+		if lazy
+	@note Caches from before journaling are one pickled (version, build, data)
+		and treated as generation 0
+	"""
+	return _read_snapshot(path, lazy)[:4]
+
+
+def _read_snapshot(path, lazy):
+	"""
+	@returns (version, build, data, generation, journalEnd)
+	"""
+	with open(path, "rb") as f:
+		if f.read(len(_SNAPSHOT_MAGIC)) != _SNAPSHOT_MAGIC:
+			f.seek(0)
+			snapshot = pickle.load(f)
+			fileVersion, fileBuild, data = snapshot[:3]
+			generation = snapshot[3] if 3 < len(snapshot) else 0
+			if lazy:
+				lazyData = LazyMapping()
+				for key, value in data.iteritems():
+					lazyData[key] = value
+				data = lazyData
+			return fileVersion, fileBuild, data, generation, None
+		snapshotMap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+	footerStart = len(snapshotMap) - _FOOTER_OFFSET.size
+	footerOffset, = _FOOTER_OFFSET.unpack(snapshotMap[footerStart:])
+	footer = pickle.loads(snapshotMap[footerOffset:footerStart])
+	fileVersion, fileBuild, generation, index = footer[:4]
+	# Snapshots from before journalEnd was noted
+	journalEnd = footer[4] if 4 < len(footer) else None
+	data = LazyMapping(snapshotMap, index)
+	if not lazy:
+		data = dict(data.iteritems())
+		snapshotMap.close()
+	return fileVersion, fileBuild, data, generation, journalEnd
+
+
+def write_snapshot(path, data):
+	"""
+	Write data as a snapshot for caches too small to need a journal
+	"""
+	_write_atomically(path, lambda f: _write_snapshot(f, data, 0))
+
+
+def _write_atomically(path, write):
+	tempPath = path + ".tmp"
+	_write_durably(tempPath, write)
+	os.rename(tempPath, path)
+
+
+def _write_durably(path, write):
+	with open(path, "wb") as f:
+		write(f)
+		f.flush()
+		os.fsync(f.fileno())
+
+
+class Journal(object):
+
+	"""
+	>>> import tempfile
+	>>> path = tempfile.mktemp()
+	>>> j = Journal(path, misc_utils.parse_version("0.0.0"))
+	>>> j.snapshot({"a": 1})
+	>>> j.append(("set", "b", 2))
+	False
+	>>> snapshotPath, write = j.start_snapshot({"a": 1, "b": 2})
+	>>> j.append(("set", "c", 3))
+	False
+	>>> write()
+	>>> j.finish_snapshot(snapshotPath)
+	>>> j.close()
+	>>> j = Journal(path, misc_utils.parse_version("0.0.0"))
+	>>> data, records = j.load()
+	>>> sorted(data.iteritems()), records
+	([('a', 1), ('b', 2)], [('set', 'c', 3)])
+
+	Crashing once the new snapshot is in place but before its journal is
+	loses nothing, the end of the old journal is replayed on the new snapshot
+
+	>>> snapshotPath, write = j.start_snapshot({"a": 1, "b": 2, "c": 3})
+	>>> j.append(("set", "d", 4))
+	False
+	>>> write()
+	>>> j.close()
+	>>> os.rename(snapshotPath, path)
+	>>> data, records = Journal(path, misc_utils.parse_version("0.0.0")).load()
+	>>> sorted(data.iteritems()), records
+	([('a', 1), ('b', 2), ('c', 3)], [('set', 'd', 4)])
+	>>> data, records = Journal(path, misc_utils.parse_version("0.0.0")).load()
+	>>> records
+	[('set', 'd', 4)]
+	>>> for suffix in ("", ".journal"):
+	... 	os.remove(path + suffix)
+	"""
+
+	SNAPSHOT_AFTER_RECORDS = 200
+	SNAPSHOT_AFTER_BYTES = 1024 * 1024
+
+	def __init__(self, path, oldestCompatibleVersion, name = ""):
+		self._path = path
+		self._journalPath = path + ".journal"
+		self._oldestCompatibleVersion = oldestCompatibleVersion
+		self._name = name
+
+		self._generation = 0
+		self._file = None
+		self._goodLength = 0
+		self._recordCount = 0
+		self._byteCount = 0
+
+		self._snapshotCount = 0
+		self._pendingSnapshotPath = None
+		self._pendingRecords = None
+
+	@property
+	def path(self):
+		return self._path
+
+	@property
+	def isSnapshotting(self):
+		return self._pendingSnapshotPath is not None
+
+	def load(self, lazy = False):
+		"""
+		@param lazy Return the snapshot as a LazyMapping
+		@returns (data, records) with data being None when there is no
+			usable snapshot and records the journaled changes to replay on top
+		"""
+		data = None
+		journalEnd = None
+		try:
+			fileVersion, fileBuild, snapshotData, generation, snapshotJournalEnd = _read_snapshot(self._path, lazy)
+		except (pickle.PickleError, EnvironmentError, EOFError, ValueError, struct.error):
+			_moduleLogger.exception("%s While loading snapshot" % self._name)
+		else:
+			if self._is_compatible(fileVersion):
+				data = snapshotData
+				self._generation = generation
+				journalEnd = snapshotJournalEnd
+			else:
+				_moduleLogger.debug(
+					"%s Skipping snapshot due to version mismatch (%s-%s)" % (
+						self._name, fileVersion, fileBuild
+					)
+				)
+
+		records = []
+		self._goodLength = 0
+		isPreviousJournal = False
+		try:
+			with open(self._journalPath, "rb") as f:
+				recordIter = _read_records(f)
+				try:
+					(fileVersion, fileBuild, generation), offset = recordIter.next()
+				except StopIteration:
+					_moduleLogger.info("%s Journal is missing its header" % self._name)
+				else:
+					if not self._is_compatible(fileVersion):
+						_moduleLogger.debug(
+							"%s Skipping journal due to version mismatch (%s-%s)" % (
+								self._name, fileVersion, fileBuild
+							)
+						)
+					elif generation == self._generation:
+						self._goodLength = offset
+						for record, offset in recordIter:
+							records.append(record)
+							self._goodLength = offset
+					elif journalEnd is not None and generation == journalEnd[0]:
+						# The snapshot was swapped in but its journal never was
+						_moduleLogger.info("%s Recovering journal from generation %r" % (self._name, generation))
+						isPreviousJournal = True
+						for record, offset in recordIter:
+							if journalEnd[1] < offset:
+								records.append(record)
+					else:
+						_moduleLogger.info(
+							"%s Skipping journal from generation %r, snapshot is %r" % (
+								self._name, generation, self._generation
+							)
+						)
+		except IOError:
+			_moduleLogger.debug("%s No journal" % self._name)
+		if isPreviousJournal:
+			self._start_journal(records)
+			self.close()
+		else:
+			self._recordCount = len(records)
+			self._byteCount = self._goodLength
+		_moduleLogger.info("%s Replaying %d journaled changes" % (self._name, len(records)))
+		return data, records
+
+	def append(self, record):
+		"""
+		@returns If a snapshot is due
+		"""
+		if self._file is None:
+			self._open()
+		self._write_record(record)
+		if self._pendingRecords is not None:
+			self._pendingRecords.append(record)
+		return self.is_snapshot_due()
+
+	def is_snapshot_due(self):
+		return (
+			self.SNAPSHOT_AFTER_RECORDS <= self._recordCount or
+			self.SNAPSHOT_AFTER_BYTES <= self._byteCount
+		)
+
+	def snapshot(self, data):
+		"""
+		Replace the snapshot with data, emptying the journal
+		"""
+		self.abort_snapshot()
+		self.close()
+		journalEnd = self._generation, self._byteCount
+		self._generation += 1
+		generation = self._generation
+		_write_atomically(self._path, lambda f: _write_snapshot(f, data, generation, journalEnd))
+		self._start_journal()
+
+	def start_snapshot(self, data):
+		"""
+		Replace the snapshot with data without waiting on the disk here
+
+		data is encoded now, so it is free to change afterwards, and write
+		does the writing, from any thread.  Once it is done, snapshotPath is
+		passed to finish_snapshot, back on this thread, to switch over to the
+		new snapshot, or to abort_snapshot if it failed.  Until then changes
+		keep going to the current journal, so nothing is lost if the write
+		never finishes.
+
+		@returns (snapshotPath, write)
+		"""
+		assert not self.isSnapshotting
+		encodedItems = list(_encode_items(data))
+		journalEnd = self._generation, self._byteCount
+		generation = self._generation + 1
+		self._snapshotCount += 1
+		snapshotPath = "%s.%d.pending" % (self._path, self._snapshotCount)
+		self._pendingSnapshotPath = snapshotPath
+		self._pendingRecords = []
+
+		def write():
+			_write_durably(snapshotPath, lambda f: _write_encoded_snapshot(f, encodedItems, generation, journalEnd))
+		return snapshotPath, write
+
+	def finish_snapshot(self, snapshotPath):
+		if snapshotPath != self._pendingSnapshotPath:
+			_moduleLogger.info("%s Dropping snapshot replaced by a later one" % self._name)
+			self._remove_pending(snapshotPath)
+			return
+		pendingRecords = self._pendingRecords
+		self._pendingSnapshotPath = None
+		self._pendingRecords = None
+
+		self.close()
+		# Until the new journal replaces it, the old one is replayed from
+		# where the snapshot ends, so a crash in between loses nothing
+		os.rename(snapshotPath, self._path)
+		self._generation += 1
+		# Changes made while the snapshot was written aren't in it
+		self._start_journal(pendingRecords)
+
+	def abort_snapshot(self, snapshotPath = None):
+		"""
+		@param snapshotPath Only abort if it is still this snapshot pending
+		"""
+		if snapshotPath is None:
+			snapshotPath = self._pendingSnapshotPath
+		if snapshotPath is None:
+			return
+		if snapshotPath == self._pendingSnapshotPath:
+			self._pendingSnapshotPath = None
+			self._pendingRecords = None
+		self._remove_pending(snapshotPath)
+
+	def close(self):
+		if self._file is not None:
+			self._file.close()
+			self._file = None
+
+	def _open(self):
+		if self._goodLength:
+			# Drop anything after the last good record before appending
+			self._file = open(self._journalPath, "r+b")
+			self._file.truncate(self._goodLength)
+			self._file.seek(self._goodLength)
+		else:
+			self._start_journal()
+
+	def _write_record(self, record):
+		encodedRecord = _encode_record(record)
+		self._file.write(encodedRecord)
+		self._file.flush()
+		self._recordCount += 1
+		self._byteCount += len(encodedRecord)
+
+	def _remove_pending(self, snapshotPath):
+		try:
+			os.remove(snapshotPath)
+		except OSError:
+			pass
+
+	def _start_journal(self, records = ()):
+		encodedRecords = [_encode_record((constants.__version__, constants.__build__, self._generation))]
+		encodedRecords.extend(_encode_record(record) for record in records)
+		contents = "".join(encodedRecords)
+		_write_atomically(self._journalPath, lambda f: f.write(contents))
+		self._file = open(self._journalPath, "ab")
+		self._goodLength = len(contents)
+		self._recordCount = len(encodedRecords) - 1
+		self._byteCount = len(contents)
+
+	def _is_compatible(self, fileVersion):
+		return misc_utils.compare_versions(
+			self._oldestCompatibleVersion,
+			misc_utils.parse_version(fileVersion),
+		) <= 0
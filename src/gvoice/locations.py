@@ -80,7 +80,9 @@ class Locations(object):
 		try:
 			return self._locations[number]
 		except KeyError:
-			le = gobject_utils.AsyncLinearExecution(self._asyncPool, self._request_location)
+			le = gobject_utils.AsyncLinearExecution(
+				self._asyncPool, self._request_location, gobject_utils.AsyncPool.PRIORITY_BACKGROUND
+			)
 			le.start(number)
 			return None
 
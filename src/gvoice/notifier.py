@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""
+Sources of "something changed on the server" to update on instead of polling
+
+A notifier has changeSignalHandler, sending (notifier, ) when the server
+reports a change, and availabilitySignalHandler, sending
+(notifier, isAvailable) when it gains or loses its connection so the caller
+can fall back to polling.  Both send from the main loop.
+"""
+
+import time
+import urllib
+import urllib2
+import threading
+import logging
+
+import util.coroutines as coroutines
+import util.go_utils as gobject_utils
+import util.misc as misc_utils
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+
+class LongPollNotifier(object):
+	"""
+	Holds a long poll open against url
+
+	Each request is "url?cursor=<last cursor>", which the server holds until
+	something changes (or it gives up, well under the 45s socket timeout) and
+	answers with the current cursor.  A new cursor means something changed.
+	Fetches are at least MIN_FETCH_INTERVAL apart, so a server that answers
+	right away doesn't have us spinning.
+	"""
+
+	MIN_RETRY_DELAY = 5
+	MAX_RETRY_DELAY = 5 * 60
+	MIN_FETCH_INTERVAL = MIN_RETRY_DELAY
+
+	def __init__(self, url, fetch = None):
+		"""
+		@param fetch Function (url, cursor) -> cursor, blocking
+		"""
+		self._url = url
+		self._fetch = fetch if fetch is not None else self._fetch_url
+		self._generation = 0
+		self._isAvailable = False
+
+		self.changeSignalHandler = coroutines.CoTee()
+		self.availabilitySignalHandler = coroutines.CoTee()
+
+	@property
+	def isAvailable(self):
+		return self._isAvailable
+
+	def start(self):
+		self._generation += 1
+		thread = threading.Thread(target=self._run, args=(self._generation, ))
+		thread.setDaemon(True)
+		thread.start()
+
+	def stop(self):
+		# The thread notices on its next response, any signals it sends
+		# before then are dropped
+		self._generation += 1
+		self._set_availability(self._generation, False)
+
+	def _run(self, generation):
+		cursor = None
+		retryDelay = self.MIN_RETRY_DELAY
+		while generation == self._generation:
+			fetchStart = time.time()
+			try:
+				newCursor = self._fetch(self._url, cursor if cursor is not None else "")
+			except Exception, e:
+				_moduleLogger.info("Notifier unavailable, retrying in %ds: %s" % (retryDelay, e))
+				self._report_availability(generation, False)
+				time.sleep(retryDelay)
+				retryDelay = min(2 * retryDelay, self.MAX_RETRY_DELAY)
+				continue
+			retryDelay = self.MIN_RETRY_DELAY
+
+			self._report_availability(generation, True)
+			if cursor is not None and newCursor != cursor:
+				self._report_change(generation)
+			cursor = newCursor
+
+			remaining = self.MIN_FETCH_INTERVAL - (time.time() - fetchStart)
+			if 0 < remaining:
+				time.sleep(remaining)
+
+	@gobject_utils.async
+	@misc_utils.log_exception(_moduleLogger)
+	def _report_availability(self, generation, isAvailable):
+		self._set_availability(generation, isAvailable)
+
+	@gobject_utils.async
+	@misc_utils.log_exception(_moduleLogger)
+	def _report_change(self, generation):
+		if generation != self._generation:
+			return
+		_moduleLogger.debug("Notified of a change")
+		self.changeSignalHandler.stage.send((self, ))
+
+	def _set_availability(self, generation, isAvailable):
+		if generation != self._generation or isAvailable == self._isAvailable:
+			return
+		_moduleLogger.info("Notifier %s" % ("available" if isAvailable else "unavailable", ))
+		self._isAvailable = isAvailable
+		self.availabilitySignalHandler.stage.send((self, isAvailable))
+
+	@staticmethod
+	def _fetch_url(url, cursor):
+		f = urllib2.urlopen("%s?%s" % (url, urllib.urlencode({"cursor": cursor})))
+		try:
+			return f.read().strip()
+		finally:
+			f.close()
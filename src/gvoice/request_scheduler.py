@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+
+"""
+Process wide throttling of the requests made to Google Voice
+
+Every connection in the process polls with the same defaults and starts
+polling when it connects, so left alone they fire in bursts.  Requests go
+through one RequestScheduler which spreads polls out with random jitter,
+limits their overall rate with a token bucket and caps how many requests to
+one endpoint are in flight at once.  User actions (sending, calling, logging
+in) never wait behind polls, they go straight out and polls make up for them
+afterwards.
+"""
+
+from __future__ import with_statement
+
+import time
+import random
+import urlparse
+import threading
+import contextlib
+import logging
+
+import util.metrics as metrics
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+
+def to_endpoint(url):
+	"""
+	@returns What requests are grouped by for the concurrency cap and metrics
+
+	>>> to_endpoint("https://www.google.com/voice/inbox/recent/sms/?page=2")
+	'www.google.com/voice/inbox/recent/sms/'
+	"""
+	parts = urlparse.urlsplit(url)
+	return parts.netloc + parts.path
+
+
+class RequestScheduler(object):
+	"""
+	@note Requests block the calling thread while waiting their turn, so this
+		is meant for the worker threads of gobject_utils.AsyncPool
+	@note The limits are per connection, scaled by how many are registered
+		with add_client
+
+	>>> clock = [0.0]
+	>>> def sleep(seconds):
+	... 	clock[0] += seconds
+	>>> scheduler = RequestScheduler(rate=1, burst=2, maxJitter=3, endpointConcurrency=1,
+	... 	timeSource=lambda: clock[0], sleep=sleep, jitter=lambda maxJitter: maxJitter)
+	>>> with scheduler.request("https://www.google.com/voice/m"):
+	... 	pass
+	>>> with scheduler.request("https://www.google.com/voice/inbox/recent/sms/", isPoll=True):
+	... 	pass
+	>>> clock[0]
+	3.0
+	>>> metrics = scheduler.get_metrics()
+	>>> metrics["requests"], metrics["polls"], metrics["maxWait"], metrics["queueDepth"]
+	(2, 1, 3.0, 0)
+
+	User actions go out even with no tokens left, polls wait for them to be
+	paid back
+	>>> scheduler = RequestScheduler(rate=1, burst=1, maxJitter=0, endpointConcurrency=1,
+	... 	timeSource=lambda: clock[0], sleep=sleep)
+	>>> start = clock[0]
+	>>> with scheduler.request("https://www.google.com/voice/sms/send/"):
+	... 	with scheduler.request("https://www.google.com/voice/sms/send/"):
+	... 		clock[0] - start
+	0.0
+	>>> with scheduler.request("https://www.google.com/voice/inbox/recent/sms/", isPoll=True):
+	... 	clock[0] - start
+	2.0
+
+	Each connection brings its own share of the limits
+	>>> scheduler.add_client()
+	>>> scheduler.add_client()
+	>>> scheduler.rate, scheduler.burst, scheduler.endpointConcurrency
+	(2.0, 2, 2)
+	>>> scheduler.remove_client()
+	>>> scheduler.rate, scheduler.burst, scheduler.endpointConcurrency
+	(1.0, 1, 1)
+	"""
+
+	DEFAULT_RATE = 2.0
+	DEFAULT_BURST = 10
+	DEFAULT_MAX_JITTER = 3.0
+	DEFAULT_ENDPOINT_CONCURRENCY = 2
+
+	def __init__(
+		self,
+		rate = DEFAULT_RATE,
+		burst = DEFAULT_BURST,
+		maxJitter = DEFAULT_MAX_JITTER,
+		endpointConcurrency = DEFAULT_ENDPOINT_CONCURRENCY,
+		timeSource = time.time,
+		sleep = time.sleep,
+		jitter = None,
+	):
+		"""
+		@param rate Requests per second to sustain, per connection
+		@param burst Requests that may go out at once after being idle, per
+			connection
+		@param maxJitter Most seconds a poll is delayed by
+		@param endpointConcurrency Most polls in flight per endpoint, per
+			connection
+		"""
+		assert 0 < rate and 1 <= burst and 0 <= maxJitter and 1 <= endpointConcurrency
+		self._baseRate = float(rate)
+		self._baseBurst = burst
+		self._maxJitter = maxJitter
+		self._baseEndpointConcurrency = endpointConcurrency
+		self._clientCount = 0
+		self._timeSource = timeSource
+		self._sleep = sleep
+		self._jitter = jitter if jitter is not None else lambda maxJitter: random.uniform(0, maxJitter)
+
+		self._condition = threading.Condition()
+		self._tokens = float(burst)
+		self._lastRefill = timeSource()
+		self._inFlight = {}
+
+		self._queueDepth = 0
+		self.reset_metrics()
+
+	@property
+	def rate(self):
+		return self._baseRate * max(1, self._clientCount)
+
+	@property
+	def burst(self):
+		return self._baseBurst * max(1, self._clientCount)
+
+	@property
+	def endpointConcurrency(self):
+		return self._baseEndpointConcurrency * max(1, self._clientCount)
+
+	def add_client(self):
+		"""
+		A connection started making requests
+		"""
+		with self._condition:
+			self._clientCount += 1
+			self._condition.notifyAll()
+
+	def remove_client(self):
+		with self._condition:
+			assert 0 < self._clientCount
+			self._clientCount -= 1
+			self._condition.notifyAll()
+
+	@contextlib.contextmanager
+	def request(self, url, isPoll = False):
+		"""
+		Waits until the request to url may be made, for the duration of the
+		with block
+
+		@param isPoll False for user actions, which never wait
+		"""
+		endpoint = to_endpoint(url)
+		start = self._timeSource()
+		with self._condition:
+			self._queueDepth += 1
+			self._maxQueueDepth = max(self._maxQueueDepth, self._queueDepth)
+		try:
+			if isPoll:
+				if self._maxJitter:
+					self._sleep(self._jitter(self._maxJitter))
+				self._acquire(endpoint)
+			else:
+				self._acquire_now(endpoint)
+		finally:
+			with self._condition:
+				self._queueDepth -= 1
+
+		wait = self._timeSource() - start
+		with self._condition:
+			self._requestCount += 1
+			if isPoll:
+				self._pollCount += 1
+			self._totalWait += wait
+			self._maxWait = max(self._maxWait, wait)
+		try:
+			yield
+		finally:
+			self._release(endpoint)
+
+	def get_metrics(self):
+		"""
+		@returns Dict of how requests have been waiting since the last reset
+		"""
+		with self._condition:
+			return {
+				"requests": self._requestCount,
+				"polls": self._pollCount,
+				"queueDepth": self._queueDepth,
+				"maxQueueDepth": self._maxQueueDepth,
+				"totalWait": self._totalWait,
+				"maxWait": self._maxWait,
+				"meanWait": self._totalWait / self._requestCount if self._requestCount else 0.0,
+				"inFlight": dict(self._inFlight),
+			}
+
+	def reset_metrics(self):
+		with self._condition:
+			self._requestCount = 0
+			self._pollCount = 0
+			self._maxQueueDepth = self._queueDepth
+			self._totalWait = 0.0
+			self._maxWait = 0.0
+
+	def _acquire(self, endpoint):
+		with self._condition:
+			while True:
+				self._refill()
+				isEndpointFree = self._inFlight.get(endpoint, 0) < self.endpointConcurrency
+				if isEndpointFree and 1 <= self._tokens:
+					self._tokens -= 1
+					self._inFlight[endpoint] = self._inFlight.get(endpoint, 0) + 1
+					return
+				if isEndpointFree:
+					delay = (1 - self._tokens) / self.rate
+					# Sleep rather than wait with the lock as a fake clock
+					# can't move forward in a condition wait
+					self._condition.release()
+					try:
+						self._sleep(delay)
+					finally:
+						self._condition.acquire()
+				else:
+					self._condition.wait()
+
+	def _acquire_now(self, endpoint):
+		with self._condition:
+			self._refill()
+			# Still counted, so the polls behind it slow down to make up for it
+			self._tokens -= 1
+			self._inFlight[endpoint] = self._inFlight.get(endpoint, 0) + 1
+
+	def _release(self, endpoint):
+		with self._condition:
+			inFlight = self._inFlight[endpoint] - 1
+			if inFlight:
+				self._inFlight[endpoint] = inFlight
+			else:
+				del self._inFlight[endpoint]
+			self._condition.notifyAll()
+
+	def _refill(self):
+		now = self._timeSource()
+		elapsed = max(0.0, now - self._lastRefill)
+		self._lastRefill = now
+		self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+
+
+_scheduler = None
+_schedulerLock = threading.Lock()
+
+
+def get_scheduler():
+	"""
+	@returns The scheduler shared by everything in the process
+	"""
+	global _scheduler
+	with _schedulerLock:
+		if _scheduler is None:
+			_scheduler = RequestScheduler()
+			metrics.get_registry().register_provider(
+				"scheduler", _scheduler.get_metrics, _scheduler.reset_metrics
+			)
+		return _scheduler
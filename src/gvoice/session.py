@@ -7,7 +7,10 @@ import logging
 import addressbook
 import conversations
 import state_machine
+import journal
+import request_scheduler
 
+import util.coroutines as coroutines
 import util.go_utils as gobject_utils
 import util.misc as misc_utils
 
@@ -25,7 +28,18 @@ class Session(object):
 
 	_MINIMUM_MESSAGE_PERIOD = state_machine.to_seconds(minutes=30)
 
-	def __init__(self, cookiePath = None, defaults = None):
+	_DND_CACHE_PERIOD = state_machine.to_seconds(seconds=30)
+	_DND_REFRESH_TIMEOUT = state_machine.to_seconds(minutes=1)
+
+	_TEXTS_TARGET_LATENCY = state_machine.to_seconds(minutes=1)
+
+	def __init__(self, cookiePath = None, defaults = None, retentionPolicy = None, textsNotifier = None, adaptiveTextsPolling = False):
+		"""
+		@param textsNotifier Optional notifier (see notifier.py) of new texts,
+			polling only as a safety net while it is available
+		@param adaptiveTextsPolling Poll for texts based on how often they
+			arrive rather than backing off geometrically
+		"""
 		if defaults is None:
 			defaults = self._DEFAULTS
 		else:
@@ -40,10 +54,17 @@ class Session(object):
 
 		self._lastDndCheck = 0
 		self._cachedIsDnd = False
+		self._isDndRefreshing = False
+		self._dndSetCount = 0
+		self.dndSignalHandler = coroutines.CoTee()
 
-		self._asyncPool = gobject_utils.AsyncPool()
+		# Polls get two workers and user actions always have one to themselves
+		self._asyncPool = gobject_utils.AsyncPool(workerCount = 3)
 		import backend
-		self._backend = backend.GVoiceBackend(self._cookiePath)
+		# Shared with the other connections, which it is scaled by
+		self._requestScheduler = request_scheduler.get_scheduler()
+		self._isSchedulerClient = False
+		self._backend = backend.GVoiceBackend(self._cookiePath, requestScheduler = self._requestScheduler)
 
 		if defaults["contacts"][0] == state_machine.UpdateStateMachine.INFINITE_PERIOD:
 			contactsPeriodInSeconds = state_machine.UpdateStateMachine.INFINITE_PERIOD
@@ -74,7 +95,9 @@ class Session(object):
 				**{defaults["voicemail"][1]: defaults["voicemail"][0],}
 			)
 			idleVoicemailPeriodInSeconds = max(voicemailPeriodInSeconds * 4, self._MINIMUM_MESSAGE_PERIOD)
-		self._voicemails = conversations.Conversations(self._backend.get_voicemails, self._asyncPool)
+		self._voicemails = conversations.Conversations(
+			self._backend.get_voicemails, self._asyncPool, retentionPolicy
+		)
 		self._voicemailsStateMachine = state_machine.UpdateStateMachine([self.voicemails], "Voicemail")
 		self._voicemailsStateMachine.set_state_strategy(
 			state_machine.StateMachine.STATE_DND,
@@ -94,11 +117,17 @@ class Session(object):
 			self._voicemailsStateMachine.request_reset_timers
 		)
 
+		# How often texts arrive for this account, learned across sessions
+		self._textsArrivalRates = state_machine.ArrivalRateEstimator(
+			halfLife = state_machine.to_seconds(hours=7*24),
+			priorRate = 1.0 / state_machine.to_seconds(hours=1),
+			priorExposure = state_machine.to_seconds(hours=1),
+		)
 		if defaults["texts"][0] == state_machine.UpdateStateMachine.INFINITE_PERIOD:
-			initTextsPeriodInSeconds = state_machine.UpdateStateMachine.INFINITE_PERIOD
-			minTextsPeriodInSeconds = state_machine.UpdateStateMachine.INFINITE_PERIOD
-			textsPeriodInSeconds = state_machine.UpdateStateMachine.INFINITE_PERIOD
 			idleTextsPeriodInSeconds = state_machine.UpdateStateMachine.INFINITE_PERIOD
+			activeTextsStrategy = state_machine.ConstantStateStrategy(
+				state_machine.UpdateStateMachine.INFINITE_PERIOD
+			)
 		else:
 			initTextsPeriodInSeconds = state_machine.to_seconds(seconds=20)
 			minTextsPeriodInSeconds = state_machine.to_seconds(seconds=1)
@@ -106,7 +135,28 @@ class Session(object):
 				**{defaults["texts"][1]: defaults["texts"][0],}
 			)
 			idleTextsPeriodInSeconds = max(textsPeriodInSeconds * 4, self._MINIMUM_MESSAGE_PERIOD)
-		self._texts = conversations.Conversations(self._backend.get_texts, self._asyncPool)
+			if adaptiveTextsPolling:
+				activeTextsStrategy = state_machine.AdaptiveStateStrategy(
+					self._textsArrivalRates,
+					self._TEXTS_TARGET_LATENCY,
+					initTextsPeriodInSeconds,
+					textsPeriodInSeconds,
+				)
+			else:
+				activeTextsStrategy = state_machine.GeometricStateStrategy(
+					initTextsPeriodInSeconds,
+					minTextsPeriodInSeconds,
+					textsPeriodInSeconds,
+				)
+		self._texts = conversations.Conversations(
+			self._backend.get_texts, self._asyncPool, retentionPolicy
+		)
+		self._textsArrivalCallback = coroutines.func_sink(
+			coroutines.expand_positional(
+				self._on_texts_arrived
+			)
+		)
+		self._texts.updateSignalHandler.register_sink(self._textsArrivalCallback)
 		self._textsStateMachine = state_machine.UpdateStateMachine([self.texts], "Texting")
 		self._textsStateMachine.set_state_strategy(
 			state_machine.StateMachine.STATE_DND,
@@ -118,12 +168,19 @@ class Session(object):
 		)
 		self._textsStateMachine.set_state_strategy(
 			state_machine.StateMachine.STATE_ACTIVE,
-			state_machine.GeometricStateStrategy(
-				initTextsPeriodInSeconds,
-				minTextsPeriodInSeconds,
-				textsPeriodInSeconds,
+			activeTextsStrategy,
+		)
+		self._activeTextsStrategy = activeTextsStrategy
+		self._notifiedTextsStrategy = state_machine.ConstantStateStrategy(idleTextsPeriodInSeconds)
+		self._textsNotifier = textsNotifier
+		self._textsNotifierCallback = coroutines.func_sink(
+			coroutines.expand_positional(
+				self._on_texts_notifier_availability
 			)
 		)
+		if self._textsNotifier is not None:
+			self._texts.set_notifier(self._textsNotifier)
+			self._textsNotifier.availabilitySignalHandler.register_sink(self._textsNotifierCallback)
 		self._texts.updateSignalHandler.register_sink(
 			self._textsStateMachine.request_reset_timers
 		)
@@ -134,14 +191,65 @@ class Session(object):
 		self._masterStateMachine.append_machine(self._textsStateMachine)
 
 	def load(self, path):
+		self._addressbook.load(os.sep.join((path, "contacts.cache")))
 		self._texts.load(os.sep.join((path, "texts.cache")))
 		self._voicemails.load(os.sep.join((path, "voicemails.cache")))
+		self._load_arrival_rates(os.sep.join((path, "polling.cache")))
 
 	def save(self, path):
+		self._addressbook.save(os.sep.join((path, "contacts.cache")))
 		self._texts.save(os.sep.join((path, "texts.cache")))
 		self._voicemails.save(os.sep.join((path, "voicemails.cache")))
+		self._save_arrival_rates(os.sep.join((path, "polling.cache")))
+
+	def _load_arrival_rates(self, path):
+		try:
+			fileVersion, fileBuild, rates, generation = journal.read_snapshot(path)
+			self._textsArrivalRates.set_state(rates["texts"])
+		except IOError:
+			_moduleLogger.info("No polling cache")
+		except Exception:
+			_moduleLogger.exception("While loading polling cache")
+		self._textsArrivalRates.start_observing()
+
+	def _save_arrival_rates(self, path):
+		self._textsArrivalRates.observe()
+		try:
+			journal.write_snapshot(path, {"texts": self._textsArrivalRates.get_state()})
+		except (IOError, OSError):
+			_moduleLogger.exception("While saving polling cache")
+
+	@misc_utils.log_exception(_moduleLogger)
+	def _on_texts_arrived(self, texts, updatedIds):
+		if not texts.hasDoneUpdate:
+			# The first sync is catching up on whatever arrived while away
+			return
+		incomingCount = sum(
+			1
+			for convs in texts.get_last_appended().itervalues()
+			for conv in convs
+			for message in conv.messages
+			if not conversations.is_message_from_self(message)
+		)
+		if incomingCount:
+			self._textsArrivalRates.record_arrival(incomingCount)
+
+	@misc_utils.log_exception(_moduleLogger)
+	def _on_texts_notifier_availability(self, notifier, isAvailable):
+		if isAvailable:
+			_moduleLogger.info("Texts notifier available, slowing texts polling")
+			strategy = self._notifiedTextsStrategy
+		else:
+			_moduleLogger.info("Texts notifier unavailable, falling back to texts polling")
+			strategy = self._activeTextsStrategy
+		self._textsStateMachine.set_state_strategy(state_machine.StateMachine.STATE_ACTIVE, strategy)
+		self._textsStateMachine.reset_timers(initialize=True)
 
 	def close(self):
+		if self._textsNotifier is not None:
+			self._textsNotifier.availabilitySignalHandler.unregister_sink(self._textsNotifierCallback)
+			self._texts.set_notifier(None)
+		self._texts.updateSignalHandler.unregister_sink(self._textsArrivalCallback)
 		self._voicemails.updateSignalHandler.unregister_sink(
 			self._voicemailsStateMachine.request_reset_timers
 		)
@@ -189,13 +297,24 @@ class Session(object):
 			if isLoggedIn:
 				_moduleLogger.info("Logged in through credentials")
 
+		if not self._isSchedulerClient:
+			self._requestScheduler.add_client()
+			self._isSchedulerClient = True
 		self._masterStateMachine.start()
+		if self._textsNotifier is not None:
+			self._textsNotifier.start()
 		on_success(isLoggedIn)
 
 	def shutdown(self):
 		self._asyncPool.stop()
 		self._masterStateMachine.stop()
+		if self._textsNotifier is not None:
+			self._textsNotifier.stop()
 		self._backend.shutdown()
+		self._leave_scheduler()
+		# The pool drops queued tasks without calling back, so a refresh
+		# that was waiting would otherwise never clear this
+		self._isDndRefreshing = False
 
 		self._username = None
 		self._password = None
@@ -203,11 +322,20 @@ class Session(object):
 	def logout(self):
 		self._asyncPool.stop()
 		self._masterStateMachine.stop()
+		if self._textsNotifier is not None:
+			self._textsNotifier.stop()
 		self._backend.logout()
+		self._isDndRefreshing = False
+		self._leave_scheduler()
 
 		self._username = None
 		self._password = None
 
+	def _leave_scheduler(self):
+		if self._isSchedulerClient:
+			self._requestScheduler.remove_client()
+			self._isSchedulerClient = False
+
 	def is_logged_in(self):
 		if self._username is None and self._password is None:
 			_moduleLogger.info("Hasn't even attempted to login yet")
@@ -219,18 +347,52 @@ class Session(object):
 			return isLoggedIn
 
 	def set_dnd(self, doNotDisturb):
+		# Any lookup already in flight could be from before this
+		self._dndSetCount += 1
 		if self._cachedIsDnd != doNotDisturb:
 			self._backend.set_dnd(doNotDisturb)
 			self._cachedIsDnd = doNotDisturb
+			self._lastDndCheck = time.time()
 
 	def is_dnd(self):
-		# To throttle checking with the server, use a 30s cache
+		"""
+		@returns The last known DND state, never blocking on the server
+		@note When it is older than 30s, it is refreshed in the background and
+			dndSignalHandler sends (session, isDnd) if it changed
+		"""
 		newTime = time.time()
-		if self._lastDndCheck + 30 < newTime:
+		if self._lastDndCheck + self._DND_CACHE_PERIOD < newTime and not self._isDndRefreshing:
 			self._lastDndCheck = newTime
-			self._cachedIsDnd = self._backend.is_dnd()
+			self._isDndRefreshing = True
+			le = gobject_utils.AsyncLinearExecution(
+				self._asyncPool, self._refresh_dnd, gobject_utils.AsyncPool.PRIORITY_POLL,
+				timeout=self._DND_REFRESH_TIMEOUT,
+			)
+			le.start()
 		return self._cachedIsDnd
 
+	@misc_utils.log_exception(_moduleLogger)
+	def _refresh_dnd(self):
+		setCount = self._dndSetCount
+		try:
+			isDnd = yield (
+				self._backend.is_dnd,
+				(),
+				{},
+			)
+		except Exception:
+			_moduleLogger.exception("While checking DND")
+			return
+		finally:
+			self._isDndRefreshing = False
+
+		if setCount != self._dndSetCount:
+			_moduleLogger.debug("Ignoring DND lookup from before it was set")
+			return
+		if isDnd != self._cachedIsDnd:
+			self._cachedIsDnd = isDnd
+			self.dndSignalHandler.stage.send((self, isDnd))
+
 	@property
 	def backend(self):
 		assert self.is_logged_in()
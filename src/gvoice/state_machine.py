@@ -1,10 +1,13 @@
 #!/usr/bin/env python
 
+import time
+import math
 import logging
 
 import util.go_utils as gobject_utils
 import util.coroutines as coroutines
 import util.misc as misc_utils
+import util.metrics as metrics
 
 
 _moduleLogger = logging.getLogger(__name__)
@@ -165,6 +168,188 @@ class GeometricStateStrategy(object):
 		)
 
 
+class ArrivalRateEstimator(object):
+	"""
+	Exponentially weighted estimate of how often messages arrive, per hour of
+	the day
+
+	Time is observed until the next observation, so gaps between polls count
+	the same as watched time.  Old arrivals fade with halfLife worth of
+	observed time in that hour.
+
+	>>> clock = [0.0]
+	>>> estimator = ArrivalRateEstimator(to_seconds(hours=24), 0.0, 1, lambda: clock[0])
+	>>> estimator.start_observing()
+	>>> clock[0] = 600.0
+	>>> estimator.record_arrival()
+	>>> clock[0] = 1200.0
+	>>> round(estimator.rate() * 3600, 1)
+	3.0
+	>>> restored = ArrivalRateEstimator(to_seconds(hours=24), 0.0, 1, lambda: clock[0])
+	>>> restored.set_state(estimator.get_state())
+	>>> restored.rate() == estimator.rate()
+	True
+	"""
+
+	BUCKET_COUNT = 24
+
+	def __init__(self, halfLife, priorRate, priorExposure, timeSource = time.time):
+		"""
+		@param priorRate Arrivals per second to assume for hours without history
+		@param priorExposure Seconds of history the prior is worth
+		"""
+		self._halfLife = halfLife
+		self._priorRate = priorRate
+		self._priorExposure = priorExposure
+		self._timeSource = timeSource
+
+		self._arrivals = [0.0] * self.BUCKET_COUNT
+		self._exposures = [0.0] * self.BUCKET_COUNT
+		self._lastObserved = None
+
+	def start_observing(self):
+		self._lastObserved = self._timeSource()
+
+	def observe(self):
+		"""
+		Count the time since the last observation
+		"""
+		now = self._timeSource()
+		if self._lastObserved is not None:
+			start = self._lastObserved
+			while start < now:
+				end = min(now, self._next_bucket_start(start))
+				self._observe_bucket(self._bucket(start), end - start)
+				start = end
+		self._lastObserved = now
+
+	def record_arrival(self, count = 1):
+		self.observe()
+		self._arrivals[self._bucket(self._lastObserved)] += count
+
+	def rate(self):
+		"""
+		@returns Expected arrivals per second at this hour
+		"""
+		self.observe()
+		bucket = self._bucket(self._lastObserved)
+		return (
+			(self._arrivals[bucket] + self._priorRate * self._priorExposure) /
+			(self._exposures[bucket] + self._priorExposure)
+		)
+
+	def get_state(self):
+		return list(self._arrivals), list(self._exposures)
+
+	def set_state(self, state):
+		arrivals, exposures = state
+		assert len(arrivals) == len(exposures) == self.BUCKET_COUNT
+		self._arrivals = list(arrivals)
+		self._exposures = list(exposures)
+
+	def _observe_bucket(self, bucket, duration):
+		decay = 0.5 ** (duration / float(self._halfLife))
+		self._arrivals[bucket] *= decay
+		self._exposures[bucket] = self._exposures[bucket] * decay + duration
+
+	@staticmethod
+	def _bucket(when):
+		return time.localtime(when).tm_hour
+
+	@staticmethod
+	def _next_bucket_start(when):
+		"""
+		@returns When the next local hour starts, which isn't on a multiple of
+			3600 in timezones offset from UTC by a fraction of an hour
+
+		>>> start = time.mktime((2010, 10, 18, 14, 25, 30, 0, 0, -1))
+		>>> time.localtime(ArrivalRateEstimator._next_bucket_start(start + 0.5))[3:6]
+		(15, 0, 0)
+		"""
+		local = time.localtime(when)
+		secondsIntoHour = local.tm_min * 60 + local.tm_sec + (when - math.floor(when))
+		return when - secondsIntoHour + 3600
+
+
+class AdaptiveStateStrategy(object):
+	"""
+	Polls as rarely as the learned arrival rate allows while keeping message
+	latency near targetLatency
+
+	The period T is picked so each poll makes up for targetLatency seconds of
+	expected delay.  Messages arriving at rate r wait T / 2 on average, so a
+	period holds r * T * T / 2 seconds of delay, making T = sqrt(2 * targetLatency / r).
+	After messages arrive, polling drops to min and backs off geometrically to
+	T, like GeometricStateStrategy, for the replies that tend to follow.
+
+	>>> class FakeEstimator(object):
+	... 	arrivalRate = 0.0
+	... 	def rate(self):
+	... 		return self.arrivalRate
+	>>> estimator = FakeEstimator()
+	>>> strategy = AdaptiveStateStrategy(estimator, 60, 30, 3600)
+	>>> strategy.timeout
+	3600
+	>>> estimator.arrivalRate = 1.0 / 3600
+	>>> strategy.timeout
+	657
+	>>> estimator.arrivalRate = 1.0
+	>>> strategy.timeout
+	30
+	>>> estimator.arrivalRate = 1.0 / 3600
+	>>> strategy.reinitialize_state()
+	>>> timeouts = []
+	>>> for i in xrange(7):
+	... 	timeouts.append(strategy.timeout)
+	... 	strategy.increment_state()
+	>>> timeouts
+	[30, 60, 120, 240, 480, 657, 657]
+	"""
+
+	def __init__(self, estimator, targetLatency, min, max):
+		assert 0 < targetLatency
+		assert 0 < min and min < max
+		self._estimator = estimator
+		self._targetLatency = targetLatency
+		self._min = min
+		self._max = max
+		self._attemptCount = None
+
+	def initialize_state(self):
+		self._attemptCount = None
+
+	def reinitialize_state(self):
+		self._attemptCount = 0
+
+	def increment_state(self):
+		if self._attemptCount is not None:
+			self._attemptCount += 1
+			if self._max <= self._min * 2 ** self._attemptCount:
+				self._attemptCount = None
+
+	@property
+	def timeout(self):
+		rate = self._estimator.rate()
+		if 0 < rate:
+			timeout = math.sqrt(2 * self._targetLatency / rate)
+			timeout = int(max(self._min, min(timeout, self._max)))
+		else:
+			timeout = self._max
+		if self._attemptCount is not None:
+			timeout = min(self._min * 2 ** self._attemptCount, timeout)
+		return timeout
+
+	def __str__(self):
+		return "AdaptiveStateStrategy(timeout=%r)" % (
+			self.timeout
+		)
+
+	def __repr__(self):
+		return "AdaptiveStateStrategy(targetLatency=%r, min=%r, max=%r)" % (
+			self._targetLatency, self._min, self._max
+		)
+
+
 class StateMachine(object):
 
 	STATE_ACTIVE = 0, "active"
@@ -188,13 +373,169 @@ class StateMachine(object):
 		raise NotImplementedError("Abstract")
 
 
+class CoalescingScheduler(object):
+	"""
+	Shares one wakeup between timeouts that are due close together
+
+	When the earliest timeout is due, every other timeout due within tolerance
+	of it (or half its own period, if that is shorter) is run early along with
+	it, so the process and radio wake up once for the batch instead of once
+	per timeout.
+
+	>>> clock = [0.0]
+	>>> class FakeTimeout(object):
+	... 	def __init__(self, func):
+	... 		self.func = func
+	... 		self.seconds = None
+	... 	def start(self, seconds):
+	... 		self.seconds = seconds
+	... 	def cancel(self):
+	... 		self.seconds = None
+	>>> scheduler = CoalescingScheduler(60, lambda: clock[0], FakeTimeout)
+	>>> wakeup = scheduler._onWakeup
+	>>> ran = []
+	>>> texts = scheduler.create_timeout(lambda: ran.append("texts"))
+	>>> voicemails = scheduler.create_timeout(lambda: ran.append("voicemails"))
+	>>> contacts = scheduler.create_timeout(lambda: ran.append("contacts"))
+	>>> texts.start(seconds=300)
+	>>> voicemails.start(seconds=330)
+	>>> contacts.start(seconds=1800)
+	>>> wakeup.seconds
+	300
+	>>> clock[0] = 300.0
+	>>> wakeup.func()
+	>>> ran, texts.is_running(), voicemails.is_running(), contacts.is_running()
+	(['texts', 'voicemails'], False, False, True)
+	>>> wakeup.seconds
+	1500
+	>>> texts.start(seconds=60)
+	>>> wakeup.seconds
+	60
+	>>> texts.cancel()
+	>>> wakeup.seconds
+	1500
+	>>> contacts.cancel()
+	>>> wakeup.seconds is None
+	True
+	"""
+
+	DEFAULT_TOLERANCE = to_seconds(minutes=1)
+
+	def __init__(self, tolerance = DEFAULT_TOLERANCE, timeSource = time.time, timeoutFactory = gobject_utils.Timeout):
+		"""
+		@param timeoutFactory Creates the timeout wakeups are scheduled with,
+			like gobject_utils.Timeout
+		"""
+		self._tolerance = tolerance
+		self._timeSource = timeSource
+		self._pending = {}
+		self._isWaking = False
+		self._wakeupTime = None
+		self._onWakeup = timeoutFactory(self._on_wakeup)
+
+	def create_timeout(self, func):
+		"""
+		@returns Object like gobject_utils.Timeout that runs func from this
+			scheduler
+		"""
+		return _ScheduledTimeout(self, func)
+
+	def close(self):
+		self._pending.clear()
+		self._cancel_wakeup()
+
+	def _add(self, timeout, seconds):
+		self._pending[timeout] = (self._timeSource() + seconds, seconds)
+		if not self._isWaking:
+			self._schedule_wakeup()
+
+	def _remove(self, timeout):
+		if self._pending.pop(timeout, None) is not None and not self._isWaking:
+			self._schedule_wakeup()
+
+	def _is_pending(self, timeout):
+		return timeout in self._pending
+
+	def _schedule_wakeup(self):
+		if not self._pending:
+			self._cancel_wakeup()
+			return
+		dueTime = min(dueTime for (dueTime, period) in self._pending.itervalues())
+		if self._wakeupTime == dueTime:
+			return
+		self._cancel_wakeup()
+		seconds = max(0, int(math.ceil(dueTime - self._timeSource())))
+		self._onWakeup.start(seconds=seconds)
+		self._wakeupTime = dueTime
+
+	def _cancel_wakeup(self):
+		self._onWakeup.cancel()
+		self._wakeupTime = None
+
+	@misc_utils.log_exception(_moduleLogger)
+	def _on_wakeup(self):
+		self._wakeupTime = None
+		now = self._timeSource()
+		dueTimeouts = sorted(
+			(dueTime, timeout)
+			for (timeout, (dueTime, period)) in self._pending.iteritems()
+			if dueTime - min(self._tolerance, period / 2) <= now
+		)
+		if 1 < len(dueTimeouts):
+			_moduleLogger.info("Coalescing %d updates into one wakeup" % (len(dueTimeouts), ))
+
+		self._isWaking = True
+		try:
+			for dueTime, timeout in dueTimeouts:
+				del self._pending[timeout]
+			for dueTime, timeout in dueTimeouts:
+				timeout._run()
+		finally:
+			self._isWaking = False
+			self._schedule_wakeup()
+
+
+class _ScheduledTimeout(object):
+
+	def __init__(self, scheduler, func):
+		self._scheduler = scheduler
+		self._func = func
+
+	def start(self, **kwds):
+		assert not self.is_running()
+		assert len(kwds) == 1
+		timeoutInSeconds = kwds["seconds"]
+		assert 0 <= timeoutInSeconds
+		self._scheduler._add(self, timeoutInSeconds)
+
+	def is_running(self):
+		return self._scheduler._is_pending(self)
+
+	def cancel(self):
+		self._scheduler._remove(self)
+
+	def __call__(self, **kwds):
+		return self.start(**kwds)
+
+	def _run(self):
+		try:
+			self._func()
+		except Exception:
+			_moduleLogger.exception("Scheduled update failed")
+
+
 class MasterStateMachine(StateMachine):
 
-	def __init__(self):
+	def __init__(self, tolerance = CoalescingScheduler.DEFAULT_TOLERANCE):
 		self._machines = []
 		self._state = self.STATE_ACTIVE
+		self._scheduler = CoalescingScheduler(tolerance)
 
 	def append_machine(self, machine):
+		"""
+		@note The machine's updates are coalesced with the other machines'
+		"""
+		machine.set_scheduler(self._scheduler)
 		self._machines.append(machine)
 
 	def start(self):
@@ -211,6 +552,7 @@ class MasterStateMachine(StateMachine):
 	def close(self):
 		for machine in self._machines:
 			machine.close()
+		self._scheduler.close()
 
 	def set_state(self, state):
 		self._state = state
@@ -263,6 +605,13 @@ class UpdateStateMachine(StateMachine):
 	def set_state_strategy(self, state, strategy):
 		self._strategies[state] = strategy
 
+	def set_scheduler(self, scheduler):
+		"""
+		Wake up through scheduler rather than on our own
+		"""
+		assert not self._onTimeout.is_running()
+		self._onTimeout = scheduler.create_timeout(self._on_timeout)
+
 	def start(self):
 		for strategy in self._strategies.itervalues():
 			strategy.initialize_state()
@@ -350,6 +699,7 @@ class UpdateStateMachine(StateMachine):
 
 	@misc_utils.log_exception(_moduleLogger)
 	def _on_timeout(self):
+		metrics.get_registry().counter("poll.%s" % (self._name, )).inc()
 		self._schedule_update()
 		for item in self._updateItems:
 			try:
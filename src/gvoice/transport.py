@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+
+"""
+Stand ins for the network behind MozillaEmulator.download
+
+A transport has fetch(fetch, url, postdata, extraheaders, forbidRedirect)
+where fetch is the real download with the same arguments, so a transport can
+watch what goes over the network, change it or skip it entirely.  They make
+the backend reproducible: record a session against Google Voice once and
+replay it in process or from a fake server (see
+hand_tests/fake_gv_server.py) as often as needed.
+
+from_environment picks a transport from
+	THEONERING_GV_REPLAY: Directory of recorded responses to answer from
+	THEONERING_GV_SERVER: Base URL of a fake server to send everything to
+
+Recordings of a real account are personal data.  A Scrubber removes the
+credentials and tokens and, with pseudonymize, the phone numbers, names and
+message text it can recognize, but Google's pages carry more than that
+(account settings, call details, layouts we don't parse).  Keep recordings
+of real accounts local and never commit them, only generated ones (see
+hand_tests/gv_generator.py).
+"""
+
+from __future__ import with_statement
+
+import os
+import re
+import cgi
+import urllib
+import urllib2
+import urlparse
+import hashlib
+import threading
+import logging
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+
+class Scrubber(object):
+	"""
+	Strips what identifies the account out of requests and responses
+
+	Requests are scrubbed into the key they are recorded under, so a replay
+	with different credentials or tokens finds the same responses.
+
+	>>> scrubber = Scrubber(["someone@gmail.com"])
+	>>> scrubber.scrub_request("https://www.google.com/accounts/ServiceLoginAuth", "Passwd=secret&Email=someone%40gmail.com&service=grandcentral")
+	'POST https://www.google.com/accounts/ServiceLoginAuth Email=SCRUBBED&Passwd=SCRUBBED&service=grandcentral'
+	>>> scrubber.scrub_request("https://www.google.com/voice/m", None)
+	'GET https://www.google.com/voice/m'
+	>>> scrubber.scrub_page('Hi someone@gmail.com <input type="hidden" name="_rnr_se" value="abc123"/>')
+	'Hi SCRUBBED <input type="hidden" name="_rnr_se" value="SCRUBBED"/>'
+
+	With pseudonymize, numbers, names and message text become stand-ins that
+	are consistent for the scrubber's lifetime, so threads still line up and
+	repeated messages still match
+
+	>>> scrubber = Scrubber(pseudonymize=True, salt="doctest")
+	>>> scrubber.scrub_page('{"phoneNumber":"+15555550100","name":"Bob"}')
+	'{"phoneNumber":"+15559607368","name":"Person 22ce6c"}'
+	>>> print scrubber.scrub_page('<span class="gc-message-sms-from">Bob:</span><span class="gc-message-sms-text">Call (555) 555-0100</span>')
+	<span class="gc-message-sms-from">Person 22ce6c:</span><span class="gc-message-sms-text">Text e451c4f8</span>
+	>>> scrubber.scrub_page('<span class="gc-message-sms-from">Me:</span>')
+	'<span class="gc-message-sms-from">Me:</span>'
+	>>> scrubber.scrub_request("https://www.google.com/voice/sms/send/", "phoneNumber=5555550100&text=Hi")
+	'POST https://www.google.com/voice/sms/send/ phoneNumber=5559607368&text=Text+3e8b9185'
+	"""
+
+	PLACEHOLDER = "SCRUBBED"
+
+	_SECRET_FIELDS = frozenset(("Email", "Passwd", "GALX", "_rnr_se"))
+	_SECRET_VALUES_RE = re.compile(r"""(name="(?:GALX|_rnr_se)"[^>]*?value=")[^"]*(")""")
+
+	# Optional country code then ten digits, formatted or not, standing alone
+	_NUMBER_RE = re.compile(r"""(?<![\w+])\+?(?:1[ .-]?)?\(?\d{3}\)?[ .-]?\d{3}[ .-]?\d{4}(?!\w)""")
+	_NAME_RES = (
+		re.compile(r"""(<a [^>]*class="[^"]*gc-message-name-link[^"]*"[^>]*>)(.*?)(</a>)""", re.DOTALL),
+		re.compile(r"""(<span class="gc-message-sms-from">\s*)(.*?)(:\s*</span>)""", re.DOTALL),
+		re.compile(r"""("(?:name|displayName)"\s*:\s*")((?:[^"\\]|\\.)*)(")"""),
+	)
+	_PLACE_RE = re.compile(r"""(<span class="gc-message-location">.*?<a[^>]*>)(.*?)(</a>)""", re.DOTALL)
+	_TEXT_RES = (
+		re.compile(r"""(<span class="gc-message-sms-text">)(.*?)(</span>)""", re.DOTALL),
+		re.compile(r"""(<span id="\d+-\d+" class="gc-word-[^"]*">)(.*?)(</span>)"""),
+		re.compile(r"""(<a [^>]*class="gc-message-mni">)(.*?)(</a>)"""),
+		re.compile(r"""("messageText"\s*:\s*")((?:[^"\\]|\\.)*)(")"""),
+	)
+	_TEXT_FIELDS = frozenset(("text", ))
+	_SELF_NAME = "Me"
+
+	def __init__(self, secrets = (), pseudonymize = False, salt = None):
+		"""
+		@param secrets Strings to remove wherever they appear, like the
+			username and password
+		@param pseudonymize Also replace phone numbers, names and message
+			text, for recording a real account.  Only the scrubber recording
+			should, requests being replayed already use the stand-ins.
+		@param salt Keeps stand-ins from being reversed by hashing every
+			possible number, random by default
+		"""
+		self._secrets = []
+		for secret in secrets:
+			self.add_secret(secret)
+		self._pseudonymize = pseudonymize
+		self._salt = salt if salt is not None else os.urandom(16)
+
+	def add_secret(self, secret):
+		if not secret:
+			return
+		for form in (secret, urllib.quote(secret), urllib.quote_plus(secret)):
+			if form not in self._secrets:
+				self._secrets.append(form)
+		# Longest first so a secret isn't left half scrubbed by one it contains
+		self._secrets.sort(key=len, reverse=True)
+
+	def scrub_request(self, url, postdata):
+		"""
+		@returns The key the request is recorded under
+		"""
+		if postdata is None:
+			return "GET %s" % (self._scrub_text(url), )
+		fields = [
+			(name, self._scrub_field(name, value))
+			for (name, value) in cgi.parse_qsl(postdata, keep_blank_values=True)
+		]
+		fields.sort()
+		return "POST %s %s" % (
+			self._scrub_text(url), self._scrub_text(urllib.urlencode(fields)),
+		)
+
+	def generalize_request(self, url, postdata):
+		"""
+		@returns The key of a response for any request to url
+
+		>>> Scrubber().generalize_request("https://www.google.com/voice/sms/send/?x=1", "text=hi")
+		'POST https://www.google.com/voice/sms/send/ *'
+		"""
+		method = "GET" if postdata is None else "POST"
+		return "%s %s *" % (method, self._scrub_text(url.split("?", 1)[0]))
+
+	def scrub_page(self, page):
+		page = self._SECRET_VALUES_RE.sub(r"\g<1>%s\g<2>" % self.PLACEHOLDER, page)
+		if self._pseudonymize:
+			for regex in self._NAME_RES:
+				page = regex.sub(self._replace_name, page)
+			page = self._PLACE_RE.sub(self._replace_place, page)
+			for regex in self._TEXT_RES:
+				page = regex.sub(self._replace_message_text, page)
+		return self._scrub_text(page)
+
+	def _scrub_field(self, name, value):
+		if name in self._SECRET_FIELDS:
+			return self.PLACEHOLDER
+		elif self._pseudonymize and name in self._TEXT_FIELDS:
+			return self._to_stand_in("Text", value, 8)
+		else:
+			return value
+
+	def _scrub_text(self, text):
+		for secret in self._secrets:
+			text = text.replace(secret, self.PLACEHOLDER)
+		if self._pseudonymize:
+			text = self._NUMBER_RE.sub(self._replace_number, text)
+		return text
+
+	def _replace_number(self, match):
+		"""
+		Swaps the last ten digits for a 555 number, keeping the formatting
+		"""
+		original = match.group(0)
+		digits = re.sub(r"\D", "", original)[-10:]
+		standIn = "555%07d" % (int(self._digest(digits), 16) % 10 ** 7, )
+		replaced = list(original)
+		digitIndex = len(standIn)
+		for index in xrange(len(replaced) - 1, -1, -1):
+			if not replaced[index].isdigit():
+				continue
+			digitIndex -= 1
+			if digitIndex < 0:
+				break
+			replaced[index] = standIn[digitIndex]
+		return "".join(replaced)
+
+	def _replace_name(self, match):
+		name = match.group(2)
+		if name.strip() != self._SELF_NAME:
+			name = self._to_stand_in("Person", name, 6)
+		return match.group(1) + name + match.group(3)
+
+	def _replace_place(self, match):
+		return match.group(1) + self._to_stand_in("Place", match.group(2), 6) + match.group(3)
+
+	def _replace_message_text(self, match):
+		return match.group(1) + self._to_stand_in("Text", match.group(2), 8) + match.group(3)
+
+	def _to_stand_in(self, kind, value, length):
+		if not value.strip():
+			return value
+		return "%s %s" % (kind, self._digest(value.strip())[:length])
+
+	def _digest(self, value):
+		return hashlib.sha1(self._salt + value).hexdigest()
+
+
+class FixtureStore(object):
+	"""
+	Directory of recorded responses
+
+	index.txt has a "digest<TAB>filename<TAB>request" line per response, in
+	the order they were recorded, with the body in filename.
+	"""
+
+	_INDEX_NAME = "index.txt"
+
+	def __init__(self, path):
+		self._path = path
+		self._lock = threading.Lock()
+		self._responses = {}
+		self._count = 0
+		self._load()
+
+	@property
+	def path(self):
+		return self._path
+
+	def add(self, key, page):
+		with self._lock:
+			if not os.path.isdir(self._path):
+				os.makedirs(self._path)
+			self._count += 1
+			filename = "%04d.body" % self._count
+			with open(os.path.join(self._path, filename), "wb") as f:
+				f.write(page)
+			digest = self._to_digest(key)
+			with open(os.path.join(self._path, self._INDEX_NAME), "a") as f:
+				f.write("%s\t%s\t%s\n" % (digest, filename, key.replace("\n", " ")))
+			self._responses.setdefault(digest, []).append(filename)
+
+	def get(self, key, occurrence):
+		"""
+		@returns The occurrence'th response recorded for key, the last one
+			once they run out, or None if the request was never recorded
+		"""
+		with self._lock:
+			filenames = self._responses.get(self._to_digest(key), None)
+		if not filenames:
+			return None
+		filename = filenames[min(occurrence, len(filenames) - 1)]
+		with open(os.path.join(self._path, filename), "rb") as f:
+			return f.read()
+
+	def __len__(self):
+		return self._count
+
+	def _load(self):
+		try:
+			f = open(os.path.join(self._path, self._INDEX_NAME))
+		except IOError:
+			return
+		try:
+			for line in f:
+				digest, filename, request = line.rstrip("\n").split("\t", 2)
+				self._responses.setdefault(digest, []).append(filename)
+				self._count += 1
+		finally:
+			f.close()
+
+	@staticmethod
+	def _to_digest(key):
+		return hashlib.sha1(key).hexdigest()
+
+
+class RecordingTransport(object):
+	"""
+	Goes over the network, saving scrubbed copies of the responses
+	"""
+
+	def __init__(self, store, scrubber):
+		self._store = store
+		self._scrubber = scrubber
+
+	def fetch(self, fetch, url, postdata, extraheaders, forbidRedirect):
+		page = fetch(url, postdata, extraheaders, forbidRedirect)
+		key = self._scrubber.scrub_request(url, postdata)
+		_moduleLogger.debug("Recording %s" % (key, ))
+		self._store.add(key, self._scrubber.scrub_page(page))
+		return page
+
+
+class ReplayTransport(object):
+	"""
+	Answers from recorded responses without going over the network
+
+	A request made more often than it was recorded gets the last recording
+	again, so polling can go on indefinitely.  A request that was never
+	recorded is answered by what was recorded under
+	Scrubber.generalize_request, if anything, for requests like sending a
+	text whose content varies.
+	"""
+
+	def __init__(self, store, scrubber = None):
+		self._store = store
+		self._scrubber = scrubber if scrubber is not None else Scrubber()
+		self._lock = threading.Lock()
+		self._occurrences = {}
+
+	def fetch(self, fetch, url, postdata, extraheaders, forbidRedirect):
+		key = self._scrubber.scrub_request(url, postdata)
+		with self._lock:
+			occurrence = self._occurrences.get(key, 0)
+			self._occurrences[key] = occurrence + 1
+		page = self._store.get(key, occurrence)
+		if page is None:
+			page = self._store.get(self._scrubber.generalize_request(url, postdata), occurrence)
+		if page is None:
+			_moduleLogger.info("Nothing recorded for %s" % (key, ))
+			raise urllib2.URLError("Nothing recorded for %s" % (key, ))
+		return page
+
+	def rewind(self):
+		with self._lock:
+			self._occurrences.clear()
+
+
+class RedirectTransport(object):
+	"""
+	Sends everything to a fake server instead of Google
+
+	>>> transport = RedirectTransport("http://localhost:8643/")
+	>>> serverUrl = transport.to_server_url("https://www.google.com/voice/inbox/recent/sms/?page=2")
+	>>> serverUrl
+	'http://localhost:8643/https/www.google.com/voice/inbox/recent/sms/?page=2'
+	>>> from_server_path(serverUrl[len("http://localhost:8643"):])
+	'https://www.google.com/voice/inbox/recent/sms/?page=2'
+	"""
+
+	def __init__(self, baseUrl):
+		self._baseUrl = baseUrl.rstrip("/")
+
+	def to_server_url(self, url):
+		scheme, netloc, path, query, fragment = urlparse.urlsplit(url)
+		serverUrl = "%s/%s/%s%s" % (self._baseUrl, scheme, netloc, path)
+		if query:
+			serverUrl += "?" + query
+		return serverUrl
+
+	def fetch(self, fetch, url, postdata, extraheaders, forbidRedirect):
+		return fetch(self.to_server_url(url), postdata, extraheaders, forbidRedirect)
+
+
+def from_server_path(path):
+	"""
+	@returns The URL the backend asked for from the path a RedirectTransport
+		sent it to
+	"""
+	scheme, netloc, rest = path.lstrip("/").split("/", 2)
+	return "%s://%s/%s" % (scheme, netloc, rest)
+
+
+def from_environment():
+	"""
+	@returns The transport the environment asks for, else None for the network
+	"""
+	replayPath = os.environ.get("THEONERING_GV_REPLAY", "")
+	if replayPath:
+		_moduleLogger.info("Replaying Google Voice from %s" % (replayPath, ))
+		return ReplayTransport(FixtureStore(replayPath))
+	serverUrl = os.environ.get("THEONERING_GV_SERVER", "")
+	if serverUrl:
+		_moduleLogger.info("Sending Google Voice requests to %s" % (serverUrl, ))
+		return RedirectTransport(serverUrl)
+	return None
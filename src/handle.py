@@ -24,6 +24,13 @@ class TheOneRingHandle(tp.Handle):
 			type(self).__name__, self.id, self.name
 		)
 
+	@staticmethod
+	def normalize_args(*args):
+		"""
+		@returns The constructor arguments in the form that identifies the handle
+		"""
+		return args
+
 	id = property(tp.Handle.get_id)
 	type = property(tp.Handle.get_type)
 	name = property(tp.Handle.get_name)
@@ -52,6 +59,10 @@ class ContactHandle(TheOneRingHandle):
 	def phoneNumber(self):
 		return self._phoneNumber
 
+	@staticmethod
+	def normalize_args(phoneNumber):
+		return (misc_utils.normalize_number(phoneNumber), )
+
 
 class ListHandle(TheOneRingHandle):
 
@@ -74,6 +85,9 @@ def create_handle_factory():
 
 	def _create_handle(connection, type, *args):
 		Handle = _HANDLE_TYPE_MAPPING[type]
+		# Keyed by the normalized name so different spellings of a number get
+		# the same handle without creating (and burning the id of) a new one
+		args = Handle.normalize_args(*args)
 		key = Handle, connection.username, args
 		try:
 			handle = cache[key]
@@ -56,26 +56,31 @@ class TheOneRingPresence(object):
 		presences = {}
 		for handleId in contactIds:
 			h = self.get_handle_by_id(telepathy.HANDLE_TYPE_CONTACT, handleId)
-			if isinstance(h, handle.ConnectionHandle):
-				isDnd = self.session.is_dnd() if not self.__ignoreDND else False
-				if isDnd:
-					presence = TheOneRingPresence.HIDDEN
-				else:
-					state = self.session.stateMachine.state
-					if state == state_machine.StateMachine.STATE_ACTIVE:
-						presence = TheOneRingPresence.ONLINE
-					elif state == state_machine.StateMachine.STATE_IDLE:
-						presence = TheOneRingPresence.AWAY
-					else:
-						raise telepathy.errors.InvalidArgument("Unsupported state on the state machine: %s" % state)
-				presenceType = TheOneRingPresence.TO_PRESENCE_TYPE[presence]
-			else:
-				presence = TheOneRingPresence.AWAY
-				presenceType = TheOneRingPresence.TO_PRESENCE_TYPE[presence]
-
-			presences[h] = (presenceType, presence)
+			presences[h] = self.get_handle_presence(h)
 		return presences
 
+	def get_handle_presence(self, h):
+		"""
+		@return (Presence Type, Status)
+		"""
+		if isinstance(h, handle.ConnectionHandle):
+			isDnd = self.session.is_dnd() if not self.__ignoreDND else False
+			if isDnd:
+				presence = TheOneRingPresence.HIDDEN
+			else:
+				state = self.session.stateMachine.state
+				if state == state_machine.StateMachine.STATE_ACTIVE:
+					presence = TheOneRingPresence.ONLINE
+				elif state == state_machine.StateMachine.STATE_IDLE:
+					presence = TheOneRingPresence.AWAY
+				else:
+					raise telepathy.errors.InvalidArgument("Unsupported state on the state machine: %s" % state)
+			presenceType = TheOneRingPresence.TO_PRESENCE_TYPE[presence]
+		else:
+			presence = TheOneRingPresence.AWAY
+			presenceType = TheOneRingPresence.TO_PRESENCE_TYPE[presence]
+		return presenceType, presence
+
 	def set_presence(self, status):
 		if status == self.ONLINE:
 			if not self.__ignoreDND:
@@ -579,6 +579,81 @@ def itr_available(queue, initiallyBlock = False):
 		yield queue.get_nowait()
 
 
+class PrefixIndex(object):
+	"""
+	Trie of string keys to sets of values, for finding the values of every key
+	starting with a prefix without looking at the other keys
+
+	>>> index = PrefixIndex()
+	>>> index.add("bob", 1)
+	>>> index.add("bobby", 2)
+	>>> index.add("sue", 3)
+	>>> sorted(index.find("bob")), sorted(index.find("")), sorted(index.find("x"))
+	([1, 2], [1, 2, 3], [])
+	>>> sorted(index.get("bob"))
+	[1]
+	>>> index.remove("bob", 1)
+	>>> sorted(index.get("bob")), sorted(index.find("b"))
+	([], [2])
+	>>> index.remove("bobby", 2)
+	>>> index._root[0].keys()
+	['s']
+	"""
+
+	def __init__(self):
+		# Nodes are (children by character, values)
+		self._root = ({}, set())
+
+	def add(self, key, value):
+		node = self._root
+		for character in key:
+			node = node[0].setdefault(character, ({}, set()))
+		node[1].add(value)
+
+	def remove(self, key, value):
+		path = [self._root]
+		for character in key:
+			node = path[-1][0].get(character, None)
+			if node is None:
+				return
+			path.append(node)
+		path[-1][1].discard(value)
+
+		# Prune what is left empty
+		for i in xrange(len(key), 0, -1):
+			children, values = path[i]
+			if children or values:
+				break
+			del path[i-1][0][key[i-1]]
+
+	def get(self, key):
+		"""
+		@returns The values of exactly key
+		"""
+		node = self._root
+		for character in key:
+			node = node[0].get(character, None)
+			if node is None:
+				return frozenset()
+		return frozenset(node[1])
+
+	def find(self, prefix):
+		"""
+		@returns Iterable of the values of all keys starting with prefix
+		"""
+		node = self._root
+		for character in prefix:
+			node = node[0].get(character, None)
+			if node is None:
+				return
+		nodes = [node]
+		while nodes:
+			children, values = nodes.pop()
+			for value in values:
+				yield value
+			nodes.extend(children.itervalues())
+
+
 if __name__ == "__main__":
 	import doctest
 	print doctest.testmod()
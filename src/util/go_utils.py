@@ -3,15 +3,16 @@
 from __future__ import with_statement
 
 import time
+import heapq
+import itertools
 import functools
 import threading
-import Queue
 import logging
 
 import gobject
 
-import algorithms
 import misc
+import metrics
 
 
 _moduleLogger = logging.getLogger(__name__)
@@ -135,121 +136,290 @@ class Timeout(object):
 		return False
 
 
-_QUEUE_EMPTY = object()
+class TaskCancelledError(RuntimeError):
+	pass
+
+
+class TaskTimeoutError(RuntimeError):
+	pass
+
+
+class AsyncTask(object):
+
+	def __init__(self, pool, priority, sequence, func, args, kwds, on_success, on_error):
+		self.priority = priority
+		self.sequence = sequence
+		self.func = func
+		self.args = args
+		self.kwds = kwds
+		self.on_success = on_success
+		self.on_error = on_error
+
+		self._pool = pool
+		self._isDone = False
+		self._timeoutId = None
+		self._queuedAt = None
+
+	def __cmp__(self, other):
+		return cmp((self.priority, self.sequence), (other.priority, other.sequence))
+
+	def cancel(self):
+		"""
+		Fail the task with TaskCancelledError, discarding its result if it is
+		already running
+		"""
+		self._pool.cancel_task(self)
 
 
 class AsyncPool(object):
+	"""
+	Runs blocking calls on worker threads, passing results back to the mainloop
 
-	def __init__(self):
-		self.__workQueue = Queue.Queue()
-		self.__thread = threading.Thread(
-			name = type(self).__name__,
-			target = self.__consume_queue,
-		)
+	Tasks run in priority order and, when there is more than one worker, one
+	worker is always kept free of poll/background tasks so interactive tasks
+	never wait behind them.  Running tasks can't be interrupted, so timed out
+	or cancelled tasks fail immediately and their eventual result is dropped.
+	"""
+
+	PRIORITY_INTERACTIVE = 0
+	PRIORITY_POLL = 1
+	PRIORITY_BACKGROUND = 2
+
+	def __init__(self, workerCount = 1):
+		assert 0 < workerCount
+		self.__workerCount = workerCount
+		self.__maxNonInteractive = max(1, workerCount - 1)
+
+		self.__condition = threading.Condition()
+		self.__workQueue = []
+		self.__sequence = itertools.count()
+		self.__busyNonInteractive = 0
+		self.__generation = 0
 		self.__isRunning = True
 
 	def start(self):
-		self.__thread.start()
+		with self.__condition:
+			self.__isRunning = True
+			self.__generation += 1
+			generation = self.__generation
+		for i in xrange(self.__workerCount):
+			thread = threading.Thread(
+				name = "%s-%d" % (type(self).__name__, i),
+				target = self.__consume_queue,
+				args = (generation, ),
+			)
+			thread.start()
 
 	def stop(self):
-		self.__isRunning = False
-		for _ in algorithms.itr_available(self.__workQueue):
-			pass # eat up queue to cut down dumb work
-		self.__workQueue.put(_QUEUE_EMPTY)
+		with self.__condition:
+			self.__isRunning = False
+			self.__condition.notify_all()
+		self.clear_tasks()
 
 	def clear_tasks(self):
-		for _ in algorithms.itr_available(self.__workQueue):
-			pass # eat up queue to cut down dumb work
+		with self.__condition:
+			queuedTasks = self.__workQueue
+			self.__workQueue = []
+		for task in queuedTasks:
+			self.__claim(task) # drop to cut down dumb work
+
+	def add_task(self, func, args, kwds, on_success, on_error, priority = PRIORITY_INTERACTIVE, timeout = None):
+		"""
+		@param timeout Seconds from now until the task fails with TaskTimeoutError
+		@returns AsyncTask
+		"""
+		task = AsyncTask(self, priority, self.__sequence.next(), func, args, kwds, on_success, on_error)
+		if timeout is not None:
+			task._timeoutId = timeout_add_seconds(timeout, lambda: self.__on_timeout(task))
+		with self.__condition:
+			task._queuedAt = time.time()
+			heapq.heappush(self.__workQueue, task)
+			metrics.get_registry().gauge("pool.queueDepth").set(len(self.__workQueue))
+			self.__condition.notify()
+		return task
+
+	def cancel_task(self, task):
+		if self.__claim(task):
+			gobject.idle_add(self.__deliver, task, True, TaskCancelledError("Cancelled"))
+
+	def __claim(self, task):
+		"""
+		Mark a task as done, only one of its result/timeout/cancellation gets
+		reported
+		"""
+		with self.__condition:
+			if task._isDone:
+				return False
+			task._isDone = True
+		if task._timeoutId is not None:
+			gobject.source_remove(task._timeoutId)
+			task._timeoutId = None
+		return True
 
-	def add_task(self, func, args, kwds, on_success, on_error):
-		task = func, args, kwds, on_success, on_error
-		self.__workQueue.put(task)
+	@misc.log_exception(_moduleLogger)
+	def __on_timeout(self, task):
+		task._timeoutId = None
+		if self.__claim(task):
+			_moduleLogger.info("Task %r timed out" % (task.func, ))
+			self.__deliver(task, True, TaskTimeoutError("Timed out"))
+		return False
 
 	@misc.log_exception(_moduleLogger)
-	def __trampoline_callback(self, on_success, on_error, isError, result):
+	def __trampoline_callback(self, task, isError, result):
+		if self.__claim(task):
+			self.__deliver(task, isError, result)
+		else:
+			_moduleLogger.debug("Dropping result of %r as it timed out or was cancelled" % (task.func, ))
+		return False
+
+	def __deliver(self, task, isError, result):
 		if not self.__isRunning:
 			if isError:
 				_moduleLogger.error("Masking: %s" % (result, ))
 			isError = True
 			result = StopIteration("Cancelling all callbacks")
-		callback = on_success if not isError else on_error
+		callback = task.on_success if not isError else task.on_error
 		try:
 			callback(result)
 		except Exception:
 			_moduleLogger.exception("Callback errored")
 		return False
 
+	def __pop_runnable_task(self):
+		while self.__workQueue:
+			task = self.__workQueue[0]
+			if task._isDone:
+				heapq.heappop(self.__workQueue)
+				continue
+			if task.priority != self.PRIORITY_INTERACTIVE:
+				if self.__maxNonInteractive <= self.__busyNonInteractive:
+					return None
+				self.__busyNonInteractive += 1
+			return heapq.heappop(self.__workQueue)
+		return None
+
+	def __next_task(self, generation):
+		with self.__condition:
+			while self.__isRunning and generation == self.__generation:
+				task = self.__pop_runnable_task()
+				if task is not None:
+					registry = metrics.get_registry()
+					registry.gauge("pool.queueDepth").set(len(self.__workQueue))
+					registry.histogram("pool.wait").observe(time.time() - task._queuedAt)
+					return task
+				self.__condition.wait()
+			return None
+
 	@misc.log_exception(_moduleLogger)
-	def __consume_queue(self):
+	def __consume_queue(self, generation):
 		while True:
-			task = self.__workQueue.get()
-			if task is _QUEUE_EMPTY:
+			task = self.__next_task(generation)
+			if task is None:
 				break
-			func, args, kwds, on_success, on_error = task
 
+			start = time.time()
 			try:
-				result = func(*args, **kwds)
+				result = task.func(*task.args, **task.kwds)
 				isError = False
 			except Exception, e:
 				_moduleLogger.exception("Error, passing it back to the main thread")
 				result = e
 				isError = True
-			self.__workQueue.task_done()
+			metrics.get_registry().histogram("pool.run").observe(time.time() - start)
+
+			with self.__condition:
+				if task.priority != self.PRIORITY_INTERACTIVE:
+					self.__busyNonInteractive -= 1
+				self.__condition.notify_all()
 
-			gobject.idle_add(self.__trampoline_callback, on_success, on_error, isError, result)
+			gobject.idle_add(self.__trampoline_callback, task, isError, result)
 		_moduleLogger.debug("Shutting down worker thread")
 
 
 class AsyncLinearExecution(object):
+	"""
+	Runs a generator on the mainloop, each yielded (func, args, kwds) on the pool
+
+	A step that times out is thrown TaskTimeoutError right away, so the
+	function carries on without waiting for the stuck call
+
+	>>> gobject.threads_init()
+	>>> loop = gobject.MainLoop()
+	>>> pool = AsyncPool(2)
+	>>> pool.start()
+	>>> steps = []
+	>>> def steps_with_deadline():
+	... 	try:
+	... 		yield time.sleep, (3, ), {}
+	... 	except TaskTimeoutError:
+	... 		steps.append("timed out")
+	... 	result = yield (lambda: "next step"), (), {}
+	... 	steps.append(result)
+	... 	loop.quit()
+	>>> le = AsyncLinearExecution(pool, steps_with_deadline, timeout = 1)
+	>>> le.start()
+	>>> loop.run()
+	>>> steps
+	['timed out', 'next step']
+	>>> pool.stop()
+	"""
 
-	def __init__(self, pool, func):
+	def __init__(self, pool, func, priority = AsyncPool.PRIORITY_INTERACTIVE, timeout = None):
+		"""
+		@param timeout Seconds each step gets before failing with TaskTimeoutError
+		"""
 		self._pool = pool
 		self._func = func
+		self._priority = priority
+		self._timeout = timeout
 		self._run = None
+		self._task = None
 
 	def start(self, *args, **kwds):
 		assert self._run is None
 		self._run = self._func(*args, **kwds)
 		trampoline, args, kwds = self._run.send(None) # priming the function
-		self._pool.add_task(
-			trampoline,
-			args,
-			kwds,
-			self.on_success,
-			self.on_error,
-		)
+		self._add_task(trampoline, args, kwds)
+
+	def cancel(self):
+		"""
+		Throw TaskCancelledError into the function at its current step
+		"""
+		if self._task is not None:
+			self._task.cancel()
 
 	@misc.log_exception(_moduleLogger)
 	def on_success(self, result):
 		#_moduleLogger.debug("Processing success for: %r", self._func)
+		self._task = None
 		try:
 			trampoline, args, kwds = self._run.send(result)
 		except StopIteration, e:
 			pass
 		else:
-			self._pool.add_task(
-				trampoline,
-				args,
-				kwds,
-				self.on_success,
-				self.on_error,
-			)
+			self._add_task(trampoline, args, kwds)
 
 	@misc.log_exception(_moduleLogger)
 	def on_error(self, error):
 		#_moduleLogger.debug("Processing error for: %r", self._func)
+		self._task = None
 		try:
 			trampoline, args, kwds = self._run.throw(error)
 		except StopIteration, e:
 			pass
 		else:
-			self._pool.add_task(
-				trampoline,
-				args,
-				kwds,
-				self.on_success,
-				self.on_error,
-			)
+			self._add_task(trampoline, args, kwds)
+
+	def _add_task(self, trampoline, args, kwds):
+		self._task = self._pool.add_task(
+			trampoline,
+			args,
+			kwds,
+			self.on_success,
+			self.on_error,
+			self._priority,
+			self._timeout,
+		)
 
 
 class AutoSignal(object):
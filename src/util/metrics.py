@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+
+"""
+Counters, gauges and latency histograms cheap enough to leave on
+
+Everything registers with one process wide Registry (see get_registry) so the
+whole process can be reported on, reset and dumped from one place.  Metrics
+are created on first use, so instrumenting is just
+	metrics.get_registry().counter("some.name").inc()
+"""
+
+from __future__ import with_statement
+
+import time
+import bisect
+import threading
+import contextlib
+import logging
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+
+class Counter(object):
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._value = 0
+
+	def inc(self, amount = 1):
+		with self._lock:
+			self._value += amount
+
+	@property
+	def value(self):
+		return self._value
+
+	def reset(self):
+		with self._lock:
+			self._value = 0
+
+	def summarize(self):
+		return str(self._value)
+
+
+class Gauge(object):
+	"""
+	@note Reflects the current state, so reset leaves it alone
+	"""
+
+	def __init__(self):
+		self._value = 0
+
+	def set(self, value):
+		self._value = value
+
+	@property
+	def value(self):
+		return self._value
+
+	def reset(self):
+		pass
+
+	def summarize(self):
+		return str(self._value)
+
+
+class Histogram(object):
+	"""
+	Seconds binned into fixed buckets, so percentiles are upper bounds
+
+	>>> histogram = Histogram()
+	>>> for latency in (0.002, 0.004, 0.004, 0.3):
+	... 	histogram.observe(latency)
+	>>> histogram.count, histogram.max
+	(4, 0.3)
+	>>> histogram.percentile(0.5), histogram.percentile(0.99)
+	(0.005, 0.5)
+	>>> histogram.summarize()
+	'count=4 mean=77.5ms p50<=5.0ms p95<=500.0ms max=300.0ms'
+	"""
+
+	BOUNDS = (
+		0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+		1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+	)
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self.reset()
+
+	def observe(self, seconds):
+		bucket = bisect.bisect_left(self.BOUNDS, seconds)
+		with self._lock:
+			self._buckets[bucket] += 1
+			self._count += 1
+			self._total += seconds
+			if self._max < seconds:
+				self._max = seconds
+
+	@property
+	def count(self):
+		return self._count
+
+	@property
+	def max(self):
+		return self._max
+
+	@property
+	def mean(self):
+		return self._total / self._count if self._count else 0.0
+
+	def percentile(self, fraction):
+		"""
+		@returns Upper bound of the bucket the percentile falls in, the
+			largest value seen for the overflow bucket
+		"""
+		with self._lock:
+			buckets = list(self._buckets)
+			count = self._count
+		seen = 0
+		for bucket, bucketCount in enumerate(buckets):
+			seen += bucketCount
+			if count * fraction <= seen and bucketCount:
+				return self.BOUNDS[bucket] if bucket < len(self.BOUNDS) else self._max
+		return 0.0
+
+	def reset(self):
+		with self._lock:
+			self._buckets = [0] * (len(self.BOUNDS) + 1)
+			self._count = 0
+			self._total = 0.0
+			self._max = 0.0
+
+	def summarize(self):
+		return "count=%d mean=%.1fms p50<=%.1fms p95<=%.1fms max=%.1fms" % (
+			self._count,
+			1000 * self.mean,
+			1000 * self.percentile(0.5),
+			1000 * self.percentile(0.95),
+			1000 * self._max,
+		)
+
+
+class Registry(object):
+	"""
+	>>> registry = Registry()
+	>>> registry.counter("gv.requests").inc()
+	>>> registry.counter("gv.requests").inc(2)
+	>>> registry.gauge("pool.depth").set(5)
+	>>> registry.register_provider("scheduler", lambda: {"polls": 3})
+	>>> print registry.format()
+	gv.requests 3
+	pool.depth 5
+	scheduler.polls 3
+	>>> registry.reset()
+	>>> registry.counter("gv.requests").value
+	0
+	"""
+
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._metrics = {}
+		self._providers = {}
+
+	def counter(self, name):
+		return self._get(name, Counter)
+
+	def gauge(self, name):
+		return self._get(name, Gauge)
+
+	def histogram(self, name):
+		return self._get(name, Histogram)
+
+	@contextlib.contextmanager
+	def timed(self, name):
+		"""
+		Observes how long the with block takes in the histogram name
+		"""
+		start = time.time()
+		try:
+			yield
+		finally:
+			self.histogram(name).observe(time.time() - start)
+
+	def register_provider(self, name, snapshot, reset = None):
+		"""
+		Include metrics kept elsewhere
+
+		@param snapshot Function returning a dict of the metrics
+		@param reset Optional function resetting them
+		"""
+		with self._lock:
+			self._providers[name] = snapshot, reset
+
+	def unregister_provider(self, name):
+		with self._lock:
+			self._providers.pop(name, None)
+
+	def snapshot(self):
+		"""
+		@returns {name: summary string} of every metric
+		"""
+		with self._lock:
+			metrics = self._metrics.items()
+			providers = self._providers.items()
+		summaries = dict(
+			(name, metric.summarize())
+			for (name, metric) in metrics
+		)
+		for providerName, (snapshot, reset) in providers:
+			try:
+				providedMetrics = snapshot()
+			except Exception:
+				_moduleLogger.exception("Metrics provider %s failed" % (providerName, ))
+				continue
+			for name, value in providedMetrics.iteritems():
+				summaries["%s.%s" % (providerName, name)] = str(value)
+		return summaries
+
+	def format(self):
+		summaries = self.snapshot()
+		return "\n".join(
+			"%s %s" % (name, summaries[name])
+			for name in sorted(summaries.iterkeys())
+		)
+
+	def dump(self, path):
+		with open(path, "w") as f:
+			f.write("# %s\n" % (time.strftime("%Y-%m-%d %H:%M:%S"), ))
+			f.write(self.format())
+			f.write("\n")
+
+	def reset(self):
+		with self._lock:
+			metrics = self._metrics.values()
+			providers = self._providers.values()
+		for metric in metrics:
+			metric.reset()
+		for snapshot, reset in providers:
+			if reset is not None:
+				reset()
+
+	def _get(self, name, Metric):
+		try:
+			metric = self._metrics[name]
+		except KeyError:
+			with self._lock:
+				metric = self._metrics.setdefault(name, Metric())
+		assert isinstance(metric, Metric), "%s is a %s, not a %s" % (name, type(metric).__name__, Metric.__name__)
+		return metric
+
+
+_registry = Registry()
+
+
+def get_registry():
+	"""
+	@returns The registry shared by everything in the process
+	"""
+	return _registry
@@ -591,6 +591,53 @@ class MemoizeMutable(object):
 		return self.memo[text]
 
 
+class BoundedMemoize(object):
+	"""
+	Like Memoize but only remembers about the maxSize most recently used
+	arguments, for when the arguments are unbounded
+
+	Entries are kept in two generations, when the newer one fills up the
+	older one is dropped, so lookups stay O(1) and at most 2 * maxSize
+	results are kept.
+
+	>>> validate_decorator(BoundedMemoize)
+	>>> calls = []
+	>>> square = BoundedMemoize(lambda x: calls.append(x) or x * x, 2)
+	>>> [square(x) for x in (1, 2, 1, 3, 4, 1, 2)]
+	[1, 4, 1, 9, 16, 1, 4]
+	>>> calls
+	[1, 2, 3, 4, 2]
+	"""
+
+	def __init__(self, fn, maxSize = 1024):
+		self.fn = fn
+		self.__name__ = fn.__name__
+		self.__doc__ = fn.__doc__
+		self.__dict__.update(fn.__dict__)
+		self._maxSize = maxSize
+		self._recent = {}
+		self._older = {}
+
+	def __call__(self, *args):
+		try:
+			return self._recent[args]
+		except KeyError:
+			pass
+		try:
+			result = self._older[args]
+		except KeyError:
+			result = self.fn(*args)
+		if self._maxSize <= len(self._recent):
+			self._older = self._recent
+			self._recent = {}
+		self._recent[args] = result
+		return result
+
+	def clear(self):
+		self._recent.clear()
+		self._older.clear()
+
+
 callTraceIndentationLevel = 0
 
 
@@ -682,7 +729,12 @@ def lexical_scope(*args):
 		del frame
 
 
-def normalize_number(prettynumber):
+# Numbers are normalized, prettied and validated over and over for the same
+# contacts, so the recent ones are remembered
+_NUMBER_CACHE_SIZE = 8192
+
+
+def _normalize_number(prettynumber):
 	"""
 	function to take a phone number and strip out all non-numeric
 	characters
@@ -710,16 +762,106 @@ def normalize_number(prettynumber):
 	return uglynumber
 
 
+normalize_number = BoundedMemoize(_normalize_number, _NUMBER_CACHE_SIZE)
+
+
 _VALIDATE_RE = re.compile("^\+?[0-9]{10,}$")
 
 
-def is_valid_number(number):
+def _is_valid_number(number):
 	"""
 	@returns If This number be called ( syntax validation only )
 	"""
 	return _VALIDATE_RE.match(number) is not None
 
 
+is_valid_number = BoundedMemoize(_is_valid_number, _NUMBER_CACHE_SIZE)
+
+
+def _make_pretty_with_areacode(phonenumber):
+	prettynumber = "(%s)" % (phonenumber[0:3], )
+	if 3 < len(phonenumber):
+		prettynumber += " %s" % (phonenumber[3:6], )
+		if 6 < len(phonenumber):
+			prettynumber += "-%s" % (phonenumber[6:], )
+	return prettynumber
+
+
+def _make_pretty_local(phonenumber):
+	prettynumber = "%s" % (phonenumber[0:3], )
+	if 3 < len(phonenumber):
+		prettynumber += "-%s" % (phonenumber[3:], )
+	return prettynumber
+
+
+def _make_pretty_international(phonenumber):
+	prettynumber = phonenumber
+	if phonenumber.startswith("0"):
+		prettynumber = "+%s " % (phonenumber[0:3], )
+		if 3 < len(phonenumber):
+			prettynumber += _make_pretty_with_areacode(phonenumber[3:])
+	elif phonenumber.startswith("1"):
+		prettynumber = "1 "
+		prettynumber += _make_pretty_with_areacode(phonenumber[1:])
+	return prettynumber
+
+
+def _make_pretty(phonenumber):
+	"""
+	Function to take a phone number and return the pretty version
+	pretty numbers:
+		if phonenumber begins with 0:
+			...-(...)-...-....
+		if phonenumber begins with 1: ( for gizmo callback numbers )
+			1 (...)-...-....
+		if phonenumber is 13 digits:
+			(...)-...-....
+		if phonenumber is 10 digits:
+			...-....
+	>>> _make_pretty("12")
+	'12'
+	>>> _make_pretty("1234567")
+	'123-4567'
+	>>> _make_pretty("2345678901")
+	'+1 (234) 567-8901'
+	>>> _make_pretty("12345678901")
+	'+1 (234) 567-8901'
+	>>> _make_pretty("01234567890")
+	'+012 (345) 678-90'
+	>>> _make_pretty("+01234567890")
+	'+012 (345) 678-90'
+	>>> _make_pretty("+12")
+	'+1 (2)'
+	>>> _make_pretty("+123")
+	'+1 (23)'
+	>>> _make_pretty("+1234")
+	'+1 (234)'
+	"""
+	if phonenumber is None or phonenumber == "":
+		return ""
+
+	phonenumber = normalize_number(phonenumber)
+
+	if phonenumber == "":
+		return ""
+	elif phonenumber[0] == "+":
+		prettynumber = _make_pretty_international(phonenumber[1:])
+		if not prettynumber.startswith("+"):
+			prettynumber = "+"+prettynumber
+	elif 8 < len(phonenumber) and phonenumber[0] in ("0", "1"):
+		prettynumber = _make_pretty_international(phonenumber)
+	elif 7 < len(phonenumber):
+		prettynumber = _make_pretty_with_areacode(phonenumber)
+	elif 3 < len(phonenumber):
+		prettynumber = _make_pretty_local(phonenumber)
+	else:
+		prettynumber = phonenumber
+	return prettynumber.strip()
+
+
+make_pretty = BoundedMemoize(_make_pretty, _NUMBER_CACHE_SIZE)
+
+
 def parse_version(versionText):
 	"""
 	>>> parse_version("0.5.2")
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+"""
+Statistical profiler that can be turned on in a running process
+
+Every interval a thread of its own grabs the stack of every other thread
+(the main loop, AsyncPool workers, ...) and counts how often each stack was
+seen.  The counts are written as collapsed stacks, one
+	thread;outermost frame;...;innermost frame count
+per line, which is what flamegraph.pl and friends take.
+"""
+
+from __future__ import with_statement
+
+import os
+import sys
+import time
+import thread
+import threading
+import logging
+
+
+_moduleLogger = logging.getLogger(__name__)
+
+
+class SamplingProfiler(object):
+	"""
+	>>> profiler = SamplingProfiler()
+	>>> profiler.sample()
+	>>> profiler.sampleCount
+	1
+	>>> [line for line in profiler.format().splitlines() if line.startswith("MainThread;")] != []
+	True
+	>>> profiler.reset()
+	>>> profiler.format()
+	''
+	"""
+
+	def __init__(self, interval = 0.01):
+		self._interval = interval
+		self._lock = threading.Lock()
+		self._stacks = {}
+		self._sampleCount = 0
+		self._isRunning = False
+		self._thread = None
+		self._samplerId = None
+		self._startTime = None
+		self._stopTime = None
+
+	@property
+	def isRunning(self):
+		return self._isRunning
+
+	@property
+	def sampleCount(self):
+		return self._sampleCount
+
+	@property
+	def duration(self):
+		if self._startTime is None:
+			return 0.0
+		stopTime = self._stopTime if self._stopTime is not None else time.time()
+		return stopTime - self._startTime
+
+	def start(self):
+		assert not self._isRunning
+		self.reset()
+		self._isRunning = True
+		self._startTime = time.time()
+		self._stopTime = None
+		self._thread = threading.Thread(name = type(self).__name__, target = self._run)
+		self._thread.setDaemon(True)
+		self._thread.start()
+
+	def stop(self):
+		if not self._isRunning:
+			return
+		self._isRunning = False
+		self._thread.join()
+		self._thread = None
+		self._samplerId = None
+		self._stopTime = time.time()
+
+	def reset(self):
+		with self._lock:
+			self._stacks = {}
+			self._sampleCount = 0
+
+	def sample(self):
+		"""
+		Count the current stack of every thread but the profiler's own
+		"""
+		# Thread.ident is missing before python 2.6
+		threadNames = dict(
+			(threadId, t.getName())
+			for (threadId, t) in threading._active.items()
+		)
+		stacks = []
+		for threadId, frame in sys._current_frames().iteritems():
+			if threadId == self._samplerId:
+				continue
+			stacks.append(self._collapse(threadNames.get(threadId, str(threadId)), frame))
+		with self._lock:
+			for stack in stacks:
+				self._stacks[stack] = self._stacks.get(stack, 0) + 1
+			self._sampleCount += 1
+
+	def format(self):
+		with self._lock:
+			stacks = self._stacks.items()
+		return "\n".join(
+			"%s %d" % (stack, count)
+			for (stack, count) in sorted(stacks)
+		)
+
+	def write(self, path):
+		with open(path, "w") as f:
+			f.write(self.format())
+			f.write("\n")
+
+	@staticmethod
+	def _collapse(threadName, frame):
+		frames = []
+		while frame is not None:
+			code = frame.f_code
+			frames.append("%s:%s" % (os.path.basename(code.co_filename), code.co_name))
+			frame = frame.f_back
+		frames.append(threadName)
+		frames.reverse()
+		return ";".join(frames)
+
+	def _run(self):
+		self._samplerId = thread.get_ident()
+		_moduleLogger.info("Profiling every %rs" % (self._interval, ))
+		while self._isRunning:
+			try:
+				self.sample()
+			except Exception:
+				_moduleLogger.exception("Sampling failed")
+			time.sleep(self._interval)
+		_moduleLogger.info("Profiled %d samples" % (self._sampleCount, ))